@@ -1,40 +1,226 @@
+import importlib
+import logging
+import os
+import time
+
 from flask import Flask
 from flask_cors import CORS
 from models.model import db
-from routes.seo import seo_bp
-from routes.llms import llms_bp
-from routes.analytics import analytics_bp
-from routes.settings import settings_bp
-from routes.shopify_script_api import shopify_script_bp
-import os
+from utils.analytics_buffer import analytics_buffer
+from utils.llms_cache import llms_cache
+from utils.llms_files import llms_files
+from utils.seo_jobs import seo_jobs
+from utils.seo_regen import seo_regen
+from utils.script_cache import script_cache
+from utils.settings_cache import settings_cache
+from utils.query_plans import check_query_plans_command
+from utils.analytics_retention import compact_analytics_command, backfill_analytics_rollups_command
+from utils.catalog_sync import catalog_sync, sync_catalog_command
+from utils.webhook_queue import webhook_queue, drain_webhooks_command
+from utils.script_tag_rollout import script_tag_rollout, rollout_script_tag_command
+from utils.metrics import metrics
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+# Blueprint name -> (module, attribute); only the enabled ones are imported
+BLUEPRINTS = {
+    'seo': ('routes.seo', 'seo_bp'),
+    'llms': ('routes.llms', 'llms_bp'),
+    'analytics': ('routes.analytics', 'analytics_bp'),
+    'settings': ('routes.settings', 'settings_bp'),
+    'shopify_script': ('routes.shopify_script_api', 'shopify_script_bp'),
+    'script_tag': ('routes.script_tag', 'script_tag_bp'),
+    'catalog': ('routes.catalog', 'catalog_bp'),
+}
+
+
+def _engine_options(database_uri):
+    """Connection pool settings for SQLALCHEMY_ENGINE_OPTIONS"""
+    options = {
+        # MySQL drops idle connections after wait_timeout; recycle them before that
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '280')),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+    }
+    # SQLite's default pools do not take a size
+    if not database_uri.startswith('sqlite'):
+        options['pool_size'] = int(os.getenv('DB_POOL_SIZE', '5'))
+        options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    return options
+
+
+def _enabled_blueprints(value):
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = set(value) - set(BLUEPRINTS)
+    if unknown:
+        raise ValueError(f"Unknown blueprints in ENABLED_BLUEPRINTS: {', '.join(sorted(unknown))}")
+    return list(value)
+
+
+def create_app(config=None):
+    """
+    Build the Flask app
+
+    Settings are read from the environment, then overridden by `config` (a
+    dict of Flask config keys). Besides the settings below, `config` may set
+    SQLALCHEMY_DATABASE_URI, SQLALCHEMY_ENGINE_OPTIONS (defaults to the DB_POOL_*
+    environment variables) and ENABLED_BLUEPRINTS (a list of BLUEPRINTS names or
+    a comma-separated string), so a worker tier can serve just the routes it
+    needs, e.g. ENABLED_BLUEPRINTS=llms,analytics for crawler traffic.
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+
+    # Get database configuration from environment variables
+    db_user = os.getenv('DB_USER', 'root')
+    db_password = os.getenv('DB_PASSWORD', 'CSKsiva%4066')
+    db_host = os.getenv('DB_HOST', 'localhost')
+    db_name = os.getenv('DB_NAME', 'shopify')
+
+    # DATABASE_URL (any SQLAlchemy URL, e.g. sqlite:///bench.db) takes precedence over the DB_* settings
+    app.config['SQLALCHEMY_DATABASE_URI'] = (os.getenv('DATABASE_URL')
+                                             or f'mysql+pymysql://{db_user}:{db_password}@{db_host}/{db_name}')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-in-production')
+    app.config['ENABLED_BLUEPRINTS'] = os.getenv('ENABLED_BLUEPRINTS') or list(BLUEPRINTS)
+    # The flask CLI sets FLASK_RUN_FROM_CLI before loading the app, so `flask db` always finds Migrate
+    app.config['ENABLE_MIGRATIONS'] = (os.getenv('ENABLE_MIGRATIONS', 'false').lower() == 'true'
+                                       or os.getenv('FLASK_RUN_FROM_CLI') == 'true')
+
+    # Pixel ingestion: 'buffered' batches hits in a background flusher, 'sync' commits per request
+    app.config['ANALYTICS_INGEST_MODE'] = os.getenv('ANALYTICS_INGEST_MODE', 'buffered')
+    app.config['ANALYTICS_BUFFER_SIZE'] = int(os.getenv('ANALYTICS_BUFFER_SIZE', '10000'))
+    app.config['ANALYTICS_FLUSH_BATCH'] = int(os.getenv('ANALYTICS_FLUSH_BATCH', '500'))
+    app.config['ANALYTICS_FLUSH_INTERVAL'] = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '1.0'))
+    app.config['ANALYTICS_ENQUEUE_TIMEOUT'] = float(os.getenv('ANALYTICS_ENQUEUE_TIMEOUT', '0'))
+
+    # Retention applied by `flask compact-analytics`; day rollups are kept indefinitely
+    app.config['ANALYTICS_RAW_RETENTION_DAYS'] = int(os.getenv('ANALYTICS_RAW_RETENTION_DAYS', '90'))
+    app.config['ANALYTICS_HOURLY_RETENTION_DAYS'] = int(os.getenv('ANALYTICS_HOURLY_RETENTION_DAYS', '180'))
+    app.config['ANALYTICS_COMPACTION_BATCH'] = int(os.getenv('ANALYTICS_COMPACTION_BATCH', '5000'))
+    app.config['ANALYTICS_PARTITIONS_AHEAD'] = int(os.getenv('ANALYTICS_PARTITIONS_AHEAD', '2'))
+    # Rows fetched per round trip by /analytics/export
+    app.config['ANALYTICS_EXPORT_BATCH'] = int(os.getenv('ANALYTICS_EXPORT_BATCH', '1000'))
+
+    # llms.txt response cache
+    app.config['LLMS_CACHE_SIZE'] = int(os.getenv('LLMS_CACHE_SIZE', '1024'))
+    app.config['LLMS_CACHE_TTL'] = float(os.getenv('LLMS_CACHE_TTL', '300'))
+    app.config['LLMS_CACHE_MAX_AGE'] = int(os.getenv('LLMS_CACHE_MAX_AGE', '3600'))
+    # 'cache' serves llms.txt from memory; 'sendfile', 'x-accel-redirect' and 'x-sendfile' from files on disk
+    app.config['LLMS_SERVE_MODE'] = os.getenv('LLMS_SERVE_MODE', 'cache')
+    app.config['LLMS_FILES_DIR'] = os.getenv('LLMS_FILES_DIR')
+    app.config['LLMS_ACCEL_PREFIX'] = os.getenv('LLMS_ACCEL_PREFIX', '/_llms/')
+    app.config['LLMS_FILES_KEEP'] = int(os.getenv('LLMS_FILES_KEEP', '3'))
+
+    # Batch SEO generation
+    app.config['SEO_WORKERS'] = int(os.getenv('SEO_WORKERS', '8'))
+    app.config['SEO_PER_KEY_CONCURRENCY'] = int(os.getenv('SEO_PER_KEY_CONCURRENCY', '4'))
+    app.config['SEO_MAX_JOBS'] = int(os.getenv('SEO_MAX_JOBS', '2'))
+    app.config['SEO_FLUSH_EVERY'] = int(os.getenv('SEO_FLUSH_EVERY', '50'))
+    # Jobs whose process stops refreshing heartbeat_at are resumed elsewhere (SEO_JOB_RECOVERY=false to opt out)
+    app.config['SEO_JOB_RECOVERY'] = os.getenv('SEO_JOB_RECOVERY', 'true').lower() == 'true'
+    app.config['SEO_JOB_HEARTBEAT'] = float(os.getenv('SEO_JOB_HEARTBEAT', '30'))
+    app.config['SEO_JOB_STALE_AFTER'] = float(os.getenv('SEO_JOB_STALE_AFTER', '300'))
+    app.config['SEO_JOB_MAX_ATTEMPTS'] = int(os.getenv('SEO_JOB_MAX_ATTEMPTS', '3'))
+    app.config['SEO_REGEN_DEBOUNCE'] = float(os.getenv('SEO_REGEN_DEBOUNCE', '10'))
+    # Seconds between each process's checks for regeneration requests past their debounce window
+    app.config['SEO_REGEN_POLL_INTERVAL'] = float(os.getenv('SEO_REGEN_POLL_INTERVAL', '2'))
+
+    # Product catalogs: 'mirror' reads synced shops from ProductMirror, 'shopify' always pages the REST API
+    app.config['CATALOG_SOURCE'] = os.getenv('CATALOG_SOURCE', 'mirror')
+    app.config['CATALOG_SYNC_WORKERS'] = int(os.getenv('CATALOG_SYNC_WORKERS', '2'))
+    app.config['CATALOG_SYNC_BATCH'] = int(os.getenv('CATALOG_SYNC_BATCH', '500'))
+    app.config['CATALOG_SYNC_POLL_INTERVAL'] = float(os.getenv('CATALOG_SYNC_POLL_INTERVAL', '2.0'))
+    app.config['CATALOG_SYNC_TIMEOUT'] = float(os.getenv('CATALOG_SYNC_TIMEOUT', '3600'))
+
+    # Webhook queue: 'thread' drains in every web worker, 'external' leaves it to `flask drain-webhooks`
+    app.config['WEBHOOK_DRAIN_MODE'] = os.getenv('WEBHOOK_DRAIN_MODE', 'thread')
+    app.config['WEBHOOK_BATCH'] = int(os.getenv('WEBHOOK_BATCH', '50'))
+    app.config['WEBHOOK_POLL_INTERVAL'] = float(os.getenv('WEBHOOK_POLL_INTERVAL', '2.0'))
+    app.config['WEBHOOK_MAX_ATTEMPTS'] = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', '8'))
+    app.config['WEBHOOK_RETRY_BASE'] = float(os.getenv('WEBHOOK_RETRY_BASE', '10'))
+    app.config['WEBHOOK_RETRY_MAX'] = float(os.getenv('WEBHOOK_RETRY_MAX', '3600'))
+    app.config['WEBHOOK_LEASE_SECONDS'] = int(os.getenv('WEBHOOK_LEASE_SECONDS', '300'))
+    app.config['WEBHOOK_RETENTION_DAYS'] = int(os.getenv('WEBHOOK_RETENTION_DAYS', '7'))
+
+    # Script tags: src prefixes of tags this app owns, replaced when a shop is given a new script URL
+    managed_prefixes = (os.getenv('SCRIPT_TAG_MANAGED_PREFIXES')
+                        or f"{os.getenv('APP_URL', 'https://your-app-url.com')}/static/")
+    app.config['SCRIPT_TAG_MANAGED_PREFIXES'] = [prefix.strip() for prefix in managed_prefixes.split(',')
+                                                 if prefix.strip()]
+    app.config['ROLLOUT_WORKERS'] = int(os.getenv('ROLLOUT_WORKERS', '16'))
+    app.config['ROLLOUT_FLUSH_EVERY'] = int(os.getenv('ROLLOUT_FLUSH_EVERY', '100'))
+
+    # Storefront JSON-LD script responses
+    app.config['SCRIPT_TAG_CACHE_SIZE'] = int(os.getenv('SCRIPT_TAG_CACHE_SIZE', '5000'))
+    app.config['SCRIPT_TAG_CACHE_TTL'] = float(os.getenv('SCRIPT_TAG_CACHE_TTL', '300'))
+    app.config['SCRIPT_TAG_MAX_AGE'] = int(os.getenv('SCRIPT_TAG_MAX_AGE', '86400'))
+
+    # Per-shop settings cache; SETTINGS_VERSION_POLL bounds how long other workers serve stale settings
+    app.config['SETTINGS_CACHE_TTL'] = float(os.getenv('SETTINGS_CACHE_TTL', '300'))
+    app.config['SETTINGS_VERSION_POLL'] = float(os.getenv('SETTINGS_VERSION_POLL', '1.0'))
+
+    # Outbound Gemini/Shopify calls from /seo/generate, /api/settings/inject and /install_script_tag:
+    # 'sync' blocks the worker thread on requests, 'async' awaits them on one shared httpx event loop
+    app.config['OUTBOUND_IO_MODE'] = os.getenv('OUTBOUND_IO_MODE', 'sync')
+
+    # Prometheus text-format metrics on METRICS_PATH (per worker process)
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_PATH'] = os.getenv('METRICS_PATH', '/metrics')
+
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', _engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    app.config['ENABLED_BLUEPRINTS'] = _enabled_blueprints(app.config['ENABLED_BLUEPRINTS'])
+    if app.config['OUTBOUND_IO_MODE'] == 'async':
+        # Fail at startup rather than on the first request if httpx or asgiref is missing
+        from utils.async_http import require_async_support
+        require_async_support()
+
+    # Configure CORS with appropriate restrictions
+    CORS(app, resources={r"/*": {"origins": os.getenv('ALLOWED_ORIGINS', '*')}})
+
+    db.init_app(app)
+    metrics.init_app(app)
+    if app.config['ENABLE_MIGRATIONS']:
+        # Alembic is the slowest import in the app and only the CLI needs it
+        from flask_migrate import Migrate
+        # render_as_batch lets ALTERs run on SQLite, which rebuilds the table instead
+        Migrate(app, db, directory=os.path.join(os.path.dirname(__file__), 'migrations'),
+                render_as_batch=True)
+    analytics_buffer.init_app(app)
+    catalog_sync.init_app(app)
+    llms_cache.init_app(app)
+    llms_files.init_app(app)
+    seo_jobs.init_app(app)
+    seo_regen.init_app(app)
+    script_cache.init_app(app)
+    script_tag_rollout.init_app(app)
+    settings_cache.init_app(app)
+    webhook_queue.init_app(app)
 
-# Get database configuration from environment variables
-db_user = os.getenv('DB_USER', 'root')
-db_password = os.getenv('DB_PASSWORD', 'CSKsiva%4066')
-db_host = os.getenv('DB_HOST', 'localhost')
-db_name = os.getenv('DB_NAME', 'shopify')
+    # Register Blueprints
+    for name in app.config['ENABLED_BLUEPRINTS']:
+        module, attr = BLUEPRINTS[name]
+        app.register_blueprint(getattr(importlib.import_module(module), attr))
 
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{db_user}:{db_password}@{db_host}/{db_name}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-in-production')
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(compact_analytics_command)
+    app.cli.add_command(backfill_analytics_rollups_command)
+    app.cli.add_command(sync_catalog_command)
+    app.cli.add_command(drain_webhooks_command)
+    app.cli.add_command(rollout_script_tag_command)
 
-# Configure CORS with appropriate restrictions
-CORS(app, resources={r"/*": {"origins": os.getenv('ALLOWED_ORIGINS', '*')}})
+    metrics.startup_seconds = time.perf_counter() - started
+    logger.info("App created in %.1f ms with blueprints: %s",
+                metrics.startup_seconds * 1000, ', '.join(app.config['ENABLED_BLUEPRINTS']))
+    return app
 
-db.init_app(app)
 
-# Register Blueprints
-app.register_blueprint(seo_bp)
-app.register_blueprint(llms_bp)
-app.register_blueprint(analytics_bp)
-app.register_blueprint(settings_bp)
-app.register_blueprint(shopify_script_bp)
+app = create_app()
 
 if __name__ == "__main__":
     with app.app_context():
@@ -0,0 +1,11 @@
+"""
+Offline benchmark harness.
+
+Boots app.py in a child process against SQLite (or a local MySQL given as a
+SQLAlchemy URL), replaces Shopify and Gemini with local stub servers, drives
+each endpoint with synthetic shops, catalogs and crawler traffic, and writes
+latency percentiles, throughput and peak RSS as JSON. Run from server/:
+
+    python -m bench.run --out bench-results.json
+    python -m bench.run --baseline bench-results.json
+"""
@@ -0,0 +1,349 @@
+"""
+Run the offline benchmark: start the Shopify and Gemini stubs, boot app.py
+in a child process, drive every scenario and report latency percentiles,
+throughput and peak RSS.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from bench.server import READY_LINE
+from bench.stubs import start_shopify_stub, start_gemini_stub
+from bench.workload import SCENARIOS, shop_names
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_SECRET = 'bench-secret'
+
+# Metrics compared against a baseline, and whether a larger value is better
+COMPARED_METRICS = (('rps', True), ('p50_ms', False), ('p95_ms', False), ('p99_ms', False))
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _rss_kb(pid):
+    """Resident set size of a process in kB, or None where /proc is unavailable"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler:
+    """Polls a process's RSS in the background and keeps the peak since the last reset"""
+
+    def __init__(self, pid, interval=0.02):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = None
+        self.overall_peak_kb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = _rss_kb(self.pid)
+            if rss is not None:
+                self.peak_kb = max(self.peak_kb or 0, rss)
+                self.overall_peak_kb = max(self.overall_peak_kb or 0, rss)
+            self._stop.wait(self.interval)
+
+    def reset(self):
+        self.peak_kb = _rss_kb(self.pid)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_app(args, shopify_stub, gemini_stub):
+    """Boot app.py in a child process and wait until it is seeded and listening"""
+    port = _free_port()
+    env = dict(os.environ,
+               DATABASE_URL=args.database_url,
+               SHOPIFY_API_BASE_URL=shopify_stub.base_url,
+               GEMINI_API_BASE_URL=gemini_stub.base_url,
+               SHOPIFY_API_KEY='bench-key',
+               SHOPIFY_API_SECRET=BENCH_SECRET,
+               FLASK_ENV='production',
+               SKIP_SHOPIFY_VERIFICATION='false',
+               PYTHONUNBUFFERED='1')
+    env.update(dict(item.split('=', 1) for item in args.env))
+
+    command = [sys.executable, '-m', 'bench.server', '--port', str(port),
+               '--shops', str(args.shops), '--products', str(args.products),
+               '--hits', str(args.hits), '--seo-products', str(args.seo_products),
+               '--seed', str(args.seed)]
+    if args.reset_db:
+        command.append('--reset')
+
+    process = subprocess.Popen(command, cwd=SERVER_DIR, env=env, stdout=subprocess.PIPE, text=True)
+    ready = threading.Event()
+
+    def relay_output():
+        # Forward the child's output and keep draining it so it never blocks on a full pipe
+        for line in process.stdout:
+            if line.strip() == READY_LINE:
+                ready.set()
+            else:
+                sys.stderr.write(line)
+
+    threading.Thread(target=relay_output, name='bench-server-output', daemon=True).start()
+    deadline = time.monotonic() + args.startup_timeout
+    while not ready.wait(0.2):
+        if process.poll() is not None:
+            raise RuntimeError(f"bench server exited with code {process.returncode} before it was ready")
+        if time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError("bench server did not become ready in time")
+    return process, f"http://127.0.0.1:{port}"
+
+
+def run_scenario(base_url, scenario, count, concurrency, rng, ctx):
+    """
+    Send `count` requests built by the scenario from `concurrency` threads
+
+    The request list is built up front from the seeded RNG, so every run
+    sends the same requests in the same order.
+    """
+    planned = [scenario.build(rng, ctx) for _ in range(count)]
+    latencies = [None] * count
+    statuses = [None] * count
+    next_index = [0]
+    lock = threading.Lock()
+    local = threading.local()
+
+    def worker():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        while True:
+            with lock:
+                index = next_index[0]
+                next_index[0] += 1
+            if index >= count:
+                return
+            bench_request = planned[index]
+            started = time.perf_counter()
+            try:
+                response = local.session.request(bench_request.method, base_url + bench_request.path,
+                                                 headers=bench_request.headers, data=bench_request.body,
+                                                 timeout=120)
+                response.content
+                statuses[index] = response.status_code
+            except requests.RequestException:
+                statuses[index] = 'error'
+            latencies[index] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    timings = sorted(latency * 1000 for latency in latencies)
+    status_counts = {}
+    for status in statuses:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+    errors = sum(1 for status in statuses if status == 'error' or status >= 500)
+
+    return {
+        "requests": count,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "rps": round(count / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "p99_ms": round(percentile(timings, 99), 2),
+        "max_ms": round(timings[-1], 2),
+        "errors": errors,
+        "status_counts": status_counts,
+    }
+
+
+def compare(results, baseline, threshold_pct):
+    """
+    Compare each scenario's metrics with a baseline run
+
+    Returns:
+        tuple: (report lines, list of regressions beyond threshold_pct)
+    """
+    lines = [f"{'scenario':<18}{'metric':<9}{'baseline':>12}{'current':>12}{'change':>10}"]
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            lines.append(f"{name:<18}(not in baseline)")
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = '  !' if worse > threshold_pct else ''
+            if flag:
+                regressions.append(f"{name} {metric} {change:+.1f}%")
+            lines.append(f"{name:<18}{metric:<9}{old:>12}{new:>12}{change:>+9.1f}%{flag}")
+    return lines, regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    names = [scenario.name for scenario in SCENARIOS]
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url',
+                        help='SQLAlchemy URL of the database to benchmark against '
+                             '(default: a fresh SQLite file). Its tables are dropped when --reset-db is given.')
+    parser.add_argument('--reset-db', action='store_true',
+                        help='Drop and recreate all tables first (always on for the default SQLite file)')
+    parser.add_argument('--scenarios', default=','.join(names),
+                        help=f"Comma-separated subset of: {', '.join(names)}")
+    parser.add_argument('--requests', type=int, help="Requests per scenario (default: each scenario's own)")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=50, help='Unmeasured requests before each scenario')
+    parser.add_argument('--shops', type=int, default=5)
+    parser.add_argument('--products', type=int, default=1000, help='Catalog size of every shop')
+    parser.add_argument('--hits', type=int, default=50000, help='Historical crawler hits to seed')
+    parser.add_argument('--seo-products', type=int, default=200, help='Products per shop with a stored schema')
+    parser.add_argument('--shopify-latency', type=float, default=50, help='Shopify stub latency in ms')
+    parser.add_argument('--gemini-latency', type=float, default=400, help='Gemini stub latency in ms')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='Extra environment for the app process, e.g. --env ANALYTICS_INGEST_MODE=sync')
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--out', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against a previous --out file')
+    parser.add_argument('--max-regression', type=float, default=10.0,
+                        help='Percent change in a compared metric that counts as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Exit with status 1 if any metric regressed past --max-regression')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios.split(',')) - set(names)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = args.scenarios.split(',')
+
+    tmpdir = None
+    if not args.database_url:
+        tmpdir = tempfile.mkdtemp(prefix='shopify-seo-bench-')
+        # timeout: wait for the analytics flusher's write lock instead of failing
+        args.database_url = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}?timeout=30"
+        args.reset_db = True
+
+    shopify_stub = start_shopify_stub(args.shopify_latency / 1000.0, args.products)
+    gemini_stub = start_gemini_stub(args.gemini_latency / 1000.0)
+    process, base_url = start_app(args, shopify_stub, gemini_stub)
+    sampler = RssSampler(process.pid).start()
+
+    ctx = {"shops": shop_names(args.shops), "products": args.products,
+           "seo_products": args.seo_products, "secret": BENCH_SECRET}
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": args.database_url.split('://', 1)[0],
+            "concurrency": args.concurrency,
+            "shops": args.shops,
+            "products": args.products,
+            "seeded_hits": args.hits,
+            "shopify_latency_ms": args.shopify_latency,
+            "gemini_latency_ms": args.gemini_latency,
+            "seed": args.seed,
+            "env": args.env,
+        },
+        "scenarios": {},
+    }
+
+    try:
+        for scenario in SCENARIOS:
+            if scenario.name not in selected:
+                continue
+            rng = random.Random(f"{args.seed}:{scenario.name}")
+            count = args.requests or scenario.requests
+            if args.warmup:
+                run_scenario(base_url, scenario, min(args.warmup, count), args.concurrency, rng, ctx)
+            sampler.reset()
+            result = run_scenario(base_url, scenario, count, args.concurrency, rng, ctx)
+            result["peak_rss_mb"] = round(sampler.peak_kb / 1024, 1) if sampler.peak_kb else None
+            results["scenarios"][scenario.name] = result
+            print(f"{scenario.name:<18}{result['rps']:>9} req/s  p50 {result['p50_ms']:>8} ms  "
+                  f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                  f"errors {result['errors']}  rss {result['peak_rss_mb']} MB", flush=True)
+    finally:
+        sampler.stop()
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shopify_stub.shutdown()
+        gemini_stub.shutdown()
+
+    results["peak_rss_mb"] = round(sampler.overall_peak_kb / 1024, 1) if sampler.overall_peak_kb else None
+    results["upstream_requests"] = {"shopify": shopify_stub.requests, "gemini": gemini_stub.requests}
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline, args.max_regression)
+        print("\n".join(lines))
+        if regressions:
+            print(f"Regressions beyond {args.max_regression}%: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Child process started by bench.run: imports app.py with the environment
+the runner prepared (DATABASE_URL, SHOPIFY_API_BASE_URL, GEMINI_API_BASE_URL,
+...), recreates and seeds the schema, then serves on the given port.
+"""
+import argparse
+import logging
+import sys
+
+from werkzeug.serving import make_server
+
+READY_LINE = 'BENCH SERVER READY'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--shops', type=int, default=5)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--hits', type=int, default=50000)
+    parser.add_argument('--seo-products', type=int, default=200)
+    parser.add_argument('--reset', action='store_true',
+                        help='Drop and recreate every table before seeding')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    from app import app
+    from models.model import db
+    from bench.workload import seed, shop_names
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        seed(shop_names(args.shops), args.products, args.hits, args.seo_products, seed=args.seed)
+
+    # Per-request access logs would cost more than some of the endpoints being measured
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', args.port, app, threaded=True)
+    print(READY_LINE, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
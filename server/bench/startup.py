@@ -0,0 +1,122 @@
+"""
+Measure worker cold start: import app.py (which builds the app with
+create_app) in fresh Python processes and report how long the import and
+create_app took, peak RSS, and which heavy optional modules got loaded.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from bench.run import SERVER_DIR, percentile, _git_revision
+
+# Modules a worker should only load when it actually uses them
+HEAVY_MODULES = ('shopify', 'pyactiveresource', 'flask_migrate', 'alembic', 'requests')
+
+COMPARED_METRICS = ('import_ms', 'create_app_ms')
+
+# Runs in the child; the first timestamp is taken before anything from the app is imported
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({
+    "import_ms": import_ms,
+    "create_app_ms": app.metrics.startup_seconds * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def measure_once(env):
+    output = subprocess.check_output([sys.executable, '-c', PROBE % (HEAVY_MODULES,)],
+                                     cwd=SERVER_DIR, env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    summary = {}
+    for metric in COMPARED_METRICS + ('max_rss_mb',):
+        values = sorted(sample[metric] for sample in samples)
+        summary[metric] = {"p50": round(percentile(values, 50), 1), "p95": round(percentile(values, 95), 1),
+                           "min": round(values[0], 1)}
+    summary["loaded_modules"] = samples[-1]["loaded"]
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10, help='Fresh processes to start')
+    parser.add_argument('--blueprints', help='ENABLED_BLUEPRINTS for the app (default: all)')
+    parser.add_argument('--database-url', help='DATABASE_URL for the app (default: a SQLite file; never connected to)')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='Extra environment for the app processes')
+    parser.add_argument('--out', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare median timings against a previous --out file')
+    parser.add_argument('--max-regression', type=float, default=10.0,
+                        help='Percent slower median that counts as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = dict(os.environ)
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    env['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.gettempdir(), 'startup.db')}"
+    if args.blueprints:
+        env['ENABLED_BLUEPRINTS'] = args.blueprints
+    env.update(dict(item.split('=', 1) for item in args.env))
+
+    # One unmeasured run so every later process finds compiled bytecode
+    measure_once(env)
+    samples = [measure_once(env) for _ in range(args.runs)]
+
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            "blueprints": args.blueprints or 'all',
+            "env": args.env,
+        },
+        "startup": summarize(samples),
+    }
+    startup = results["startup"]
+    print(f"import app  p50 {startup['import_ms']['p50']} ms  p95 {startup['import_ms']['p95']} ms  "
+          f"(create_app p50 {startup['create_app_ms']['p50']} ms)  rss {startup['max_rss_mb']['p50']} MB")
+    print(f"heavy modules loaded: {', '.join(startup['loaded_modules']) or 'none'}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["startup"]
+        regressions = []
+        for metric in COMPARED_METRICS:
+            old, new = baseline[metric]["p50"], startup[metric]["p50"]
+            change = (new - old) / old * 100 if old else 0.0
+            flag = '  !' if change > args.max_regression else ''
+            if flag:
+                regressions.append(f"{metric} {change:+.1f}%")
+            print(f"{metric:<15}{old:>10}{new:>10}{change:>+9.1f}%{flag}")
+        if regressions:
+            print(f"Regressions beyond {args.max_regression}%: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
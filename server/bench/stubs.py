@@ -0,0 +1,292 @@
+import itertools
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def product_description(product_id):
+    return (f"<p>Bench product {product_id} is a durable, lightweight item with a two year warranty. "
+            f"Ships in 2-3 days; free returns within 30 days.</p>")
+
+
+CATALOG_EPOCH = datetime(2026, 1, 1)
+
+
+def product_updated_at(product_id):
+    """Product N was last updated N seconds after CATALOG_EPOCH"""
+    return f"{CATALOG_EPOCH + timedelta(seconds=product_id):%Y-%m-%dT%H:%M:%SZ}"
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Shopify and Gemini keep connections alive; so do the app's pooled sessions
+    request_queue_size = 128
+
+    def __init__(self, handler, latency):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_error(self, request, client_address):
+        # Clients closing pooled keep-alive connections is expected, not worth a traceback
+        pass
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, body, status=200, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _delay(self):
+        self.server.count()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+
+class ShopifyStubHandler(_StubHandler):
+    """
+    Admin API endpoints the app calls: shop.json, products.json with cursor
+    pagination (page_info is an offset), products/count.json, script tags
+    (list, create, update, delete; kept per access token, so per shop), the
+    OAuth token exchange, and GraphQL bulk operations over products whose
+    JSONL result is served from /bulk/<id>.jsonl. Every shop has the same
+    catalog.
+    """
+
+    catalog_size = 1000
+
+    def do_GET(self):
+        self._delay()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        call_limit = {'X-Shopify-Shop-Api-Call-Limit': '1/40'}
+
+        if url.path.endswith('/shop.json'):
+            return self._send_json({"shop": {"id": 1, "name": "Bench shop"}}, headers=call_limit)
+        if url.path.endswith('/products/count.json'):
+            return self._send_json({"count": self.catalog_size}, headers=call_limit)
+        if url.path.endswith('/script_tags.json'):
+            return self._send_json({"script_tags": list(self._script_tags().values())}, headers=call_limit)
+        if url.path.endswith('/products.json'):
+            return self._products(url, query, call_limit)
+        if url.path.startswith('/bulk/'):
+            return self._bulk_result(url.path)
+        self._send_json({"errors": "Not Found"}, status=404)
+
+    def _script_tags(self):
+        """Script tags of the calling shop by id"""
+        with self.server._lock:
+            if not hasattr(self.server, 'script_tags'):
+                self.server.script_tags = {}
+                self.server.script_tag_ids = itertools.count(1)
+            return self.server.script_tags.setdefault(self.headers.get('X-Shopify-Access-Token'), {})
+
+    def _script_tag_id(self):
+        match = re.search(r'/script_tags/(\d+)\.json$', urlparse(self.path).path)
+        return int(match.group(1)) if match else None
+
+    def do_PUT(self):
+        self._delay()
+        tags = self._script_tags()
+        tag_id = self._script_tag_id()
+        if tag_id not in tags:
+            return self._send_json({"errors": "Not Found"}, status=404)
+        payload = json.loads(self._read_body() or b'{}').get('script_tag', {})
+        tags[tag_id] = dict(tags[tag_id], **payload)
+        tags[tag_id]['id'] = tag_id
+        self._send_json({"script_tag": tags[tag_id]})
+
+    def do_DELETE(self):
+        self._delay()
+        if self._script_tags().pop(self._script_tag_id(), None) is None:
+            return self._send_json({"errors": "Not Found"}, status=404)
+        self._send_json({})
+
+    def _bulk_operations(self):
+        with self.server._lock:
+            if not hasattr(self.server, 'bulk_operations'):
+                self.server.bulk_operations = {}
+            return self.server.bulk_operations
+
+    def _graphql(self, body):
+        query = body.get('query', '')
+        variables = body.get('variables') or {}
+        operations = self._bulk_operations()
+
+        if 'bulkOperationRunQuery' in query:
+            since = re.search(r"updated_at:>='([^']+)'", variables.get('query', ''))
+            operation_id = f"gid://shopify/BulkOperation/{len(operations) + 1}"
+            operations[operation_id] = {"since": since.group(1) if since else None, "polls": 0}
+            return self._send_json({"data": {"bulkOperationRunQuery": {
+                "bulkOperation": {"id": operation_id, "status": "CREATED"}, "userErrors": []}}})
+
+        operation = operations.get(variables.get('id'))
+        if operation is None:
+            return self._send_json({"data": {"node": None}})
+        # Reported as running on the first poll, so clients exercise their wait loop
+        operation["polls"] += 1
+        if operation["polls"] == 1:
+            return self._send_json({"data": {"node": {"id": variables['id'], "status": "RUNNING",
+                                                      "errorCode": None, "objectCount": "0", "url": None}}})
+        number = variables['id'].rsplit('/', 1)[-1]
+        return self._send_json({"data": {"node": {
+            "id": variables['id'], "status": "COMPLETED", "errorCode": None,
+            "objectCount": str(len(self._bulk_ids(operation))),
+            "url": f"http://{self.headers['Host']}/bulk/{number}.jsonl"}}})
+
+    def _bulk_ids(self, operation):
+        ids = range(self.catalog_size)
+        if operation["since"]:
+            ids = [i for i in ids if product_updated_at(i) >= operation["since"]]
+        return ids
+
+    def _bulk_result(self, path):
+        number = path.rsplit('/', 1)[-1].split('.')[0]
+        operation = self._bulk_operations().get(f"gid://shopify/BulkOperation/{number}")
+        if operation is None:
+            return self._send_json({"errors": "Not Found"}, status=404)
+
+        # Chunked, a thousand lines at a time, like the signed storage URL Shopify hands out
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/jsonl')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        lines = []
+        ids = self._bulk_ids(operation)
+        for index, product_id in enumerate(ids, 1):
+            lines.append(json.dumps({
+                "id": f"gid://shopify/Product/{product_id}",
+                "legacyResourceId": str(product_id),
+                "title": f"Bench product {product_id}",
+                "handle": f"bench-product-{product_id}",
+                "descriptionHtml": product_description(product_id),
+                "vendor": "Bench",
+                "productType": "Widget",
+                "tags": ["bench"],
+                "status": "ACTIVE",
+                "createdAt": CATALOG_EPOCH.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                "updatedAt": product_updated_at(product_id),
+                "publishedAt": CATALOG_EPOCH.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            }) + "\n")
+            if len(lines) == 1000 or index == len(ids):
+                data = "".join(lines).encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                lines = []
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _products(self, url, query, headers):
+        limit = int(query.get('limit', ['50'])[0])
+        offset = int(query.get('page_info', ['0'])[0])
+        fields = [f for f in query.get('fields', [''])[0].split(',') if f]
+        if 'ids' in query:
+            ids = [int(i) for i in query['ids'][0].split(',') if i]
+        else:
+            ids = range(offset, min(offset + limit, self.catalog_size))
+
+        products = []
+        for product_id in ids:
+            product = {
+                "id": product_id,
+                "title": f"Bench product {product_id}",
+                "handle": f"bench-product-{product_id}",
+                "body_html": product_description(product_id),
+                "updated_at": product_updated_at(product_id),
+            }
+            products.append({k: v for k, v in product.items() if not fields or k in fields})
+
+        if 'ids' not in query and offset + limit < self.catalog_size:
+            next_query = f"limit={limit}&page_info={offset + limit}"
+            if fields:
+                next_query += f"&fields={','.join(fields)}"
+            headers = dict(headers, Link=f'<http://{self.headers["Host"]}{url.path}?{next_query}>; rel="next"')
+        self._send_json({"products": products}, headers=headers)
+
+    def do_POST(self):
+        self._delay()
+        body = self._read_body()
+        if self.path.endswith('/graphql.json'):
+            return self._graphql(json.loads(body or b'{}'))
+        if self.path.endswith('/oauth/access_token'):
+            return self._send_json({"access_token": "bench-token", "scope": "read_products,write_script_tags"})
+        if self.path.endswith('/script_tags.json'):
+            tags = self._script_tags()
+            with self.server._lock:
+                tag_id = next(self.server.script_tag_ids)
+            tags[tag_id] = dict(json.loads(body or b'{}').get('script_tag', {}), id=tag_id)
+            return self._send_json({"script_tag": tags[tag_id]}, status=201)
+        self._send_json({"errors": "Not Found"}, status=404)
+
+
+class GeminiStubHandler(_StubHandler):
+    """generateContent returning a small FAQPage JSON-LD document, or one per product for batched prompts"""
+
+    def do_POST(self):
+        self._delay()
+        body = json.loads(self._read_body() or b'{}')
+        if not re.search(r':generateContent$', urlparse(self.path).path):
+            return self._send_json({"error": {"message": "Not Found"}}, status=404)
+
+        prompt = body.get("contents", [{}])[0].get("parts", [{}])[0].get("text", "")
+        # Batched prompts mark each product with "PRODUCT <key>:" and expect an object keyed by them
+        keys = re.findall(r'PRODUCT (\w+):', prompt)
+        if keys:
+            text = json.dumps({key: self._schema(len(prompt)) for key in keys})
+        else:
+            text = json.dumps(self._schema(len(prompt)))
+        self._send_json({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+    @staticmethod
+    def _schema(prompt_length):
+        return {
+            "@context": "https://schema.org",
+            "@type": "FAQPage",
+            "mainEntity": [{
+                "@type": "Question",
+                "name": "How long does shipping take?",
+                "acceptedAnswer": {"@type": "Answer", "text": f"2-3 days ({prompt_length} chars read)"}
+            }]
+        }
+
+
+def start_stub(handler, latency=0.0):
+    """Start a stub server on a free local port in a daemon thread"""
+    server = _StubServer(handler, latency)
+    threading.Thread(target=server.serve_forever, name=f'{handler.__name__}', daemon=True).start()
+    return server
+
+
+def start_shopify_stub(latency=0.0, catalog_size=1000):
+    handler = type('ShopifyStub', (ShopifyStubHandler,), {"catalog_size": catalog_size})
+    return start_stub(handler, latency)
+
+
+def start_gemini_stub(latency=0.0):
+    return start_stub(GeminiStubHandler, latency)
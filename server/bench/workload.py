@@ -0,0 +1,171 @@
+import base64
+import hashlib
+import hmac
+import json
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from bench.stubs import product_description
+
+BENCH_TOKEN = 'bench-token'
+BENCH_GEMINI_KEY = 'bench-gemini-key'
+
+# Crawler traffic mix: mostly LLM bots, with search bots and browsers that /track ignores
+USER_AGENTS = [
+    ("Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko); compatible; GPTBot/1.1; +https://openai.com/gptbot", 20),
+    ("Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko); compatible; ChatGPT-User/1.0; +https://openai.com/bot", 10),
+    ("Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko); compatible; OAI-SearchBot/1.0; +https://openai.com/searchbot", 5),
+    ("Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; ClaudeBot/1.0; +claudebot@anthropic.com)", 15),
+    ("Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; PerplexityBot/1.0; +https://perplexity.ai/perplexitybot)", 10),
+    ("CCBot/2.0 (https://commoncrawl.org/faq/)", 5),
+    ("Mozilla/5.0 (compatible; Bytespider; spider-feedback@bytedance.com)", 5),
+    ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)", 10),
+    ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36", 20),
+]
+
+BenchRequest = namedtuple('BenchRequest', ['method', 'path', 'headers', 'body'])
+
+# requests: default request count; build(rng, ctx) returns one BenchRequest
+Scenario = namedtuple('Scenario', ['name', 'requests', 'build'])
+
+
+def shop_names(count):
+    return [f"bench-{i}.myshopify.com" for i in range(count)]
+
+
+def _pick_user_agent(rng):
+    agents, weights = zip(*USER_AGENTS)
+    return rng.choices(agents, weights=weights)[0]
+
+
+def _sign(body, secret):
+    digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+
+def _track(rng, ctx):
+    shop = rng.choice(ctx["shops"])
+    product = rng.randrange(ctx["products"])
+    return BenchRequest('GET', f"/track?shop={shop}&path=/products/bench-product-{product}",
+                        {"User-Agent": _pick_user_agent(rng)}, None)
+
+
+def _llms_txt(rng, ctx):
+    shop = rng.choice(ctx["shops"])
+    return BenchRequest('GET', f"/llms.txt?shop={shop}", {"User-Agent": _pick_user_agent(rng)}, None)
+
+
+def _llms_generate(rng, ctx):
+    shop = rng.choice(ctx["shops"])
+    return BenchRequest('POST', "/llms/generate", {"Content-Type": "application/json"},
+                        json.dumps({"shop_url": shop, "source": "shopify"}).encode('utf-8'))
+
+
+def _analytics(rng, ctx):
+    shop = rng.choice(ctx["shops"])
+    granularity = rng.choice(['hour', 'day'])
+    return BenchRequest('GET', f"/analytics?shop={shop}&granularity={granularity}", {}, None)
+
+
+def _seo_generate(rng, ctx):
+    shop = rng.choice(ctx["shops"])
+    product = rng.randrange(ctx["products"])
+    # A random suffix keeps most requests out of the generation cache
+    description = product_description(product) + f" Variant {rng.randrange(1_000_000)}."
+    return BenchRequest('POST', "/seo/generate", {"Content-Type": "application/json"},
+                        json.dumps({"shop_url": shop, "product_id": str(product),
+                                    "description": description}).encode('utf-8'))
+
+
+def _product_webhook(rng, ctx):
+    shop = rng.choice(ctx["shops"])
+    product = rng.randrange(ctx["products"])
+    body = json.dumps({
+        "id": product,
+        "title": f"Bench product {product}",
+        "body_html": product_description(product) + f" Edit {rng.randrange(1_000_000)}.",
+    }).encode('utf-8')
+    topic = rng.choice(['create', 'update'])
+    return BenchRequest('POST', f"/webhooks/products/{topic}", {
+        "Content-Type": "application/json",
+        "X-Shopify-Shop-Domain": shop,
+        "X-Shopify-Topic": f"products/{topic}",
+        "X-Shopify-Hmac-Sha256": _sign(body, ctx["secret"]),
+    }, body)
+
+
+def _script_tag(rng, ctx):
+    shop = rng.choice(ctx["shops"])
+    product = rng.randrange(ctx["seo_products"])
+    return BenchRequest('GET', f"/script_tag/{shop}?product_id={product}",
+                        {"Accept-Encoding": "gzip, br"}, None)
+
+
+SCENARIOS = [
+    Scenario('track', 5000, _track),
+    Scenario('llms_txt', 3000, _llms_txt),
+    Scenario('analytics', 1000, _analytics),
+    Scenario('script_tag', 3000, _script_tag),
+    Scenario('seo_generate', 300, _seo_generate),
+    Scenario('product_webhook', 1000, _product_webhook),
+    Scenario('llms_generate', 20, _llms_generate),
+]
+
+
+def seed(shops, products, hits, seo_products, seed=1):
+    """
+    Fill an empty database with synthetic shops, settings, llms.txt
+    versions, historical crawler hits and SEO schemas. Must run inside an
+    app context.
+    """
+    from models.model import db, ShopifyStore, SeoSchema
+    from utils.analytics_rollup import record_hits
+    from utils.bot_classifier import classify
+    from utils.llms_builder import write_llms_streaming
+    from utils.settings_cache import settings_cache
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    db.session.add_all([ShopifyStore(shop_url=shop, access_token=BENCH_TOKEN, scope='read_products',
+                                     installed_at=now, updated_at=now, is_active=True)
+                        for shop in shops])
+    db.session.commit()
+    settings_cache.save(None, gemini_api_key=BENCH_GEMINI_KEY, auto_generate_seo=True, auto_generate_llms=False)
+
+    for shop in shops:
+        catalog = ({"title": f"Bench product {i}", "url": f"https://{shop}/products/bench-product-{i}"}
+                   for i in range(products))
+        write_llms_streaming(shop, catalog)
+
+        rows = []
+        for i in range(seo_products):
+            rows.append({"product_id": str(i), "shop_url": shop, "source_hash": None,
+                         "generated_json_ld": json.dumps({"@context": "https://schema.org", "@type": "FAQPage",
+                                                          "mainEntity": []}),
+                         "created_at": now, "updated_at": now})
+        db.session.execute(db.insert(SeoSchema), rows)
+        db.session.commit()
+
+    batch = []
+    for _ in range(hits):
+        user_agent = _pick_user_agent(rng)
+        bot = classify(user_agent)
+        if not bot.is_llm:
+            continue
+        batch.append({
+            "shop_url": rng.choice(shops),
+            "user_agent": user_agent[:255],
+            "path": f"/products/bench-product-{rng.randrange(products)}",
+            "timestamp": now - timedelta(seconds=rng.randrange(30 * 24 * 3600)),
+            "bot_family": bot.bot_family,
+            "bot_vendor": bot.vendor,
+            "is_llm": True,
+        })
+        if len(batch) >= 1000:
+            record_hits(batch)
+            db.session.commit()
+            batch = []
+    record_hits(batch)
+    db.session.commit()
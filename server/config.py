@@ -15,6 +15,17 @@ SHOPIFY_API_KEY = os.getenv("SHOPIFY_API_KEY")
 SHOPIFY_API_SECRET = os.getenv("SHOPIFY_API_SECRET")
 APP_URL = os.getenv("APP_URL", "https://your-app-url.com")
 
+# Send every Admin API call here instead of https://{shop} (local stub servers, benchmarks)
+SHOPIFY_API_BASE_URL = os.getenv("SHOPIFY_API_BASE_URL")
+
+def shop_base_url(shop):
+    """
+    Base URL for a shop's Admin API and OAuth endpoints
+    """
+    if SHOPIFY_API_BASE_URL:
+        return SHOPIFY_API_BASE_URL.rstrip('/')
+    return f"https://{shop}"
+
 # Get shop token from database
 def get_shop_token(shop_url):
     """
@@ -0,0 +1,44 @@
+"""seo regen requests
+
+Products waiting out the SEO regeneration debounce window move from each
+process's memory into a table, written in the same transaction as the
+webhook that caused them.
+
+Revision ID: 0b6e3d9a5c27
+Revises: f4a9c2e7b013
+Create Date: 2026-10-19 14:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6e3d9a5c27'
+down_revision = 'f4a9c2e7b013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('seo_regen_request',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=False),
+    sa.Column('product_id', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'), nullable=False),
+    sa.Column('source_hash', sa.String(length=64), nullable=False),
+    sa.Column('due_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('shop_url', 'product_id', name='uq_seo_regen_request_shop_product')
+    )
+    with op.batch_alter_table('seo_regen_request', schema=None) as batch_op:
+        batch_op.create_index('ix_seo_regen_request_due_at', ['due_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('seo_regen_request', schema=None) as batch_op:
+        batch_op.drop_index('ix_seo_regen_request_due_at')
+
+    op.drop_table('seo_regen_request')
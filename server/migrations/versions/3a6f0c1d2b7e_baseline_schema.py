@@ -0,0 +1,73 @@
+"""baseline schema
+
+Tables as they were created by db.create_all() before migrations were
+introduced. Databases that already have them should be stamped with this
+revision (`flask db stamp 3a6f0c1d2b7e`) before running `flask db upgrade`.
+
+Revision ID: 3a6f0c1d2b7e
+Revises:
+Create Date: 2026-10-18 09:12:41.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a6f0c1d2b7e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('shopify_store',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=False),
+    sa.Column('access_token', sa.String(length=255), nullable=True),
+    sa.Column('scope', sa.String(length=255), nullable=True),
+    sa.Column('installed_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('shop_url')
+    )
+    op.create_table('seo_schema',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.String(length=100), nullable=True),
+    sa.Column('generated_json_ld', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('llms_schema',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=True),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('analytics_schema',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=True),
+    sa.Column('user_agent', sa.String(length=255), nullable=True),
+    sa.Column('path', sa.String(length=255), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('app_settings',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('gemini_api_key', sa.String(length=255), nullable=True),
+    sa.Column('auto_generate_seo', sa.Boolean(), nullable=True),
+    sa.Column('auto_generate_llms', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('app_settings')
+    op.drop_table('analytics_schema')
+    op.drop_table('llms_schema')
+    op.drop_table('seo_schema')
+    op.drop_table('shopify_store')
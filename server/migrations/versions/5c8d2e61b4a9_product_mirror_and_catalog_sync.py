@@ -0,0 +1,78 @@
+"""product mirror and catalog sync
+
+Local copy of each shop's catalog, filled from Shopify bulk operations, and
+the record of each sync run.
+
+Revision ID: 5c8d2e61b4a9
+Revises: a9e1f4c27d58
+Create Date: 2026-10-18 17:40:22.513870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8d2e61b4a9'
+down_revision = 'a9e1f4c27d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_mirror',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=False),
+    sa.Column('shop_id', sa.Integer(), nullable=True),
+    sa.Column('product_id', sa.String(length=100), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=True),
+    sa.Column('handle', sa.String(length=255), nullable=True),
+    sa.Column('description', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'), nullable=True),
+    sa.Column('vendor', sa.String(length=255), nullable=True),
+    sa.Column('product_type', sa.String(length=255), nullable=True),
+    sa.Column('tags', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('published_at', sa.DateTime(), nullable=True),
+    sa.Column('synced_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['shop_id'], ['shopify_store.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('shop_url', 'product_id', name='uq_product_mirror_shop_product')
+    )
+    with op.batch_alter_table('product_mirror', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_product_mirror_shop_id'), ['shop_id'], unique=False)
+        batch_op.create_index('ix_product_mirror_shop_updated', ['shop_url', 'updated_at'], unique=False)
+        batch_op.create_index('ix_product_mirror_shop_synced', ['shop_url', 'synced_at'], unique=False)
+
+    op.create_table('catalog_sync',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=False),
+    sa.Column('mode', sa.String(length=16), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('bulk_operation_id', sa.String(length=255), nullable=True),
+    sa.Column('updated_since', sa.DateTime(), nullable=True),
+    sa.Column('upserted', sa.Integer(), nullable=False),
+    sa.Column('deleted', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('catalog_sync', schema=None) as batch_op:
+        batch_op.create_index('ix_catalog_sync_shop_status', ['shop_url', 'status', 'finished_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('catalog_sync', schema=None) as batch_op:
+        batch_op.drop_index('ix_catalog_sync_shop_status')
+
+    op.drop_table('catalog_sync')
+    with op.batch_alter_table('product_mirror', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_mirror_shop_synced')
+        batch_op.drop_index('ix_product_mirror_shop_updated')
+        batch_op.drop_index(batch_op.f('ix_product_mirror_shop_id'))
+
+    op.drop_table('product_mirror')
@@ -0,0 +1,37 @@
+"""app settings version counter
+
+Settings writes took MAX(app_settings.version) + 1, so two concurrent
+writes could stamp the same version. The version now lives in a single-row
+counter incremented in place, seeded with the current maximum.
+
+Revision ID: 6e2b8f4d1a90
+Revises: 0b6e3d9a5c27
+Create Date: 2026-10-19 16:45:21.093318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e2b8f4d1a90'
+down_revision = '0b6e3d9a5c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('app_settings_version',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    settings = sa.table('app_settings', sa.column('version', sa.BigInteger))
+    counter = sa.table('app_settings_version', sa.column('id', sa.Integer), sa.column('version', sa.BigInteger))
+    current = op.get_bind().execute(sa.select(sa.func.max(settings.c.version))).scalar() or 0
+    op.get_bind().execute(counter.insert().values(id=1, version=current))
+
+
+def downgrade():
+    op.drop_table('app_settings_version')
@@ -0,0 +1,124 @@
+"""rollups, chunked llms.txt, seo jobs and generation cache
+
+Columns and tables added alongside analytics rollups, streamed llms.txt
+generation, batch SEO jobs and the Gemini response cache.
+
+Revision ID: 8d24e5b90f13
+Revises: 3a6f0c1d2b7e
+Create Date: 2026-10-18 09:14:05.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = '8d24e5b90f13'
+down_revision = '3a6f0c1d2b7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('analytics_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=False),
+    sa.Column('granularity', sa.String(length=8), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('bot_family', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(length=255), nullable=False),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('shop_url', 'granularity', 'bucket_start', 'bot_family', 'path', name='uq_analytics_rollup_bucket')
+    )
+    with op.batch_alter_table('analytics_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_analytics_rollup_shop_bucket', ['shop_url', 'granularity', 'bucket_start', 'id'], unique=False)
+
+    op.create_table('seo_job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('succeeded', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('skipped', sa.Integer(), nullable=False),
+    sa.Column('errors', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('gemini_cache',
+    sa.Column('key_hash', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(length=64), nullable=False),
+    sa.Column('prompt_version', sa.String(length=32), nullable=False),
+    sa.Column('response', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(), nullable=False),
+    sa.Column('hit_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('key_hash')
+    )
+    with op.batch_alter_table('gemini_cache', schema=None) as batch_op:
+        batch_op.create_index('ix_gemini_cache_last_used', ['last_used_at'], unique=False)
+        batch_op.create_index('ix_gemini_cache_prompt_version', ['prompt_version'], unique=False)
+
+    op.create_table('llms_chunk',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('llms_id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('content', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'), nullable=False),
+    sa.ForeignKeyConstraint(['llms_id'], ['llms_schema.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('llms_id', 'seq', name='uq_llms_chunk_seq')
+    )
+
+    with op.batch_alter_table('analytics_schema', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('bot_family', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('bot_vendor', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('is_llm', sa.Boolean(), nullable=True))
+
+    with op.batch_alter_table('llms_schema', schema=None) as batch_op:
+        batch_op.alter_column('content',
+               existing_type=sa.Text(),
+               type_=sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'),
+               existing_nullable=True)
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('size_bytes', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('product_count', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('seo_schema', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('shop_url', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('source_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('seo_schema', schema=None) as batch_op:
+        batch_op.drop_column('source_hash')
+        batch_op.drop_column('shop_url')
+
+    with op.batch_alter_table('llms_schema', schema=None) as batch_op:
+        batch_op.drop_column('product_count')
+        batch_op.drop_column('size_bytes')
+        batch_op.drop_column('content_hash')
+        batch_op.alter_column('content',
+               existing_type=sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'),
+               type_=sa.Text(),
+               existing_nullable=True)
+
+    with op.batch_alter_table('analytics_schema', schema=None) as batch_op:
+        batch_op.drop_column('is_llm')
+        batch_op.drop_column('bot_vendor')
+        batch_op.drop_column('bot_family')
+
+    op.drop_table('llms_chunk')
+    with op.batch_alter_table('gemini_cache', schema=None) as batch_op:
+        batch_op.drop_index('ix_gemini_cache_prompt_version')
+        batch_op.drop_index('ix_gemini_cache_last_used')
+
+    op.drop_table('gemini_cache')
+    op.drop_table('seo_job')
+    with op.batch_alter_table('analytics_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_analytics_rollup_shop_bucket')
+
+    op.drop_table('analytics_rollup')
@@ -0,0 +1,101 @@
+"""analytics partitions and retention
+
+Prepares analytics_schema for compaction (utils/analytics_retention.py):
+a rolled_up flag, set for hits already counted in analytics_rollup (those
+written with a bot_family since rollups were added), an index to find
+expired rows by it, and a NOT NULL timestamp. Rows without a timestamp are
+moved to the epoch so the first compaction folds and drops them.
+
+On MySQL the table is then range-partitioned by month on timestamp so that
+expired months can be dropped whole. MySQL requires the partitioning column
+in the primary key and does not allow foreign keys on partitioned tables, so
+the primary key becomes (id, timestamp) and fk_analytics_schema_shop_id is
+dropped on every dialect (the shop_id index stays).
+
+Revision ID: a9e1f4c27d58
+Revises: e7a94d0c3b61
+Create Date: 2026-10-18 15:12:40.118305
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e1f4c27d58'
+down_revision = 'e7a94d0c3b61'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Months after the current one that get a partition up front; compaction adds more later
+PARTITIONS_AHEAD = 2
+
+
+def _next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _partition_clauses(today):
+    """One partition for all history before this month, then one per month, then pmax"""
+    this_month = today.replace(day=1)
+    previous_month = date(this_month.year - (this_month.month == 1), (this_month.month - 2) % 12 + 1, 1)
+    clauses = [f"PARTITION p{previous_month:%Y%m} VALUES LESS THAN (TO_DAYS('{this_month:%Y-%m-%d}'))"]
+    month = this_month
+    for _ in range(PARTITIONS_AHEAD + 1):
+        clauses.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_next_month(month):%Y-%m-%d}'))")
+        month = _next_month(month)
+    clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return clauses
+
+
+def upgrade():
+    conn = op.get_bind()
+    hits = sa.table('analytics_schema',
+                    sa.column('id', sa.Integer),
+                    sa.column('timestamp', sa.DateTime),
+                    sa.column('bot_family', sa.String),
+                    sa.column('rolled_up', sa.Boolean))
+
+    conn.execute(hits.update().where(hits.c.timestamp.is_(None)).values(timestamp=datetime(1970, 1, 1)))
+
+    with op.batch_alter_table('analytics_schema', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rolled_up', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+        batch_op.drop_constraint('fk_analytics_schema_shop_id', type_='foreignkey')
+        batch_op.create_index('ix_analytics_schema_rolled_up_timestamp', ['rolled_up', 'timestamp'], unique=False)
+
+    max_id = conn.execute(sa.select(sa.func.max(hits.c.id))).scalar()
+    for low in range(0, (max_id or 0) + 1, BACKFILL_BATCH_SIZE):
+        conn.execute(
+            hits.update()
+            .where(hits.c.id >= low, hits.c.id < low + BACKFILL_BATCH_SIZE, hits.c.bot_family.isnot(None))
+            .values(rolled_up=True)
+        )
+
+    with op.batch_alter_table('analytics_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_analytics_rollup_granularity_bucket', ['granularity', 'bucket_start'], unique=False)
+
+    if conn.dialect.name == 'mysql':
+        op.execute("ALTER TABLE analytics_schema DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)")
+        op.execute("ALTER TABLE analytics_schema PARTITION BY RANGE (TO_DAYS(timestamp)) ("
+                   + ", ".join(_partition_clauses(date.today())) + ")")
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'mysql':
+        op.execute("ALTER TABLE analytics_schema REMOVE PARTITIONING")
+        op.execute("ALTER TABLE analytics_schema DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+
+    with op.batch_alter_table('analytics_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_analytics_rollup_granularity_bucket')
+
+    with op.batch_alter_table('analytics_schema', schema=None) as batch_op:
+        batch_op.drop_index('ix_analytics_schema_rolled_up_timestamp')
+        batch_op.create_foreign_key('fk_analytics_schema_shop_id', 'shopify_store', ['shop_id'], ['id'])
+        batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
+        batch_op.drop_column('rolled_up')
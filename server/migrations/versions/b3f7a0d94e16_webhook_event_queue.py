@@ -0,0 +1,47 @@
+"""webhook event queue
+
+Durable queue of received Shopify webhooks, drained in the background.
+
+Revision ID: b3f7a0d94e16
+Revises: 5c8d2e61b4a9
+Create Date: 2026-10-18 19:05:48.271904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f7a0d94e16'
+down_revision = '5c8d2e61b4a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('webhook_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('webhook_id', sa.String(length=64), nullable=False),
+    sa.Column('topic', sa.String(length=64), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=True),
+    sa.Column('payload', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('received_at', sa.DateTime(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('webhook_id')
+    )
+    with op.batch_alter_table('webhook_event', schema=None) as batch_op:
+        batch_op.create_index('ix_webhook_event_status_next_attempt', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('webhook_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_webhook_event_status_next_attempt')
+
+    op.drop_table('webhook_event')
@@ -0,0 +1,106 @@
+"""shop foreign keys and lookup indexes
+
+Adds nullable shop_id foreign keys to seo_schema, llms_schema and
+analytics_schema, the composite indexes behind each endpoint's lookup, and
+backfills shop_id from shop_url in id-range batches so no single UPDATE
+touches (or locks) more than BACKFILL_BATCH_SIZE rows.
+
+Revision ID: c51b7a3e8f02
+Revises: 8d24e5b90f13
+Create Date: 2026-10-18 09:31:27.440871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c51b7a3e8f02'
+down_revision = '8d24e5b90f13'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+SHOP_TABLES = ('seo_schema', 'llms_schema', 'analytics_schema')
+
+
+def _shop_ids(conn):
+    """Map every stored form of a shop URL (bare domain or https://) to its store id"""
+    stores = sa.table('shopify_store', sa.column('id', sa.Integer), sa.column('shop_url', sa.String))
+    shop_ids = {}
+    for store_id, shop_url in conn.execute(sa.select(stores.c.id, stores.c.shop_url)):
+        domain = shop_url.replace('https://', '').replace('http://', '').strip().rstrip('/').lower()
+        shop_ids[domain] = store_id
+    return shop_ids
+
+
+def _backfill_shop_id(conn, table_name, shop_ids):
+    table = sa.table(table_name,
+                     sa.column('id', sa.Integer),
+                     sa.column('shop_url', sa.String),
+                     sa.column('shop_id', sa.Integer))
+    max_id = conn.execute(sa.select(sa.func.max(table.c.id))).scalar()
+    if max_id is None or not shop_ids:
+        return
+
+    for low in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+        high = low + BACKFILL_BATCH_SIZE
+        in_batch = sa.and_(table.c.id >= low, table.c.id < high)
+        urls = conn.execute(
+            sa.select(table.c.shop_url).where(in_batch, table.c.shop_url.isnot(None)).distinct()
+        ).scalars().all()
+
+        params = []
+        for shop_url in urls:
+            domain = shop_url.replace('https://', '').replace('http://', '').strip().rstrip('/').lower()
+            if domain in shop_ids:
+                params.append({"b_url": shop_url, "b_shop_id": shop_ids[domain]})
+        if params:
+            conn.execute(
+                table.update()
+                .where(in_batch, table.c.shop_url == sa.bindparam('b_url'), table.c.shop_id.is_(None))
+                .values(shop_id=sa.bindparam('b_shop_id')),
+                params
+            )
+
+
+def upgrade():
+    for table_name in SHOP_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('shop_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(f'fk_{table_name}_shop_id', 'shopify_store', ['shop_id'], ['id'])
+            batch_op.create_index(f'ix_{table_name}_shop_id', ['shop_id'], unique=False)
+
+    with op.batch_alter_table('seo_schema', schema=None) as batch_op:
+        batch_op.create_index('ix_seo_schema_shop_product_updated', ['shop_url', 'product_id', 'updated_at'], unique=False)
+        batch_op.create_index('ix_seo_schema_product_id', ['product_id'], unique=False)
+
+    with op.batch_alter_table('llms_schema', schema=None) as batch_op:
+        batch_op.create_index('ix_llms_schema_shop_updated', ['shop_url', 'updated_at'], unique=False)
+
+    with op.batch_alter_table('analytics_schema', schema=None) as batch_op:
+        batch_op.create_index('ix_analytics_schema_shop_timestamp', ['shop_url', 'timestamp'], unique=False)
+
+    conn = op.get_bind()
+    shop_ids = _shop_ids(conn)
+    for table_name in SHOP_TABLES:
+        _backfill_shop_id(conn, table_name, shop_ids)
+
+
+def downgrade():
+    with op.batch_alter_table('analytics_schema', schema=None) as batch_op:
+        batch_op.drop_index('ix_analytics_schema_shop_timestamp')
+
+    with op.batch_alter_table('llms_schema', schema=None) as batch_op:
+        batch_op.drop_index('ix_llms_schema_shop_updated')
+
+    with op.batch_alter_table('seo_schema', schema=None) as batch_op:
+        batch_op.drop_index('ix_seo_schema_product_id')
+        batch_op.drop_index('ix_seo_schema_shop_product_updated')
+
+    for table_name in reversed(SHOP_TABLES):
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table_name}_shop_id')
+            batch_op.drop_constraint(f'fk_{table_name}_shop_id', type_='foreignkey')
+            batch_op.drop_column('shop_id')
@@ -0,0 +1,61 @@
+"""script tag rollouts
+
+Fleet-wide script tag rollouts and their per-shop results.
+
+Revision ID: d82c4f6a1e35
+Revises: b3f7a0d94e16
+Create Date: 2026-10-18 20:31:07.640218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd82c4f6a1e35'
+down_revision = 'b3f7a0d94e16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('script_tag_rollout',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('script_url', sa.String(length=1024), nullable=False),
+    sa.Column('managed_prefixes', sa.Text(), nullable=True),
+    sa.Column('dry_run', sa.Boolean(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('created', sa.Integer(), nullable=False),
+    sa.Column('updated', sa.Integer(), nullable=False),
+    sa.Column('unchanged', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('deleted', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('script_tag_rollout_shop',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rollout_id', sa.String(length=32), nullable=False),
+    sa.Column('shop_url', sa.String(length=255), nullable=False),
+    sa.Column('action', sa.String(length=16), nullable=False),
+    sa.Column('deleted', sa.Integer(), nullable=False),
+    sa.Column('script_tag_id', sa.String(length=32), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['rollout_id'], ['script_tag_rollout.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('script_tag_rollout_shop', schema=None) as batch_op:
+        batch_op.create_index('ix_script_tag_rollout_shop_rollout_action', ['rollout_id', 'action'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('script_tag_rollout_shop', schema=None) as batch_op:
+        batch_op.drop_index('ix_script_tag_rollout_shop_rollout_action')
+
+    op.drop_table('script_tag_rollout_shop')
+    op.drop_table('script_tag_rollout')
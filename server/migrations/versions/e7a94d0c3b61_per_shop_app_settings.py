@@ -0,0 +1,41 @@
+"""per-shop app settings
+
+Scopes app_settings rows to a ShopifyStore. The existing row keeps
+shop_id NULL and becomes the default for shops without their own row.
+
+Revision ID: e7a94d0c3b61
+Revises: c51b7a3e8f02
+Create Date: 2026-10-18 11:02:13.774590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a94d0c3b61'
+down_revision = 'c51b7a3e8f02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('app_settings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('shop_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('version', sa.BigInteger(), server_default='0', nullable=False))
+        batch_op.create_unique_constraint('uq_app_settings_shop_id', ['shop_id'])
+        batch_op.create_foreign_key('fk_app_settings_shop_id', 'shopify_store', ['shop_id'], ['id'])
+        batch_op.create_index('ix_app_settings_version', ['version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('app_settings', schema=None) as batch_op:
+        batch_op.drop_index('ix_app_settings_version')
+        batch_op.drop_constraint('fk_app_settings_shop_id', type_='foreignkey')
+        batch_op.drop_constraint('uq_app_settings_shop_id', type_='unique')
+        batch_op.drop_column('version')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('shop_id')
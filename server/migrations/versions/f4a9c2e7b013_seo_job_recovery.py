@@ -0,0 +1,52 @@
+"""seo job recovery
+
+Stores what each SEO job was asked to process, its attempt count and a
+heartbeat, so jobs whose process died can be found and resumed elsewhere.
+Jobs still queued or running from before have no stored parameters to
+resume from, and their processes are gone by the time this runs, so they
+are marked failed.
+
+Revision ID: f4a9c2e7b013
+Revises: d82c4f6a1e35
+Create Date: 2026-10-19 09:14:52.306417
+
+"""
+from datetime import datetime
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a9c2e7b013'
+down_revision = 'd82c4f6a1e35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('seo_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('params', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'), nullable=True))
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_seo_job_status_heartbeat', ['status', 'heartbeat_at'], unique=False)
+
+    jobs = sa.table('seo_job',
+                    sa.column('status', sa.String),
+                    sa.column('errors', sa.Text),
+                    sa.column('finished_at', sa.DateTime))
+    op.get_bind().execute(
+        jobs.update().where(jobs.c.status.in_(('queued', 'running')))
+        .values(status='failed', finished_at=datetime.utcnow(),
+                errors=json.dumps([{"product_id": None, "error": "Interrupted by an application restart"}]))
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('seo_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_seo_job_status_heartbeat')
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('attempts')
+        batch_op.drop_column('params')
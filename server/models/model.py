@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.mysql import LONGTEXT
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -13,52 +14,296 @@ class ShopifyStore(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
-    # Relationships will be added back after database migration
-    # seo_schemas = db.relationship('SeoSchema', backref='store', lazy=True)
-    # llms_schemas = db.relationship('LlmsSchema', backref='store', lazy=True)
-    # analytics = db.relationship('AnalyticsSchema', backref='store', lazy=True)
+    seo_schemas = db.relationship('SeoSchema', backref='store', lazy=True)
+    llms_schemas = db.relationship('LlmsSchema', backref='store', lazy=True)
+    # Partitioned tables cannot carry foreign keys on MySQL, so this join is declared explicitly
+    analytics = db.relationship('AnalyticsSchema', backref='store', lazy=True,
+                                primaryjoin='ShopifyStore.id == foreign(AnalyticsSchema.shop_id)')
 
 class SeoSchema(db.Model):
+    __table_args__ = (
+        # Latest schema for a product (script tag, webhook regeneration)
+        db.Index('ix_seo_schema_shop_product_updated', 'shop_url', 'product_id', 'updated_at'),
+        db.Index('ix_seo_schema_product_id', 'product_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    # Keep the original fields without the foreign key for now
     product_id = db.Column(db.String(100))
+    shop_url = db.Column(db.String(255))
+    # Nullable: rows generated without a shop_url, or before the shop installed, have no store
+    shop_id = db.Column(db.Integer, db.ForeignKey('shopify_store.id'), index=True)
     generated_json_ld = db.Column(db.Text)
+    # Hash of the normalized description this schema was generated from
+    source_hash = db.Column(db.String(64))
     created_at = db.Column(db.DateTime)
     updated_at = db.Column(db.DateTime)
-    
-    # This field will be added in a future migration
-    # shop_id = db.Column(db.Integer, db.ForeignKey('shopify_store.id'), nullable=False)
+
+class SeoJob(db.Model):
+    """Progress of a batch SEO generation job"""
+    __table_args__ = (
+        # Recovery: queued or running jobs whose process stopped sending heartbeats
+        db.Index('ix_seo_job_status_heartbeat', 'status', 'heartbeat_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    shop_url = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, completed, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    succeeded = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text)  # JSON list of the first failures
+    # JSON {"product_ids": [...]} or {"products": [...]}, NULL for the whole catalog; lets another process resume the job
+    params = db.Column(db.Text().with_variant(LONGTEXT, 'mysql'))
+    # Times the job was started; an interrupted job is resumed until SEO_JOB_MAX_ATTEMPTS
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Refreshed by the process running (or holding) the job
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class SeoRegenRequest(db.Model):
+    """
+    A product whose schema needs regenerating, waiting out the debounce
+    window (utils/seo_regen.py). Written in the webhook handler's
+    transaction, so the work survives the process that received it.
+    """
+    __table_args__ = (
+        # Repeated changes to a product update its one row
+        db.UniqueConstraint('shop_url', 'product_id', name='uq_seo_regen_request_shop_product'),
+        # Dispatchers: rows whose debounce window has passed
+        db.Index('ix_seo_regen_request_due_at', 'due_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    shop_url = db.Column(db.String(255), nullable=False)
+    product_id = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text().with_variant(LONGTEXT, 'mysql'), nullable=False)
+    source_hash = db.Column(db.String(64), nullable=False)
+    # Pushed back by every new change; the row is handed to the job runner after it
+    due_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ProductMirror(db.Model):
+    """
+    Local copy of a shop's catalog, filled by bulk operation syncs
+    (utils/catalog_sync.py). created_at, updated_at and published_at are
+    Shopify's values; synced_at is when the row was last written here.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('shop_url', 'product_id', name='uq_product_mirror_shop_product'),
+        # Incremental syncs start from the newest updated_at already mirrored
+        db.Index('ix_product_mirror_shop_updated', 'shop_url', 'updated_at'),
+        # Full syncs delete the rows they did not see
+        db.Index('ix_product_mirror_shop_synced', 'shop_url', 'synced_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    shop_url = db.Column(db.String(255), nullable=False)
+    shop_id = db.Column(db.Integer, db.ForeignKey('shopify_store.id'), index=True)
+    product_id = db.Column(db.String(100), nullable=False)
+    title = db.Column(db.String(255))
+    handle = db.Column(db.String(255))
+    description = db.Column(db.Text().with_variant(LONGTEXT, 'mysql'))
+    vendor = db.Column(db.String(255))
+    product_type = db.Column(db.String(255))
+    tags = db.Column(db.Text)
+    status = db.Column(db.String(16))
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    published_at = db.Column(db.DateTime)
+    synced_at = db.Column(db.DateTime, nullable=False)
+
+class CatalogSync(db.Model):
+    """One bulk operation sync of a shop's catalog into ProductMirror"""
+    __table_args__ = (
+        # Latest sync for a shop, and whether one is already running
+        db.Index('ix_catalog_sync_shop_status', 'shop_url', 'status', 'finished_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    shop_url = db.Column(db.String(255), nullable=False)
+    mode = db.Column(db.String(16), nullable=False)  # full, incremental
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, completed, failed
+    bulk_operation_id = db.Column(db.String(255))
+    # Incremental syncs only fetch products updated at or after this time
+    updated_since = db.Column(db.DateTime)
+    upserted = db.Column(db.Integer, nullable=False, default=0)
+    deleted = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class WebhookEvent(db.Model):
+    """A received Shopify webhook, waiting for or done with processing (utils/webhook_queue.py)"""
+    __table_args__ = (
+        # Drainers: due pending events, and processing events whose lease ran out
+        db.Index('ix_webhook_event_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # X-Shopify-Webhook-Id; Shopify sends the same id when it retries a delivery
+    webhook_id = db.Column(db.String(64), unique=True, nullable=False)
+    topic = db.Column(db.String(64), nullable=False)
+    shop_url = db.Column(db.String(255))
+    payload = db.Column(db.Text().with_variant(LONGTEXT, 'mysql'), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, processing, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Set while a drainer holds the event; an expired lease means the drainer died
+    locked_until = db.Column(db.DateTime)
+    processed_at = db.Column(db.DateTime)
+
+class ScriptTagRollout(db.Model):
+    """A fleet-wide script tag change (utils/script_tag_rollout.py)"""
+    id = db.Column(db.String(32), primary_key=True)
+    script_url = db.Column(db.String(1024), nullable=False)
+    # JSON list of src prefixes whose tags are replaced by script_url
+    managed_prefixes = db.Column(db.Text)
+    dry_run = db.Column(db.Boolean, nullable=False, default=False)
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, completed, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    created = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.Integer, nullable=False, default=0)
+    unchanged = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    # Duplicate and superseded tags removed
+    deleted = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class ScriptTagRolloutShop(db.Model):
+    """What a rollout did to one shop"""
+    __table_args__ = (
+        # Per-shop results of a rollout, optionally filtered by action
+        db.Index('ix_script_tag_rollout_shop_rollout_action', 'rollout_id', 'action'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    rollout_id = db.Column(db.String(32), db.ForeignKey('script_tag_rollout.id'), nullable=False)
+    shop_url = db.Column(db.String(255), nullable=False)
+    action = db.Column(db.String(16), nullable=False)  # created, updated, unchanged, failed
+    deleted = db.Column(db.Integer, nullable=False, default=0)
+    script_tag_id = db.Column(db.String(32))
+    error = db.Column(db.Text)
+    finished_at = db.Column(db.DateTime)
 
 class LlmsSchema(db.Model):
+    __table_args__ = (
+        # serve_llms: latest completed version for a shop
+        db.Index('ix_llms_schema_shop_updated', 'shop_url', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    shop_url = db.Column(db.String(255))  # Keep the original field
-    content = db.Column(db.Text)
+    shop_url = db.Column(db.String(255))
+    shop_id = db.Column(db.Integer, db.ForeignKey('shopify_store.id'), index=True)
+    # NULL when the document was generated server-side and lives in LlmsChunk rows
+    content = db.Column(db.Text().with_variant(LONGTEXT, 'mysql'))
     created_at = db.Column(db.DateTime)
+    # Only set once the version is completely written
     updated_at = db.Column(db.DateTime)
-    
-    # This field will be added in a future migration
-    # shop_id = db.Column(db.Integer, db.ForeignKey('shopify_store.id'), nullable=False)
+    content_hash = db.Column(db.String(64))
+    size_bytes = db.Column(db.BigInteger)
+    product_count = db.Column(db.Integer)
+
+class LlmsChunk(db.Model):
+    """Ordered pieces of a server-generated llms.txt document"""
+    __table_args__ = (
+        db.UniqueConstraint('llms_id', 'seq', name='uq_llms_chunk_seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    llms_id = db.Column(db.Integer, db.ForeignKey('llms_schema.id', ondelete='CASCADE'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text().with_variant(LONGTEXT, 'mysql'), nullable=False)
 
 class AnalyticsSchema(db.Model):
+    """
+    Raw crawler hits, kept for ANALYTICS_RAW_RETENTION_DAYS; older hits live
+    on only in AnalyticsRollup. On MySQL the table is range-partitioned by
+    month on timestamp (see utils/analytics_retention.py).
+    """
+    __table_args__ = (
+        db.Index('ix_analytics_schema_shop_timestamp', 'shop_url', 'timestamp'),
+        # Compaction: expired hits not yet folded into rollups, then expired hits to delete
+        db.Index('ix_analytics_schema_rolled_up_timestamp', 'rolled_up', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    shop_url = db.Column(db.String(255))  # Keep the original field
+    shop_url = db.Column(db.String(255))
+    shop_id = db.Column(db.Integer, index=True)
     user_agent = db.Column(db.String(255))
     path = db.Column(db.String(255))
-    timestamp = db.Column(db.DateTime)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    bot_family = db.Column(db.String(64))
+    bot_vendor = db.Column(db.String(64))
+    is_llm = db.Column(db.Boolean, default=False)
+    # Set once the hit is counted in AnalyticsRollup (at ingest, or by compaction for older rows)
+    rolled_up = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     
-    # These fields will be added in a future migration
-    # shop_id = db.Column(db.Integer, db.ForeignKey('shopify_store.id'), nullable=False)
+    # This field will be added in a future migration
     # ip_address = db.Column(db.String(45))
 
+class AnalyticsRollup(db.Model):
+    """Hit counts per shop, bot family and path, bucketed by hour or day"""
+    __table_args__ = (
+        db.UniqueConstraint('shop_url', 'granularity', 'bucket_start', 'bot_family', 'path',
+                            name='uq_analytics_rollup_bucket'),
+        db.Index('ix_analytics_rollup_shop_bucket', 'shop_url', 'granularity', 'bucket_start', 'id'),
+        # Pruning hourly buckets past ANALYTICS_HOURLY_RETENTION_DAYS
+        db.Index('ix_analytics_rollup_granularity_bucket', 'granularity', 'bucket_start'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    shop_url = db.Column(db.String(255), nullable=False)
+    granularity = db.Column(db.String(8), nullable=False)  # 'hour' or 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    bot_family = db.Column(db.String(64), nullable=False, default='')
+    path = db.Column(db.String(255), nullable=False, default='')
+    hits = db.Column(db.Integer, nullable=False, default=0)
+
+class GeminiCache(db.Model):
+    """Gemini responses keyed by a hash of the normalized input, model and prompt version"""
+    __table_args__ = (
+        db.Index('ix_gemini_cache_last_used', 'last_used_at'),
+        db.Index('ix_gemini_cache_prompt_version', 'prompt_version'),
+    )
+
+    key_hash = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(64), nullable=False)
+    prompt_version = db.Column(db.String(32), nullable=False)
+    response = db.Column(db.Text().with_variant(LONGTEXT, 'mysql'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+
 class AppSettings(db.Model):
+    """Settings for one shop; the row with no shop_id holds the defaults for every other shop"""
+    __table_args__ = (
+        db.UniqueConstraint('shop_id', name='uq_app_settings_shop_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    # Keep the original fields without the foreign key for now
     gemini_api_key = db.Column(db.String(255))
     auto_generate_seo = db.Column(db.Boolean, default=False)
     auto_generate_llms = db.Column(db.Boolean, default=False)
-    
-    # These fields will be added in a future migration
-    # shop_id = db.Column(db.Integer, db.ForeignKey('shopify_store.id'), nullable=True)
-    # created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    # updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    # store = db.relationship('ShopifyStore', backref='settings', uselist=False)
+    shop_id = db.Column(db.Integer, db.ForeignKey('shopify_store.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # The AppSettingsVersion counter's value when the row was last written
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0', index=True)
+    store = db.relationship('ShopifyStore', backref=db.backref('settings', uselist=False))
+
+class AppSettingsVersion(db.Model):
+    """
+    Single-row counter (id 1) incremented in place by every settings write;
+    processes poll it to learn that their cached settings are stale
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
@@ -1,41 +1,172 @@
-from flask import Blueprint, request, jsonify
-from models.model import db, AnalyticsSchema
-from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app, Response
+from models.model import db, AnalyticsRollup
+from utils.analytics_buffer import analytics_buffer
+from utils.analytics_rollup import record_hits, GRANULARITIES
+from utils.analytics_export import export_statement, iter_export, FORMATS, EXPORT_GRANULARITIES
+from utils.bot_classifier import classify
+from datetime import datetime, timedelta
+import base64
 
 analytics_bp = Blueprint('analytics', __name__)
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+DEFAULT_RANGE_DAYS = 30
+
 @analytics_bp.route('/track', methods=['GET'])
 def track_llm_traffic():
-    user_agent = request.headers.get('User-Agent')
+    user_agent = request.headers.get('User-Agent', '')
     shop_url = request.args.get('shop')
     path = request.path
     timestamp = datetime.utcnow()
 
-    # Detect if it's an LLM (for example, based on user-agent)
-    llm_user_agents = ["ChatGPT", "Claude", "Perplexity"]
-    is_llm = any(agent in user_agent for agent in llm_user_agents)
+    # Detect if it's an LLM crawler; repeat User-Agents are served from the LRU cache
+    bot = classify(user_agent)
 
-    if is_llm:
-        analytics_entry = AnalyticsSchema(
-            shop_url=shop_url,
-            user_agent=user_agent,
-            path=path,
-            timestamp=timestamp
-        )
-        db.session.add(analytics_entry)
-        db.session.commit()
+    if bot.is_llm:
+        hit = {
+            "shop_url": shop_url,
+            "user_agent": user_agent[:255],
+            "path": path,
+            "timestamp": timestamp,
+            "bot_family": bot.bot_family,
+            "bot_vendor": bot.vendor,
+            "is_llm": bot.is_llm
+        }
+        if current_app.config.get('ANALYTICS_INGEST_MODE') == 'sync':
+            record_hits([hit])
+            db.session.commit()
+        else:
+            # Buffered mode: the background flusher batches the insert
+            analytics_buffer.offer(hit)
 
     return '', 204  # Return no content for the pixel
 
+@analytics_bp.route('/analytics/ingest/stats', methods=['GET'])
+def get_ingest_stats():
+    return jsonify(analytics_buffer.stats())
+
+def _encode_cursor(rollup):
+    raw = f"{rollup.bucket_start.isoformat()}|{rollup.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    bucket, rollup_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(bucket), int(rollup_id)
+
 @analytics_bp.route('/analytics', methods=['GET'])
 def get_analytics():
-    analytics_entries = AnalyticsSchema.query.all()
-    data = [{
-        "id": entry.id,
-        "shop_url": entry.shop_url,
-        "user_agent": entry.user_agent,
-        "path": entry.path,
-        "timestamp": entry.timestamp
-    } for entry in analytics_entries]
+    """
+    Return rolled-up LLM traffic for one shop
+
+    Query parameters:
+        shop (required), granularity (hour|day), from / to (ISO datetimes),
+        bot_family, path, limit, cursor (from the previous page's next_cursor)
+    """
+    shop_url = request.args.get('shop')
+    if not shop_url:
+        return jsonify({"error": "Missing shop parameter"}), 400
+
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+
+    try:
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow()
+        start = (datetime.fromisoformat(request.args['from']) if request.args.get('from')
+                 else end - timedelta(days=DEFAULT_RANGE_DAYS))
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        cursor = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid from, to, limit or cursor parameter"}), 400
+
+    filters = [
+        AnalyticsRollup.shop_url == shop_url,
+        AnalyticsRollup.granularity == granularity,
+        AnalyticsRollup.bucket_start >= start,
+        AnalyticsRollup.bucket_start < end,
+    ]
+    if request.args.get('bot_family'):
+        filters.append(AnalyticsRollup.bot_family == request.args['bot_family'])
+    if request.args.get('path'):
+        filters.append(AnalyticsRollup.path == request.args['path'])
+
+    query = AnalyticsRollup.query.filter(*filters)
+    if cursor:
+        last_bucket, last_id = cursor
+        query = query.filter(db.or_(
+            AnalyticsRollup.bucket_start > last_bucket,
+            db.and_(AnalyticsRollup.bucket_start == last_bucket, AnalyticsRollup.id > last_id)
+        ))
+
+    rows = query.order_by(AnalyticsRollup.bucket_start, AnalyticsRollup.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    data = {
+        "shop_url": shop_url,
+        "granularity": granularity,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "rollups": [{
+            "bucket_start": row.bucket_start.isoformat(),
+            "bot_family": row.bot_family,
+            "path": row.path,
+            "hits": row.hits
+        } for row in rows],
+        "next_cursor": _encode_cursor(rows[-1]) if has_more else None
+    }
+
+    # Totals are only computed for the first page so paging stays cheap
+    if not cursor:
+        totals = db.session.query(
+            AnalyticsRollup.bot_family, db.func.sum(AnalyticsRollup.hits)
+        ).filter(*filters).group_by(AnalyticsRollup.bot_family).all()
+        data["totals"] = {bot_family: int(hits) for bot_family, hits in totals}
 
     return jsonify(data)
+
+@analytics_bp.route('/analytics/export', methods=['GET'])
+def export_analytics():
+    """
+    Stream one shop's analytics as NDJSON or CSV
+
+    Query parameters:
+        shop (required), format (ndjson|csv), granularity (raw|hour|day;
+        raw exports individual hits), from / to (ISO datetimes, default the
+        whole history), bot_family, path
+
+    The body is gzipped on the fly when the client accepts gzip.
+    """
+    shop_url = request.args.get('shop')
+    if not shop_url:
+        return jsonify({"error": "Missing shop parameter"}), 400
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(FORMATS)}"}), 400
+
+    granularity = request.args.get('granularity', 'raw')
+    if granularity not in EXPORT_GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {', '.join(EXPORT_GRANULARITIES)}"}), 400
+
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"error": "Invalid from or to parameter"}), 400
+
+    statement, names = export_statement(shop_url, granularity, start, end,
+                                        request.args.get('bot_family'), request.args.get('path'))
+    compress = bool(request.accept_encodings['gzip'])
+    body = iter_export(db.engine, statement, names, fmt,
+                       batch_size=current_app.config['ANALYTICS_EXPORT_BATCH'], compress=compress)
+
+    response = Response(body, mimetype='application/x-ndjson' if fmt == 'ndjson' else 'text/csv')
+    filename = f"{shop_url}-analytics-{granularity}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
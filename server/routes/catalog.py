@@ -0,0 +1,38 @@
+from flask import Blueprint, request, jsonify
+from models.model import db, CatalogSync
+from utils.catalog_sync import catalog_sync, sync_status
+
+catalog_bp = Blueprint('catalog', __name__)
+
+@catalog_bp.route('/catalog/sync', methods=['POST'])
+def start_catalog_sync():
+    """
+    Queue a sync of a shop's catalog into the product mirror
+
+    Expected JSON payload:
+    {
+        "shop_url": "store-name.myshopify.com",
+        "full": false  // optional; the first sync of a shop is always full
+    }
+    """
+    data = request.json or {}
+    shop_url = data.get('shop_url')
+
+    if not shop_url:
+        return jsonify({"error": "Missing shop_url"}), 400
+
+    sync = catalog_sync.submit(shop_url, full=bool(data.get('full')) or None)
+
+    return jsonify({
+        "sync_id": sync.id,
+        "mode": sync.mode,
+        "status": sync.status,
+        "status_url": f"/catalog/sync/{sync.id}"
+    }), 202
+
+@catalog_bp.route('/catalog/sync/<sync_id>', methods=['GET'])
+def get_catalog_sync(sync_id):
+    sync = db.session.get(CatalogSync, sync_id)
+    if not sync:
+        return jsonify({"error": "Sync not found"}), 404
+    return jsonify(sync_status(sync))
@@ -1,47 +1,169 @@
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from models.model import db, LlmsSchema
-from datetime import datetime
+from utils.llms_cache import llms_cache
+from utils.llms_files import llms_files
+from utils.llms_builder import (render_llms, write_llms_streaming, iter_llms_content,
+                                shopify_products_for_llms)
+from utils.catalog_sync import catalog_products
+from utils.shopify_api import ShopifyAuthError
+from utils.shops import shop_id_for
+from datetime import datetime, timezone
+from sqlalchemy.orm import load_only
+import hashlib
+import logging
+import os
 
+logger = logging.getLogger(__name__)
 llms_bp = Blueprint('llms', __name__)
 
 @llms_bp.route('/llms/generate', methods=['POST'])
 def generate_llms():
+    """
+    Generate a new llms.txt version
+
+    Either POST {shop_url, products: [{title, url}]} to render the given
+    products, or {shop_url, source: "shopify"} to have the server read the
+    shop's catalog (from the product mirror once it has been synced) and
+    stream the document into storage.
+    """
     data = request.json
     shop_url = data.get('shop_url')
-    products = data.get('products')  # List of { title, url }
-
-    content_lines = [
-        "# llms.txt",
-        "# Auto-generated for LLM content discovery",
-        f"Shop: {shop_url}",
-        ""
-    ]
 
-    for product in products:
-        content_lines.append(f"- title: {product['title']}")
-        content_lines.append(f"  url: {product['url']}")
-        content_lines.append("")
+    if data.get('source') == 'shopify':
+        return _generate_llms_from_shopify(shop_url)
 
-    content = "\n".join(content_lines)
+    products = data.get('products')  # List of { title, url }
+    content = render_llms(shop_url, products)
 
     llms = LlmsSchema(
         shop_url=shop_url,
+        shop_id=shop_id_for(shop_url),
         content=content,
+        content_hash=hashlib.sha256(content.encode('utf-8')).hexdigest(),
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
 
     db.session.add(llms)
     db.session.commit()
+    _materialize(llms)
+    llms_cache.invalidate(shop_url)
 
     return jsonify({ "message": "llms.txt generated", "content": content })
 
 
+def _generate_llms_from_shopify(shop_url):
+    if not shop_url:
+        return jsonify({"error": "Missing shop_url"}), 400
+
+    try:
+        products = shopify_products_for_llms(shop_url, catalog_products(shop_url, fields=('title', 'handle')))
+        llms = write_llms_streaming(shop_url, products)
+    except ShopifyAuthError as e:
+        return jsonify({"error": str(e)}), 401
+    except Exception as e:
+        logger.error(f"Error generating llms.txt for {shop_url}: {str(e)}")
+        return jsonify({"error": "Failed to generate llms.txt"}), 500
+
+    _materialize(llms)
+    llms_cache.invalidate(shop_url)
+
+    return jsonify({
+        "message": "llms.txt generated",
+        "id": llms.id,
+        "shop_url": shop_url,
+        "product_count": llms.product_count,
+        "size_bytes": llms.size_bytes,
+        "etag": llms.content_hash[:32],
+        "updated_at": llms.updated_at.isoformat()
+    })
+
+
+def _materialize(llms):
+    """Write a new version to disk when llms.txt is served from files; serve_llms retries on failure"""
+    if not llms_files.enabled:
+        return
+    try:
+        llms_files.materialize(llms)
+    except OSError as e:
+        logger.error(f"Error writing llms.txt {llms.id} for {llms.shop_url} to disk: {str(e)}")
+
+
+def _llms_response(body, etag, last_modified):
+    response = Response(body, mimetype='text/plain')
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = llms_cache.max_age
+
+    # Answers If-None-Match / If-Modified-Since with a bodiless 304
+    return response.make_conditional(request)
+
+
 @llms_bp.route('/llms.txt', methods=['GET'])
 def serve_llms():
     shop_url = request.args.get('shop')
-    llms = LlmsSchema.query.filter_by(shop_url=shop_url).order_by(LlmsSchema.updated_at.desc()).first()
-    if not llms:
-        return Response("No llms.txt available", mimetype='text/plain')
+    if llms_files.enabled:
+        return _serve_llms_file(shop_url)
+    return _serve_llms_cached(shop_url)
+
+
+def _serve_llms_cached(shop_url):
+    """serve_llms from the in-process cache, loading the body from the database on a miss"""
+    entry = llms_cache.get(shop_url)
+    if entry is None or entry.body is None:
+        llms = (LlmsSchema.query
+                .filter(LlmsSchema.shop_url == shop_url, LlmsSchema.updated_at.isnot(None))
+                .order_by(LlmsSchema.updated_at.desc())
+                .first())
+        if not llms:
+            return Response("No llms.txt available", mimetype='text/plain')
+
+        if llms.content is None and (llms.size_bytes or 0) > llms_cache.max_entry_bytes:
+            # Too large to keep in memory: stream the chunks straight from the database
+            return _llms_response(
+                stream_with_context(iter_llms_content(llms)),
+                llms.content_hash[:32],
+                llms.updated_at.replace(tzinfo=timezone.utc)
+            )
+
+        entry = llms_cache.put(shop_url, b"".join(iter_llms_content(llms)), llms.updated_at,
+                               etag=llms.content_hash)
+
+    return _llms_response(entry.body, entry.etag, entry.last_modified)
+
+
+def _serve_llms_file(shop_url):
+    """
+    serve_llms for the file serve modes: Python only resolves the shop to the
+    materialized version (writing it first if this host does not have it yet)
+    and hands the file to the server or front proxy
+    """
+    entry = llms_cache.get(shop_url)
+    if entry is None or entry.path is None or not os.path.exists(entry.path):
+        # Only the columns needed to find the file; the body is read only if it must be written
+        llms = (LlmsSchema.query
+                .options(load_only(LlmsSchema.id, LlmsSchema.shop_url, LlmsSchema.content_hash,
+                                   LlmsSchema.updated_at))
+                .filter(LlmsSchema.shop_url == shop_url, LlmsSchema.updated_at.isnot(None))
+                .order_by(LlmsSchema.updated_at.desc())
+                .first())
+        try:
+            path = llms_files.materialize(llms) if llms else None
+        except OSError as e:
+            # Disk full, permissions, a concurrent prune: still answer, from memory or the database
+            logger.error(f"Error writing llms.txt for {shop_url} to disk, serving it from the cache: {str(e)}")
+            return _serve_llms_cached(shop_url)
+        if not path:
+            return Response("No llms.txt available", mimetype='text/plain')
+        # Files are named by their content hash
+        entry = llms_cache.put_file(shop_url, path, llms.updated_at, os.path.basename(path)[:-len('.txt')])
+
+    return llms_files.response(entry, llms_cache.max_age)
+
 
-    return Response(llms.content, mimetype='text/plain')
+@llms_bp.route('/llms/cache/stats', methods=['GET'])
+def llms_cache_stats():
+    return jsonify(dict(llms_cache.stats(), serve_mode=llms_files.serve_mode,
+                        materialized=llms_files.materialized))
@@ -1,27 +1,59 @@
 # server/routes/script_tag.py
 
-from flask import Blueprint, request, make_response
-from models.model import get_db_connection  # Your MySQL connection method
+from flask import Blueprint, request, make_response, jsonify
+from models.model import SeoSchema
+from utils.script_cache import script_cache
 
 script_tag_bp = Blueprint('script_tag', __name__)
 
+def _load_script(shop, product_id):
+    query = SeoSchema.query.filter(SeoSchema.shop_url == shop)
+    if product_id:
+        query = query.filter(SeoSchema.product_id == product_id)
+    row = query.order_by(SeoSchema.updated_at.desc()).first()
+
+    if not row or not row.generated_json_ld:
+        script_cache.put_missing(shop, product_id)
+        return None
+    return script_cache.put(shop, product_id, row.generated_json_ld)
+
+def _pick_encoding(entry):
+    accepted = request.accept_encodings
+    if entry.br is not None and accepted['br']:
+        return 'br', entry.br
+    if accepted['gzip']:
+        return 'gzip', entry.gzip
+    return None, entry.identity
+
 @script_tag_bp.route('/script_tag/<shop>', methods=['GET'])
 def serve_script_tag(shop):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT json_ld FROM seo_data WHERE shop_url = %s ORDER BY created_at DESC LIMIT 1", (shop,))
-    row = cursor.fetchone()
-    conn.close()
+    """
+    Serve a shop's JSON-LD as a ready-to-embed script tag
 
-    if not row:
+    ?product_id=... selects a product's schema; without it the shop's most
+    recently generated schema is returned.
+    """
+    product_id = request.args.get('product_id')
+
+    found, entry = script_cache.get(shop, product_id)
+    if not found:
+        entry = _load_script(shop, product_id)
+
+    if entry is None:
         return "/* No JSON-LD found */", 404
 
-    json_ld_script = f"""
-    <script type="application/ld+json">
-    {row['json_ld']}
-    </script>
-    """
+    encoding, body = _pick_encoding(entry)
+    response = make_response(body)
+    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Each encoding is its own representation; a shared ETag would let caches and 304s mix them up
+    response.set_etag(f"{entry.etag}-{encoding}" if encoding else entry.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = script_cache.max_age
+    return response.make_conditional(request)
 
-    response = make_response(json_ld_script)
-    response.headers['Content-Type'] = 'text/html'
-    return response
+@script_tag_bp.route('/script_tag/cache/stats', methods=['GET'])
+def script_cache_stats():
+    return jsonify(script_cache.stats())
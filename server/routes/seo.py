@@ -1,33 +1,131 @@
-from flask import Blueprint, request, jsonify
-from models.model import db, SeoSchema, AppSettings
-from utils.gemini_service import generate_faq_schema
+import asyncio
+
+from flask import Blueprint, request, jsonify, current_app
+from models.model import db, SeoSchema, SeoJob
+from utils.gemini_cache import generation_cache, description_hash
+from utils.seo_jobs import seo_jobs, job_status
+from utils.script_cache import script_cache
+from utils.shops import shop_id_for
+from utils.settings_cache import settings_cache
 from datetime import datetime
 
 seo_bp = Blueprint('seo', __name__)
 
 @seo_bp.route('/seo/generate', methods=['POST'])
 def generate_seo():
+    if current_app.config.get('OUTBOUND_IO_MODE') == 'async':
+        return current_app.ensure_sync(_generate_seo_async)()
+
     data = request.json
-    product_id = data.get('product_id')
     product_description = data.get('description')
+    shop_url = data.get('shop_url')
 
-    settings = AppSettings.query.first()
-    api_key = settings.gemini_api_key if settings else None
+    api_key = settings_cache.get(shop_url).gemini_api_key
 
     if not api_key:
         return jsonify({"error": "Gemini API key not set"}), 400
 
+    # Import here so workers that never call Gemini skip loading the client
+    from utils.gemini_service import generate_faq_schema
     json_ld = generate_faq_schema(api_key, product_description)
+    return _save_generated(shop_url, data.get('product_id'), product_description, json_ld)
+
+async def _generate_seo_async():
+    """
+    generate_seo for OUTBOUND_IO_MODE=async: the Gemini call is awaited on the
+    shared HTTP loop and database work runs in a thread, off the view's loop
+    """
+    data = request.json
+    product_description = data.get('description')
+    shop_url = data.get('shop_url')
+
+    api_key = (await asyncio.to_thread(settings_cache.get, shop_url)).gemini_api_key
+
+    if not api_key:
+        return jsonify({"error": "Gemini API key not set"}), 400
+
+    from utils.gemini_service import generate_faq_schema_async
+    json_ld = await generate_faq_schema_async(api_key, product_description)
+    return await asyncio.to_thread(_save_generated, shop_url, data.get('product_id'), product_description, json_ld)
+
+def _save_generated(shop_url, product_id, product_description, json_ld):
+    if json_ld == "{}":
+        # Nothing usable came back (or Gemini could not be reached); keep any previous schema
+        return jsonify({"error": "Gemini returned no valid FAQ schema"}), 502
 
     # Create a new SeoSchema instance with the current timestamp
     now = datetime.utcnow()
     seo = SeoSchema(
         product_id=product_id,
+        shop_url=shop_url,
+        shop_id=shop_id_for(shop_url),
         generated_json_ld=json_ld,
+        source_hash=description_hash(product_description),
         created_at=now,
         updated_at=now
     )
     db.session.add(seo)
     db.session.commit()
+    if shop_url:
+        script_cache.publish(shop_url, product_id, json_ld)
 
     return jsonify({"json_ld": json_ld})
+
+@seo_bp.route('/seo/generate/batch', methods=['POST'])
+def generate_seo_batch():
+    """
+    Queue FAQ schema generation for a whole catalog or a list of products
+
+    Expected JSON payload:
+    {
+        "shop_url": "store-name.myshopify.com",
+        "product_ids": ["123", "456"]  // optional, defaults to every product
+    }
+    """
+    data = request.json or {}
+    shop_url = data.get('shop_url')
+    product_ids = data.get('product_ids')
+
+    if not shop_url:
+        return jsonify({"error": "Missing shop_url"}), 400
+    if product_ids is not None and not isinstance(product_ids, list):
+        return jsonify({"error": "product_ids must be a list"}), 400
+
+    api_key = settings_cache.get(shop_url).gemini_api_key
+
+    if not api_key:
+        return jsonify({"error": "Gemini API key not set"}), 400
+
+    job = seo_jobs.submit(shop_url, api_key, product_ids)
+
+    return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/seo/jobs/{job.id}"}), 202
+
+@seo_bp.route('/seo/jobs/<job_id>', methods=['GET'])
+def get_seo_job(job_id):
+    job = db.session.get(SeoJob, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status(job))
+
+@seo_bp.route('/seo/cache/stats', methods=['GET'])
+def seo_cache_stats():
+    from utils.gemini_service import PROMPT_VERSION
+    stats = generation_cache.stats()
+    stats["prompt_version"] = PROMPT_VERSION
+    return jsonify(stats)
+
+@seo_bp.route('/seo/cache', methods=['DELETE'])
+def invalidate_seo_cache():
+    """
+    Drop cached Gemini responses
+
+    ?prompt_version=faq-v1 deletes that version's entries; without it every
+    entry from a prompt version other than the current one is deleted.
+    """
+    from utils.gemini_service import PROMPT_VERSION
+    prompt_version = request.args.get('prompt_version')
+    if prompt_version:
+        deleted = generation_cache.invalidate(prompt_version=prompt_version)
+    else:
+        deleted = generation_cache.invalidate(keep_version=PROMPT_VERSION)
+    return jsonify({"message": "Generation cache invalidated", "deleted": deleted})
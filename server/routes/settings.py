@@ -1,21 +1,23 @@
-from flask import Blueprint, request, jsonify
-from models.model import db, AppSettings
-import requests
+from flask import Blueprint, request, jsonify, current_app
+import asyncio
 import os
 import logging
-from config import SHOPIFY_API_VERSION
-from utils.shopify_api import authenticate_shopify
+from utils.shopify_api import (authenticate_shopify, authenticate_shopify_async, reconcile_script_tags,
+                               reconcile_script_tags_async, ShopifyAPIError)
+from utils.http_client import http_client
+from utils.settings_cache import settings_cache
+from utils.shops import shop_id_for
 
 logger = logging.getLogger(__name__)
 settings_bp = Blueprint('settings', __name__)
 
 @settings_bp.route('/settings', methods=['GET'])
 def get_settings():
-    settings = AppSettings.query.first()
-    if not settings:
-        settings = AppSettings()
-        db.session.add(settings)
-        db.session.commit()
+    """
+    Return a shop's effective settings (?shop=...); without a shop, the
+    defaults used by shops that have not saved their own
+    """
+    settings = settings_cache.get(request.args.get('shop'))
     return jsonify({
         "gemini_api_key": settings.gemini_api_key,
         "auto_generate_seo": settings.auto_generate_seo,
@@ -24,21 +26,35 @@ def get_settings():
 
 @settings_bp.route('/settings', methods=['POST'])
 def update_settings():
+    """
+    Save settings for the shop given as "shop" in the body (or ?shop=...);
+    without a shop, the defaults are updated
+    """
     data = request.json
-    settings = AppSettings.query.first()
-    if not settings:
-        settings = AppSettings()
-    settings.gemini_api_key = data.get('gemini_api_key', '')
-    settings.auto_generate_seo = data.get('auto_generate_seo', False)
-    settings.auto_generate_llms = data.get('auto_generate_llms', False)
-    db.session.add(settings)
-    db.session.commit()
+    shop = data.get('shop') or request.args.get('shop')
+
+    shop_id = None
+    if shop:
+        shop_id = shop_id_for(shop)
+        if shop_id is None:
+            return jsonify({"error": "Unknown shop"}), 404
+
+    settings_cache.save(
+        shop_id,
+        gemini_api_key=data.get('gemini_api_key', ''),
+        auto_generate_seo=data.get('auto_generate_seo', False),
+        auto_generate_llms=data.get('auto_generate_llms', False)
+    )
     return jsonify({"message": "Settings updated"})
 
+@settings_bp.route('/settings/cache/stats', methods=['GET'])
+def settings_cache_stats():
+    return jsonify(settings_cache.stats())
+
 @settings_bp.route('/api/settings/inject', methods=['POST'])
 def inject_script_tag():
     """
-    Inject a script tag into a Shopify store
+    Inject a script tag into a Shopify store; repeated calls leave a single tag
     
     Expected JSON payload:
     {
@@ -46,86 +62,121 @@ def inject_script_tag():
         "script_url": "https://example.com/script.js"
     }
     """
+    if current_app.config.get('OUTBOUND_IO_MODE') == 'async':
+        return current_app.ensure_sync(_inject_script_tag_async)()
+
     try:
-        data = request.json
-        
-        # Validate required fields
-        if not data:
-            return jsonify({"error": "Missing request body"}), 400
-            
-        shop = data.get('shop')
-        script_url = data.get('script_url')
-        
-        if not shop:
-            return jsonify({"error": "Missing shop parameter"}), 400
-            
-        if not script_url:
-            return jsonify({"error": "Missing script_url parameter"}), 400
-            
-        # Validate script URL
-        if not script_url.startswith('https://'):
-            return jsonify({"error": "Script URL must use HTTPS"}), 400
-            
-        # Clean up shop URL if needed
-        if shop.startswith('https://'):
-            shop = shop.replace('https://', '')
-            
+        shop, script_url, error = _inject_target()
+        if error:
+            return error
+
         # Get access token for the shop
         try:
-            # Import here to avoid circular imports
-            from models.model import ShopifyStore
-            
-            store = ShopifyStore.query.filter_by(shop_url=shop).first()
-            
-            if not store or not store.access_token:
+            access_token = _stored_token(shop)
+            if not access_token:
                 # Try to authenticate with Shopify
                 if not authenticate_shopify(shop):
                     return jsonify({"error": "No access token found for shop"}), 401
-                    
                 # Get the token again after authentication
-                store = ShopifyStore.query.filter_by(shop_url=shop).first()
-                
-            access_token = store.access_token if store else None
+                access_token = _stored_token(shop)
         except Exception as e:
-            logger.error(f"Error getting store: {str(e)}")
-            # For development, use environment variable
-            if os.getenv('FLASK_ENV') == 'development':
-                access_token = os.getenv('SHOPIFY_ACCESS_TOKEN')
-            else:
-                return jsonify({"error": "Failed to get access token"}), 500
-        
+            access_token, error = _development_token(e)
+            if error:
+                return error
+
         if not access_token:
             return jsonify({"error": "Failed to authenticate with Shopify"}), 401
-            
-        # Prepare the request to Shopify
-        headers = {
-            "X-Shopify-Access-Token": access_token,
-            "Content-Type": "application/json"
-        }
+
+        return _inject_response(reconcile_script_tags(shop, access_token, script_url,
+                                                      current_app.config['SCRIPT_TAG_MANAGED_PREFIXES']))
+    except ShopifyAPIError as e:
+        return _inject_error(e)
+    except Exception as e:
+        logger.error(f"Error in inject_script_tag: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+async def _inject_script_tag_async():
+    """
+    inject_script_tag for OUTBOUND_IO_MODE=async: Shopify calls are awaited on
+    the shared HTTP loop and token lookups run in a thread, off the view's loop
+    """
+    try:
+        shop, script_url, error = _inject_target()
+        if error:
+            return error
+
+        try:
+            access_token = await asyncio.to_thread(_stored_token, shop)
+            if not access_token:
+                if not await authenticate_shopify_async(shop):
+                    return jsonify({"error": "No access token found for shop"}), 401
+                access_token = await asyncio.to_thread(_stored_token, shop)
+        except Exception as e:
+            access_token, error = _development_token(e)
+            if error:
+                return error
+
+        if not access_token:
+            return jsonify({"error": "Failed to authenticate with Shopify"}), 401
+
+        return _inject_response(await reconcile_script_tags_async(shop, access_token, script_url,
+                                                                  current_app.config['SCRIPT_TAG_MANAGED_PREFIXES']))
+    except ShopifyAPIError as e:
+        return _inject_error(e)
+    except Exception as e:
+        logger.error(f"Error in inject_script_tag: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def _inject_target():
+    """Validate the inject payload; returns (shop, script_url, error response)"""
+    data = request.json
+    
+    # Validate required fields
+    if not data:
+        return None, None, (jsonify({"error": "Missing request body"}), 400)
         
-        payload = {
-            "script_tag": {
-                "event": "onload",
-                "src": script_url,
-                "display_scope": "online_store"
-            }
-        }
+    shop = data.get('shop')
+    script_url = data.get('script_url')
+    
+    if not shop:
+        return None, None, (jsonify({"error": "Missing shop parameter"}), 400)
         
-        # Send the request to Shopify
-        response = requests.post(
-            f"https://{shop}/admin/api/{SHOPIFY_API_VERSION}/script_tags.json",
-            headers=headers,
-            json=payload
-        )
+    if not script_url:
+        return None, None, (jsonify({"error": "Missing script_url parameter"}), 400)
         
-        # Check for errors
-        if response.status_code >= 400:
-            logger.error(f"Error injecting script tag: {response.text}")
-            return jsonify({"error": f"Shopify API error: {response.text}"}), response.status_code
-            
-        # Return the Shopify response
-        return jsonify(response.json()), 201
+    # Validate script URL
+    if not script_url.startswith('https://'):
+        return None, None, (jsonify({"error": "Script URL must use HTTPS"}), 400)
         
-    except Exception as e:
-        logger.error(f"Error in inject_script_tag: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    # Clean up shop URL if needed
+    if shop.startswith('https://'):
+        shop = shop.replace('https://', '')
+    return shop, script_url, None
+
+def _stored_token(shop):
+    # Import here to avoid circular imports
+    from models.model import ShopifyStore
+
+    store = ShopifyStore.query.filter_by(shop_url=shop).first()
+    return store.access_token if store else None
+
+def _development_token(e):
+    """Token to fall back on when the store lookup failed; returns (token, error response)"""
+    logger.error(f"Error getting store: {str(e)}")
+    # For development, use environment variable
+    if os.getenv('FLASK_ENV') == 'development':
+        return os.getenv('SHOPIFY_ACCESS_TOKEN'), None
+    return None, (jsonify({"error": "Failed to get access token"}), 500)
+
+def _inject_response(result):
+    """201 when a tag was created, 200 when the shop already loads the script"""
+    return jsonify(result), 201 if result["action"] == 'created' else 200
+
+def _inject_error(e):
+    logger.error(f"Error injecting script tag: {e.body}")
+    return jsonify({"error": f"Shopify API error: {e.body}"}), e.status_code
+
+@settings_bp.route('/api/http/stats', methods=['GET'])
+def http_stats():
+    """Per-host latency and retry counters for outbound Shopify and Gemini calls"""
+    return jsonify(http_client.stats())
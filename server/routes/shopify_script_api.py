@@ -1,11 +1,16 @@
 # server/routes/shopify_script_api.py
 
-import requests
+import asyncio
 import os
 import logging
 from flask import Blueprint, request, jsonify, abort, current_app
-from config import get_shop_token, SHOPIFY_API_VERSION, verify_webhook, APP_URL
-from utils.shopify_api import authenticate_shopify, save_shop_token
+from config import get_shop_token, verify_webhook, APP_URL, shop_base_url
+from utils.shopify_api import (authenticate_shopify, save_shop_token, reconcile_script_tags,
+                               reconcile_script_tags_async, ShopifyAPIError)
+from utils.http_client import http_client
+from utils.webhook_queue import webhook_queue
+from utils.script_tag_rollout import script_tag_rollout, rollout_status, shop_result
+from models.model import db, ScriptTagRollout, ScriptTagRolloutShop
 from functools import wraps
 import os
 
@@ -42,48 +47,103 @@ def verify_shopify_request(f):
 
 @shopify_script_bp.route('/install_script_tag', methods=['POST'])
 def install_script_tag():
-    """Install a script tag in the shop"""
+    """Install the app's script tag in the shop, or leave the existing one in place"""
+    if current_app.config.get('OUTBOUND_IO_MODE') == 'async':
+        return current_app.ensure_sync(_install_script_tag_async)()
+
     try:
-        data = request.json
-        if not data or 'shop' not in data:
-            return jsonify({"error": "Missing shop parameter"}), 400
-            
-        shop = data['shop']
-        access_token = get_shop_token(shop)
-        
-        if not access_token:
-            return jsonify({"error": "No access token found for shop"}), 401
-            
-        # Get the app's script URL from environment or config
-        script_url = f"{APP_URL}/static/shopify-app.js"
-        
-        headers = {
-            "X-Shopify-Access-Token": access_token,
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "script_tag": {
-                "event": "onload",
-                "src": script_url,
-                "display_scope": "online_store"
-            }
-        }
-        
-        res = requests.post(
-            f"https://{shop}/admin/api/{SHOPIFY_API_VERSION}/script_tags.json",
-            headers=headers,
-            json=payload
-        )
-        
-        if res.status_code >= 400:
-            logger.error(f"Error installing script tag: {res.text}")
-            
-        return jsonify(res.json()), res.status_code
+        shop, access_token, error = _install_target()
+        if error:
+            return error
+
+        return _install_response(reconcile_script_tags(shop, access_token, f"{APP_URL}/static/shopify-app.js",
+                                                       current_app.config['SCRIPT_TAG_MANAGED_PREFIXES']))
+    except ShopifyAPIError as e:
+        logger.error(f"Error installing script tag: {e.body}")
+        return jsonify({"error": f"Shopify API error: {e.body}"}), e.status_code
+    except Exception as e:
+        logger.error(f"Error in install_script_tag: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+async def _install_script_tag_async():
+    """install_script_tag for OUTBOUND_IO_MODE=async; the token lookup runs in a thread, off the view's loop"""
+    try:
+        shop, access_token, error = await asyncio.to_thread(_install_target)
+        if error:
+            return error
+
+        return _install_response(await reconcile_script_tags_async(
+            shop, access_token, f"{APP_URL}/static/shopify-app.js", current_app.config['SCRIPT_TAG_MANAGED_PREFIXES']))
+    except ShopifyAPIError as e:
+        logger.error(f"Error installing script tag: {e.body}")
+        return jsonify({"error": f"Shopify API error: {e.body}"}), e.status_code
     except Exception as e:
         logger.error(f"Error in install_script_tag: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def _install_target():
+    """The shop to install into and its token; returns (shop, access_token, error response)"""
+    data = request.json
+    if not data or 'shop' not in data:
+        return None, None, (jsonify({"error": "Missing shop parameter"}), 400)
+        
+    shop = data['shop']
+    access_token = get_shop_token(shop)
+    
+    if not access_token:
+        return None, None, (jsonify({"error": "No access token found for shop"}), 401)
+    return shop, access_token, None
+
+def _install_response(result):
+    """201 when a tag was created, 200 when the shop already had it (possibly repointed or deduplicated)"""
+    return jsonify(result), 201 if result["action"] == 'created' else 200
+
+@shopify_script_bp.route('/script_tags/rollout', methods=['POST'])
+def start_script_tag_rollout():
+    """
+    Queue a rollout of a script tag to every active shop
+
+    Expected JSON payload:
+    {
+        "script_url": "https://cdn.example.com/shopify-app.js",
+        "replace_prefixes": ["https://old-cdn.example.com/"],  // optional, on top of SCRIPT_TAG_MANAGED_PREFIXES
+        "dry_run": false  // optional
+    }
+    """
+    data = request.json or {}
+    script_url = data.get('script_url')
+    replace_prefixes = data.get('replace_prefixes') or []
+
+    if not script_url or not script_url.startswith('https://'):
+        return jsonify({"error": "script_url must be an https:// URL"}), 400
+    if not isinstance(replace_prefixes, list) or not all(isinstance(p, str) and p for p in replace_prefixes):
+        return jsonify({"error": "replace_prefixes must be a list of URL prefixes"}), 400
+
+    rollout = script_tag_rollout.submit(script_url, replace_prefixes, dry_run=bool(data.get('dry_run')))
+
+    return jsonify({
+        "rollout_id": rollout.id,
+        "total": rollout.total,
+        "status": rollout.status,
+        "status_url": f"/script_tags/rollouts/{rollout.id}"
+    }), 202
+
+@shopify_script_bp.route('/script_tags/rollouts/<rollout_id>', methods=['GET'])
+def get_script_tag_rollout(rollout_id):
+    """Progress of a rollout and a page of its per-shop results (?action=failed&limit=100&offset=0)"""
+    rollout = db.session.get(ScriptTagRollout, rollout_id)
+    if not rollout:
+        return jsonify({"error": "Rollout not found"}), 404
+
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    offset = request.args.get('offset', 0, type=int)
+    query = db.select(ScriptTagRolloutShop).where(ScriptTagRolloutShop.rollout_id == rollout_id)
+    if request.args.get('action'):
+        query = query.where(ScriptTagRolloutShop.action == request.args['action'])
+    rows = db.session.scalars(query.order_by(ScriptTagRolloutShop.id).limit(limit).offset(offset)).all()
+
+    return jsonify(dict(rollout_status(rollout), shops=[shop_result(row) for row in rows]))
+
 @shopify_script_bp.route('/oauth/callback', methods=['GET'])
 def oauth_callback():
     """Handle OAuth callback from Shopify"""
@@ -109,7 +169,7 @@ def oauth_callback():
             'code': code
         }
         
-        response = requests.post(f"https://{shop}/admin/oauth/access_token", json=payload)
+        response = http_client.post(f"{shop_base_url(shop)}/admin/oauth/access_token", json=payload)
         
         if response.status_code != 200:
             logger.error(f"Error getting access token: {response.text}")
@@ -133,41 +193,34 @@ def oauth_callback():
         logger.error(f"Error in oauth_callback: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@shopify_script_bp.route('/webhooks/app_uninstalled', methods=['POST'])
+@shopify_script_bp.route('/webhooks/app_uninstalled', methods=['POST'], defaults={'topic': 'app/uninstalled'})
+@shopify_script_bp.route('/webhooks/products/create', methods=['POST'], defaults={'topic': 'products/create'})
+@shopify_script_bp.route('/webhooks/products/update', methods=['POST'], defaults={'topic': 'products/update'})
+@shopify_script_bp.route('/webhooks/products/delete', methods=['POST'], defaults={'topic': 'products/delete'})
 @verify_shopify_request
-def app_uninstalled():
-    """Handle app uninstalled webhook"""
+def receive_webhook(topic):
+    """
+    Store a verified webhook in the durable queue and acknowledge it at once
+
+    The work (utils/webhook_handlers.py) runs when the queue is drained, so
+    the response time does not depend on it and Shopify does not retry
+    deliveries it thinks timed out. Redeliveries of a stored webhook are
+    recognised by X-Shopify-Webhook-Id and acknowledged without a new event.
+    """
+    if request.get_json(silent=True) is None:
+        return jsonify({"error": "Invalid JSON payload"}), 400
+
     try:
-        data = request.json
-        shop = data.get('myshopify_domain')
-        
-        if not shop:
-            return jsonify({"error": "Missing shop domain"}), 400
-            
-        # Mark the store as inactive
-        try:
-            # Import here to avoid circular imports
-            from models.model import ShopifyStore, db
-            
-            store = ShopifyStore.query.filter_by(shop_url=shop).first()
-            if store:
-                store.is_active = False
-                store.access_token = None  # Clear the token for security
-                db.session.commit()
-        except Exception as e:
-            logger.error(f"Error updating store status: {str(e)}")
-            try:
-                from models.model import db
-                db.session.rollback()
-            except:
-                pass
-            
-        return jsonify({"success": True}), 200
+        stored = webhook_queue.enqueue(topic, request.headers.get('X-Shopify-Shop-Domain'),
+                                       request.headers.get('X-Shopify-Webhook-Id'), request.get_data())
     except Exception as e:
-        logger.error(f"Error in app_uninstalled webhook: {str(e)}")
-        try:
-            from models.model import db
-            db.session.rollback()
-        except:
-            pass
-        return jsonify({"error": str(e)}), 500
+        logger.error(f"Error storing {topic} webhook: {str(e)}")
+        db.session.rollback()
+        # A non-2xx answer makes Shopify deliver it again later
+        return jsonify({"error": "Could not store webhook"}), 500
+
+    return jsonify({"success": True, "duplicate": not stored}), 200
+
+@shopify_script_bp.route('/webhooks/queue/stats', methods=['GET'])
+def webhook_queue_stats():
+    return jsonify(webhook_queue.stats())
@@ -0,0 +1,190 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from models.model import db
+from utils.analytics_rollup import record_hits
+
+logger = logging.getLogger(__name__)
+
+# Sentinel pushed onto the queue to wake the flusher up for shutdown
+_STOP = object()
+
+
+class AnalyticsBuffer:
+    """
+    Bounded in-process buffer for pixel hits.
+
+    The /track route only enqueues a row dict and returns. A background flusher
+    thread drains the queue and writes hits with a single multi-row INSERT (plus
+    the matching rollup increments) once either `batch_size` rows are pending or
+    `flush_interval` seconds have passed.
+    When the queue is full the hit is dropped and counted instead of blocking
+    the request.
+    """
+
+    def __init__(self, app=None, maxsize=10000, batch_size=500, flush_interval=1.0,
+                 enqueue_timeout=0.0):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+
+        self._app = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = False
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_at = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read buffer settings from the app config and register shutdown flushing"""
+        self._app = app
+        self.maxsize = int(app.config.get('ANALYTICS_BUFFER_SIZE', self.maxsize))
+        self.batch_size = int(app.config.get('ANALYTICS_FLUSH_BATCH', self.batch_size))
+        self.flush_interval = float(app.config.get('ANALYTICS_FLUSH_INTERVAL', self.flush_interval))
+        self.enqueue_timeout = float(app.config.get('ANALYTICS_ENQUEUE_TIMEOUT', self.enqueue_timeout))
+        app.extensions['analytics_buffer'] = self
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        # Started lazily (and restarted after fork) so pre-forking servers
+        # such as gunicorn get one flusher per worker process
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='analytics-flusher', daemon=True)
+            self._thread.start()
+
+    def offer(self, row):
+        """
+        Add a hit to the buffer without touching the database
+
+        Args:
+            row (dict): Column values for an AnalyticsSchema row
+
+        Returns:
+            bool: True if the hit was queued, False if it was dropped
+        """
+        if self._stopping:
+            self.dropped += 1
+            return False
+
+        self._ensure_started()
+        try:
+            if self.enqueue_timeout > 0:
+                self._queue.put(row, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        self.enqueued += 1
+        return True
+
+    def _run(self):
+        pending = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._drain_into(pending)
+                self._write(pending)
+                return
+
+            if item is not None:
+                pending.append(item)
+
+            if len(pending) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(pending)
+                pending = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _drain_into(self, pending):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                pending.append(item)
+
+    def _write(self, rows):
+        """Persist rows in batches of `batch_size` using multi-row inserts"""
+        if not rows:
+            return
+
+        with self._app.app_context():
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                try:
+                    record_hits(batch)
+                    db.session.commit()
+                    self.flushed += len(batch)
+                    self.batches += 1
+                except Exception as e:
+                    db.session.rollback()
+                    self.failed += len(batch)
+                    logger.error(f"Error flushing analytics batch: {str(e)}")
+            db.session.remove()
+        self.last_flush_at = time.time()
+
+    def depth(self):
+        """Number of hits waiting to be written"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def shutdown(self, timeout=10.0):
+        """Stop accepting hits, flush everything still buffered and join the flusher"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stopping = True
+        try:
+            # The flusher keeps draining while we wait, so a full queue frees up quickly
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Analytics buffer still full at shutdown; unflushed hits may be lost")
+            return
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Analytics flusher did not finish before shutdown timeout")
+        self._thread = None
+
+    def stats(self):
+        return {
+            "mode": self._app.config.get('ANALYTICS_INGEST_MODE') if self._app else None,
+            "depth": self.depth(),
+            "capacity": self.maxsize,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_at": self.last_flush_at,
+        }
+
+
+analytics_buffer = AnalyticsBuffer()
@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+import zlib
+
+from models.model import db, AnalyticsSchema, AnalyticsRollup
+
+FORMATS = ('ndjson', 'csv')
+
+# 'raw' exports individual hits (kept for ANALYTICS_RAW_RETENTION_DAYS); the others export rollups
+EXPORT_GRANULARITIES = ('raw', 'hour', 'day')
+
+# Output is handed to the server in pieces of about this size
+CHUNK_BYTES = 64 * 1024
+
+
+def export_statement(shop_url, granularity, start=None, end=None, bot_family=None, path=None):
+    """
+    Column-only select for an export, ordered along the (shop_url, time) index
+
+    Returns:
+        tuple: (select statement, output column names)
+    """
+    if granularity == 'raw':
+        model, time_column = AnalyticsSchema, AnalyticsSchema.timestamp
+        columns = [AnalyticsSchema.timestamp, AnalyticsSchema.bot_family, AnalyticsSchema.bot_vendor,
+                   AnalyticsSchema.path, AnalyticsSchema.user_agent]
+        filters = [AnalyticsSchema.shop_url == shop_url]
+    else:
+        model, time_column = AnalyticsRollup, AnalyticsRollup.bucket_start
+        columns = [AnalyticsRollup.bucket_start, AnalyticsRollup.bot_family, AnalyticsRollup.path,
+                   AnalyticsRollup.hits]
+        filters = [AnalyticsRollup.shop_url == shop_url, AnalyticsRollup.granularity == granularity]
+
+    if start is not None:
+        filters.append(time_column >= start)
+    if end is not None:
+        filters.append(time_column < end)
+    if bot_family:
+        filters.append(model.bot_family == bot_family)
+    if path:
+        filters.append(model.path == path)
+
+    statement = db.select(*columns).where(*filters).order_by(time_column, model.id)
+    return statement, [column.key for column in columns]
+
+
+def _value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _encode_ndjson(names, rows):
+    return "".join(json.dumps(dict(zip(names, map(_value, row))), separators=(',', ':')) + "\n"
+                   for row in rows)
+
+
+def _encode_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([[_value(value) for value in row] for row in rows])
+    return buffer.getvalue()
+
+
+def iter_export(engine, statement, names, fmt, batch_size=1000, compress=False):
+    """
+    Encode an export batch by batch
+
+    Rows are read through a server-side cursor on a dedicated connection,
+    `batch_size` at a time, as plain tuples, so memory stays flat however
+    many rows match. The connection is released when the generator finishes
+    or is closed (e.g. the client disconnects).
+
+    Args:
+        engine: Engine to open the connection on (captured outside any app context)
+        statement: Select from export_statement
+        names (list): Output column names
+        fmt (str): 'ndjson' or 'csv'
+        batch_size (int): Rows fetched per round trip
+        compress (bool): gzip the output on the fly
+
+    Returns:
+        iterator: bytes chunks
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending = []
+    pending_size = 0
+
+    def _emit(text):
+        data = text.encode('utf-8')
+        return compressor.compress(data) if compressor else data
+
+    if fmt == 'csv':
+        header = io.StringIO()
+        csv.writer(header).writerow(names)
+        pending.append(_emit(header.getvalue()))
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        for rows in result.partitions():
+            chunk = _emit(_encode_ndjson(names, rows) if fmt == 'ndjson' else _encode_csv(rows))
+            if chunk:
+                pending.append(chunk)
+                pending_size += len(chunk)
+            if pending_size >= CHUNK_BYTES:
+                yield b"".join(pending)
+                pending, pending_size = [], 0
+
+    if compressor:
+        pending.append(compressor.flush())
+    if pending:
+        yield b"".join(pending)
@@ -0,0 +1,226 @@
+"""
+Retention for raw crawler hits.
+
+Raw hits are only needed for recent, per-request detail; long-range trends
+come from AnalyticsRollup. Compaction keeps the raw table bounded:
+
+1. On MySQL, where analytics_schema is range-partitioned by month on
+   timestamp, make sure the next few months have partitions.
+2. Fold expired hits that are not yet counted in the rollups (rows written
+   before rollups existed) into hour and day buckets, in batches.
+3. Drop expired hits: whole partitions on MySQL, bounded batched deletes
+   elsewhere.
+4. Prune hourly rollup buckets past their own retention; day buckets are kept.
+"""
+import logging
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models.model import db, AnalyticsSchema, AnalyticsRollup
+from utils.analytics_rollup import aggregate_hits, upsert_rollups
+from utils.bot_classifier import classify
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLE = 'analytics_schema'
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _partition_clause(month):
+    """Partition holding hits before the end of `month`, named pYYYYMM"""
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_next_month(month):%Y-%m-%d}'))"
+
+
+def monthly_partitions():
+    """
+    Months with a partition in analytics_schema, oldest first
+
+    Returns:
+        list: (partition name, month start) pairs; empty unless the table is
+              partitioned (MySQL after the partitioning migration)
+    """
+    if db.session.get_bind().dialect.name != 'mysql':
+        return []
+    names = db.session.execute(db.text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"table": PARTITIONED_TABLE}).scalars().all()
+    return [(name, datetime.strptime(name[1:], '%Y%m')) for name in names if name != 'pmax']
+
+
+def ensure_partitions(now, months_ahead=2):
+    """Split pmax so every month up to `months_ahead` after now has its own partition"""
+    partitions = monthly_partitions()
+    if not partitions:
+        return []
+
+    target = _month_start(now)
+    for _ in range(months_ahead):
+        target = _next_month(target)
+
+    months = []
+    month = _next_month(partitions[-1][1])
+    while month <= target:
+        months.append(month)
+        month = _next_month(month)
+    if months:
+        clauses = ', '.join([_partition_clause(month) for month in months]
+                            + ["PARTITION pmax VALUES LESS THAN MAXVALUE"])
+        db.session.execute(db.text(f"ALTER TABLE {PARTITIONED_TABLE} REORGANIZE PARTITION pmax INTO ({clauses})"))
+    return [f"p{month:%Y%m}" for month in months]
+
+
+def fold_expired(cutoff, batch_size):
+    """
+    Count expired hits that are missing from the rollups into them
+
+    Each batch upserts its rollup increments and marks its rows rolled_up in
+    one transaction, so an interrupted run never counts a hit twice.
+
+    Returns:
+        int: Hits folded
+    """
+    folded = 0
+    while True:
+        rows = db.session.execute(
+            db.select(AnalyticsSchema.id, AnalyticsSchema.shop_url, AnalyticsSchema.user_agent,
+                      AnalyticsSchema.path, AnalyticsSchema.timestamp, AnalyticsSchema.bot_family)
+            .where(AnalyticsSchema.rolled_up == db.false(), AnalyticsSchema.timestamp < cutoff)
+            .order_by(AnalyticsSchema.timestamp, AnalyticsSchema.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return folded
+
+        hits = [{
+            "shop_url": row.shop_url,
+            "path": row.path,
+            "timestamp": row.timestamp,
+            # Hits from before bot classification was stored are classified now
+            "bot_family": row.bot_family or classify(row.user_agent or '').bot_family,
+        } for row in rows]
+        upsert_rollups(aggregate_hits(hits))
+        db.session.execute(
+            db.update(AnalyticsSchema)
+            .where(AnalyticsSchema.id.in_([row.id for row in rows]))
+            .values(rolled_up=True)
+        )
+        db.session.commit()
+        folded += len(rows)
+        if len(rows) < batch_size:
+            return folded
+
+
+def drop_expired_partitions(cutoff):
+    """Drop monthly partitions that end on or before the cutoff"""
+    expired = [name for name, month in monthly_partitions() if _next_month(month) <= cutoff]
+    if expired:
+        db.session.execute(db.text(f"ALTER TABLE {PARTITIONED_TABLE} DROP PARTITION {', '.join(expired)}"))
+    return expired
+
+
+def _delete_in_batches(model, condition, order_by, batch_size):
+    """Delete matching rows at most batch_size at a time, committing after each batch"""
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            db.select(model.id).where(condition).order_by(order_by).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return deleted
+        db.session.execute(db.delete(model).where(model.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+
+
+def compact_analytics(raw_retention_days, hourly_retention_days, batch_size=5000, months_ahead=2, now=None):
+    """
+    Run one compaction pass (see the module docstring)
+
+    Args:
+        raw_retention_days (int): Days of raw hits to keep
+        hourly_retention_days (int): Days of hourly rollups to keep; 0 keeps them all
+        batch_size (int): Rows per fold, delete or prune batch
+        months_ahead (int): Future monthly partitions to keep ready (MySQL)
+        now (datetime, optional): Reference time, defaults to utcnow
+
+    Returns:
+        dict: What the pass created, folded, dropped and deleted
+    """
+    now = now or datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff = today - timedelta(days=raw_retention_days)
+
+    result = {"cutoff": cutoff.isoformat(), "created_partitions": ensure_partitions(now, months_ahead)}
+    db.session.commit()
+
+    result["folded"] = fold_expired(cutoff, batch_size)
+
+    if monthly_partitions():
+        # Rows in the partition that straddles the cutoff stay until the whole month expires
+        result["dropped_partitions"] = drop_expired_partitions(cutoff)
+        result["deleted"] = 0
+        db.session.commit()
+    else:
+        result["dropped_partitions"] = []
+        result["deleted"] = _delete_in_batches(
+            AnalyticsSchema,
+            db.and_(AnalyticsSchema.rolled_up == db.true(), AnalyticsSchema.timestamp < cutoff),
+            AnalyticsSchema.timestamp, batch_size)
+
+    result["pruned_hourly"] = 0
+    if hourly_retention_days:
+        result["pruned_hourly"] = _delete_in_batches(
+            AnalyticsRollup,
+            db.and_(AnalyticsRollup.granularity == 'hour',
+                    AnalyticsRollup.bucket_start < today - timedelta(days=hourly_retention_days)),
+            AnalyticsRollup.bucket_start, batch_size)
+
+    logger.info(f"Analytics compaction: {result}")
+    return result
+
+
+@click.command('compact-analytics')
+@click.option('--retention-days', type=int, help='Days of raw hits to keep (default: ANALYTICS_RAW_RETENTION_DAYS).')
+@click.option('--hourly-retention-days', type=int,
+              help='Days of hourly rollups to keep, 0 for all (default: ANALYTICS_HOURLY_RETENTION_DAYS).')
+@click.option('--batch-size', type=int, help='Rows per batch (default: ANALYTICS_COMPACTION_BATCH).')
+@with_appcontext
+def compact_analytics_command(retention_days, hourly_retention_days, batch_size):
+    """Fold expired raw hits into rollups, then drop them and old hourly rollups."""
+    config = current_app.config
+    result = compact_analytics(
+        raw_retention_days=config['ANALYTICS_RAW_RETENTION_DAYS'] if retention_days is None else retention_days,
+        hourly_retention_days=(config['ANALYTICS_HOURLY_RETENTION_DAYS']
+                               if hourly_retention_days is None else hourly_retention_days),
+        batch_size=batch_size or config['ANALYTICS_COMPACTION_BATCH'],
+        months_ahead=config['ANALYTICS_PARTITIONS_AHEAD'],
+    )
+    click.echo(f"Raw hits before {result['cutoff']}: folded {result['folded']}, deleted {result['deleted']}, "
+               f"dropped partitions: {', '.join(result['dropped_partitions']) or 'none'}")
+    if result["created_partitions"]:
+        click.echo(f"Created partitions: {', '.join(result['created_partitions'])}")
+    click.echo(f"Hourly rollups pruned: {result['pruned_hourly']}")
+
+
+@click.command('backfill-analytics-rollups')
+@click.option('--batch-size', type=int, help='Rows per batch (default: ANALYTICS_COMPACTION_BATCH).')
+@with_appcontext
+def backfill_analytics_rollups_command(batch_size):
+    """Count raw hits recorded before rollups existed into them; run once after upgrading."""
+    # Hits recorded since are rolled_up already, so this only touches old rows and is safe to re-run
+    folded = fold_expired(datetime.utcnow(), batch_size or current_app.config['ANALYTICS_COMPACTION_BATCH'])
+    click.echo(f"Folded {folded} raw hits into rollups")
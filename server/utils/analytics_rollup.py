@@ -0,0 +1,91 @@
+from collections import Counter
+
+from models.model import db, AnalyticsSchema, AnalyticsRollup
+from utils.shops import shop_id_for
+
+GRANULARITIES = ('hour', 'day')
+
+
+def bucket_start(timestamp, granularity):
+    """Truncate a timestamp to the start of its hour or day bucket"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate_hits(rows, granularities=GRANULARITIES):
+    """
+    Fold raw hit dicts into rollup increments
+
+    Args:
+        rows (list): Dicts with shop_url, bot_family, path and timestamp keys
+        granularities (tuple): Bucket sizes to produce
+
+    Returns:
+        list: Rollup row dicts with the number of hits to add to each bucket
+    """
+    counts = Counter()
+    for row in rows:
+        if not row.get('shop_url') or not row.get('timestamp'):
+            continue
+        for granularity in granularities:
+            counts[(
+                row['shop_url'],
+                granularity,
+                bucket_start(row['timestamp'], granularity),
+                row.get('bot_family') or '',
+                (row.get('path') or '')[:255],
+            )] += 1
+
+    return [
+        {
+            "shop_url": shop_url,
+            "granularity": granularity,
+            "bucket_start": start,
+            "bot_family": bot_family,
+            "path": path,
+            "hits": hits,
+        }
+        for (shop_url, granularity, start, bot_family, path), hits in counts.items()
+    ]
+
+
+def upsert_rollups(increments):
+    """Add hit increments to existing rollup buckets, creating missing ones"""
+    if not increments:
+        return
+
+    table = AnalyticsRollup.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(hits=table.c.hits + stmt.inserted.hits)
+    else:
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['shop_url', 'granularity', 'bucket_start', 'bot_family', 'path'],
+            set_={"hits": table.c.hits + stmt.excluded.hits}
+        )
+
+    db.session.execute(stmt, increments)
+
+
+def record_hits(rows):
+    """
+    Insert raw hits and update their rollups in the current transaction.
+    The caller is responsible for committing.
+    """
+    if not rows:
+        return
+    for row in rows:
+        row['shop_id'] = shop_id_for(row.get('shop_url'))
+        # Counted in the rollups below, so compaction can drop the row without folding it
+        row['rolled_up'] = True
+    db.session.execute(db.insert(AnalyticsSchema), rows)
+    upsert_rollups(aggregate_hits(rows))
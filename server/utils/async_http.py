@@ -0,0 +1,207 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from utils.http_client import http_client, IDEMPOTENT_METHODS, RETRY_STATUSES
+from utils.metrics import metrics
+
+try:
+    import httpx
+except ImportError:  # httpx is only needed for OUTBOUND_IO_MODE=async
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+
+def require_async_support():
+    """Raise if the packages OUTBOUND_IO_MODE=async depends on are missing"""
+    missing = []
+    if httpx is None:
+        missing.append('httpx')
+    try:
+        import asgiref  # noqa: F401  (what Flask runs async views with)
+    except ImportError:
+        missing.append('asgiref (flask[async])')
+    if missing:
+        raise RuntimeError(f"OUTBOUND_IO_MODE=async needs {', '.join(missing)} installed")
+
+
+class AsyncHttpClient:
+    """
+    Non-blocking counterpart of HttpClient for the async request path.
+
+    All calls run on one event loop in a background thread that owns a
+    pooled httpx.AsyncClient, so every request in the process shares the
+    same connections however many worker threads are waiting on them.
+    Concurrency is capped per upstream with semaphores: per shop for
+    Shopify calls (on top of the shop's API call bucket, which is shared
+    with the synchronous client) and per host for everything else.
+
+    Timeouts, retries, backoff and the per-host stats are those of the
+    synchronous client it wraps, and transport failures are raised as the
+    same requests exceptions, so callers handle both paths alike.
+    """
+
+    def __init__(self, sync_client, max_connections=500, host_concurrency=200, shop_concurrency=8):
+        self.sync = sync_client
+        self.max_connections = max_connections
+        self.host_concurrency = host_concurrency
+        self.shop_concurrency = shop_concurrency
+        self._loop = None
+        self._client = None
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name='async-http', daemon=True)
+                    thread.start()
+                    self._loop = loop
+                    atexit.register(self.shutdown)
+        return self._loop
+
+    def _client_for_loop(self):
+        # Created on the loop thread, the only place it is used
+        if self._client is None:
+            connect_timeout, read_timeout = self.sync.timeout
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections))
+        return self._client
+
+    def _semaphore(self, key, limit):
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def request(self, method, url, shop=None, idempotent=None, **kwargs):
+        """
+        Send an HTTP request without blocking the caller's event loop
+
+        Takes the same arguments as HttpClient.request (json, headers, params, ...).
+
+        Returns:
+            httpx.Response: The final response (possibly a 429/5xx once retries run out)
+
+        Raises:
+            requests.RequestException: If the request could not be completed after retries
+        """
+        if httpx is None:
+            raise RuntimeError("httpx is not installed")
+        started = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(
+            self._request(method.upper(), url, shop, idempotent, kwargs), self._ensure_loop())
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            # The attempts were timed on the loop thread; charge the wait to this request
+            metrics.observe_request_upstream(time.perf_counter() - started)
+
+    async def _request(self, method, url, shop, idempotent, kwargs):
+        host = urlparse(url).netloc
+        stats = self.sync.stats_for(host)
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        bucket = self.sync.bucket_for(shop) if shop else None
+        if shop:
+            semaphore = self._semaphore(('shop', shop), self.shop_concurrency)
+        else:
+            semaphore = self._semaphore(('host', host), self.host_concurrency)
+        client = self._client_for_loop()
+
+        attempt = 0
+        while True:
+            async with semaphore:
+                if bucket is not None:
+                    wait = bucket.acquire()
+                    if wait > 0:
+                        stats.throttled += 1
+                        await asyncio.sleep(wait)
+
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    elapsed = time.perf_counter() - started
+                    stats.record(elapsed * 1000, error=True)
+                    metrics.observe_upstream(host, 'error', elapsed)
+                    # Connect failures never reached the server, so they are always safe to retry
+                    retriable = idempotent or isinstance(e, httpx.ConnectTimeout)
+                    if attempt >= self.sync.max_retries or not retriable:
+                        raise _as_requests_error(e) from e
+                    attempt += 1
+                    stats.retries += 1
+                    delay = self.sync.backoff(attempt)
+                    response = None
+
+                if response is not None:
+                    elapsed = time.perf_counter() - started
+                    stats.record(elapsed * 1000, error=response.status_code >= 500)
+                    metrics.observe_upstream(host, response.status_code, elapsed)
+
+                    if bucket is not None and 'X-Shopify-Shop-Api-Call-Limit' in response.headers:
+                        bucket.update(response.headers['X-Shopify-Shop-Api-Call-Limit'])
+
+                    # A 429 was rejected before processing, so even a POST can be replayed
+                    retriable = (response.status_code == 429
+                                 or (idempotent and response.status_code in RETRY_STATUSES))
+                    if not retriable or attempt >= self.sync.max_retries:
+                        return response
+
+                    attempt += 1
+                    stats.retries += 1
+                    delay = self.sync.backoff(attempt, response)
+                    logger.warning(f"{method} {host} returned {response.status_code}, retrying in {delay:.2f}s")
+
+            # Back off outside the semaphore so waiting retries do not hold a slot
+            await asyncio.sleep(delay)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+    def shutdown(self):
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return
+        if self._client is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Error closing async HTTP client: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def _as_requests_error(error):
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.ConnectTimeout(str(error))
+    if isinstance(error, httpx.TimeoutException):
+        return requests.Timeout(str(error))
+    return requests.ConnectionError(str(error))
+
+
+async_http_client = AsyncHttpClient(
+    http_client,
+    max_connections=int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '500')),
+    host_concurrency=int(os.getenv('ASYNC_HTTP_HOST_CONCURRENCY', '200')),
+    shop_concurrency=int(os.getenv('ASYNC_HTTP_SHOP_CONCURRENCY', '8')),
+)
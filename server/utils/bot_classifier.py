@@ -0,0 +1,99 @@
+import re
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+BotSignature = namedtuple('BotSignature', ['token', 'family', 'vendor', 'is_llm'])
+Classification = namedtuple('Classification', ['bot_family', 'vendor', 'is_llm'])
+
+UNKNOWN = Classification(None, None, False)
+
+# Known crawler User-Agent tokens. Matching is case-insensitive and the longest
+# token wins, so specific tokens (e.g. Applebot-Extended) beat generic ones.
+SIGNATURES = [
+    BotSignature('GPTBot', 'GPTBot', 'OpenAI', True),
+    BotSignature('ChatGPT-User', 'ChatGPT-User', 'OpenAI', True),
+    BotSignature('OAI-SearchBot', 'OAI-SearchBot', 'OpenAI', True),
+    BotSignature('ClaudeBot', 'ClaudeBot', 'Anthropic', True),
+    BotSignature('Claude-User', 'Claude-User', 'Anthropic', True),
+    BotSignature('Claude-SearchBot', 'Claude-SearchBot', 'Anthropic', True),
+    BotSignature('Claude-Web', 'Claude-Web', 'Anthropic', True),
+    BotSignature('anthropic-ai', 'anthropic-ai', 'Anthropic', True),
+    BotSignature('PerplexityBot', 'PerplexityBot', 'Perplexity', True),
+    BotSignature('Perplexity-User', 'Perplexity-User', 'Perplexity', True),
+    BotSignature('Google-Extended', 'Google-Extended', 'Google', True),
+    BotSignature('GoogleOther', 'GoogleOther', 'Google', True),
+    BotSignature('CCBot', 'CCBot', 'Common Crawl', True),
+    BotSignature('Bytespider', 'Bytespider', 'ByteDance', True),
+    BotSignature('Amazonbot', 'Amazonbot', 'Amazon', True),
+    BotSignature('Applebot-Extended', 'Applebot-Extended', 'Apple', True),
+    BotSignature('meta-externalagent', 'meta-externalagent', 'Meta', True),
+    BotSignature('cohere-ai', 'cohere-ai', 'Cohere', True),
+    BotSignature('MistralAI-User', 'MistralAI-User', 'Mistral', True),
+    BotSignature('DuckAssistBot', 'DuckAssistBot', 'DuckDuckGo', True),
+    BotSignature('YouBot', 'YouBot', 'You.com', True),
+    BotSignature('Diffbot', 'Diffbot', 'Diffbot', True),
+    # Generic product names kept from the original substring check
+    BotSignature('ChatGPT', 'ChatGPT', 'OpenAI', True),
+    BotSignature('Claude', 'Claude', 'Anthropic', True),
+    BotSignature('Perplexity', 'Perplexity', 'Perplexity', True),
+    # Classic search crawlers, recognised but not counted as LLM traffic
+    BotSignature('Googlebot', 'Googlebot', 'Google', False),
+    BotSignature('Applebot', 'Applebot', 'Apple', False),
+    BotSignature('bingbot', 'bingbot', 'Microsoft', False),
+]
+
+_lock = threading.Lock()
+_matcher = None
+_by_token = {}
+
+
+def _compile():
+    global _matcher, _by_token
+    tokens = sorted({sig.token for sig in SIGNATURES}, key=len, reverse=True)
+    _by_token = {sig.token.lower(): sig for sig in SIGNATURES}
+    _matcher = re.compile('|'.join(re.escape(token) for token in tokens), re.IGNORECASE)
+
+
+def register_signature(token, family, vendor, is_llm=True):
+    """
+    Add a crawler signature and rebuild the matcher
+
+    Args:
+        token (str): Substring that identifies the crawler in its User-Agent
+        family (str): Bot family stored with each hit
+        vendor (str): Company operating the crawler
+        is_llm (bool): Whether hits from this crawler count as LLM traffic
+    """
+    with _lock:
+        SIGNATURES.append(BotSignature(token, family, vendor, is_llm))
+        _compile()
+        classify.cache_clear()
+
+
+@lru_cache(maxsize=4096)
+def classify(user_agent):
+    """
+    Classify a raw User-Agent string
+
+    Args:
+        user_agent (str): The User-Agent header, may be None or empty
+
+    Returns:
+        Classification: bot_family, vendor and is_llm (UNKNOWN if nothing matched)
+    """
+    if not user_agent:
+        return UNKNOWN
+
+    best = None
+    for match in _matcher.finditer(user_agent):
+        if best is None or len(match.group(0)) > len(best.group(0)):
+            best = match
+    if best is None:
+        return UNKNOWN
+
+    sig = _by_token[best.group(0).lower()]
+    return Classification(sig.family, sig.vendor, sig.is_llm)
+
+
+_compile()
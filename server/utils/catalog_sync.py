@@ -0,0 +1,538 @@
+"""
+Local mirror of each shop's catalog.
+
+A full sync starts a Shopify bulk operation over every product, waits for
+it to finish and streams the JSONL result line by line into ProductMirror,
+upserting in batches; mirror rows the sync did not see (deleted products)
+are removed afterwards. Incremental syncs run the same bulk query filtered
+to products updated since the newest mirrored updated_at. Product webhooks
+keep rows current between syncs.
+
+Catalog-wide work reads products through catalog_products, which serves
+them from the mirror once the shop has completed a full sync and pages
+through the REST API otherwise.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models.model import db, ProductMirror, CatalogSync, ShopifyStore
+from utils.shopify_api import graphql, get_products, count_products, PRODUCT_FIELDS, PRODUCT_FIELD_NAMES
+from utils.shops import shop_domain, shop_id_for
+
+logger = logging.getLogger(__name__)
+
+# Fields of a product node written to the mirror; one JSONL line per product
+PRODUCTS_QUERY = """
+{
+  products%s {
+    edges {
+      node {
+        id legacyResourceId title handle descriptionHtml vendor productType tags status
+        createdAt updatedAt publishedAt
+      }
+    }
+  }
+}
+"""
+
+RUN_BULK_QUERY = """
+mutation runBulkQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+BULK_OPERATION = """
+query bulkOperation($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode objectCount url }
+  }
+}
+"""
+
+FAILED_STATUSES = ('FAILED', 'CANCELED', 'CANCELING', 'EXPIRED')
+
+# get_products field name -> mirror column
+MIRROR_COLUMNS = {
+    'id': ProductMirror.product_id,
+    'title': ProductMirror.title,
+    'handle': ProductMirror.handle,
+    'body_html': ProductMirror.description,
+    'vendor': ProductMirror.vendor,
+    'product_type': ProductMirror.product_type,
+    'tags': ProductMirror.tags,
+    'status': ProductMirror.status,
+    'created_at': ProductMirror.created_at,
+    'updated_at': ProductMirror.updated_at,
+    'published_at': ProductMirror.published_at,
+}
+
+
+class CatalogSyncError(Exception):
+    """Raised when a bulk operation could not be started or did not complete"""
+
+
+def _parse_time(value):
+    """Shopify timestamp (ISO 8601 with an offset) as a naive UTC datetime"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def mirror_row(shop_url, shop_id, node, synced_at):
+    """Mirror row for a product node from the bulk query"""
+    tags = node.get('tags')
+    return {
+        "shop_url": shop_url,
+        "shop_id": shop_id,
+        "product_id": str(node.get('legacyResourceId') or node['id'].rsplit('/', 1)[-1]),
+        "title": node.get('title'),
+        "handle": node.get('handle'),
+        "description": node.get('descriptionHtml'),
+        "vendor": node.get('vendor'),
+        "product_type": node.get('productType'),
+        "tags": ", ".join(tags) if isinstance(tags, list) else tags,
+        "status": (node.get('status') or '').lower() or None,
+        "created_at": _parse_time(node.get('createdAt')),
+        "updated_at": _parse_time(node.get('updatedAt')),
+        "published_at": _parse_time(node.get('publishedAt')),
+        "synced_at": synced_at,
+    }
+
+
+def upsert_products(rows):
+    """Insert mirror rows, replacing the existing row for the same shop and product"""
+    if not rows:
+        return
+
+    table = ProductMirror.__table__
+    dialect = db.session.get_bind().dialect.name
+    updated = [name for name in rows[0] if name not in ('shop_url', 'product_id')]
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in updated})
+    else:
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['shop_url', 'product_id'],
+            set_={name: stmt.excluded[name] for name in updated}
+        )
+
+    db.session.execute(stmt, rows)
+
+
+def start_bulk_query(shop_url, updated_since=None):
+    """
+    Start a bulk operation over the shop's products
+
+    Returns:
+        str: The bulk operation's ID
+
+    Raises:
+        CatalogSyncError: If Shopify refused it (e.g. another bulk query is running for the shop)
+    """
+    product_filter = ''
+    if updated_since is not None:
+        product_filter = f'''(query: "updated_at:>='{updated_since:%Y-%m-%dT%H:%M:%SZ}'")'''
+    data = graphql(shop_url, RUN_BULK_QUERY, {"query": PRODUCTS_QUERY % product_filter})
+    result = data.get('bulkOperationRunQuery') or {}
+    if result.get('userErrors'):
+        raise CatalogSyncError("; ".join(error.get('message', '') for error in result['userErrors']))
+    if not result.get('bulkOperation'):
+        raise CatalogSyncError("Shopify did not start a bulk operation")
+    return result['bulkOperation']['id']
+
+
+def wait_for_bulk_operation(shop_url, operation_id, poll_interval=2.0, timeout=3600.0):
+    """
+    Poll a bulk operation until it completes
+
+    Returns:
+        dict: The completed operation; `url` is None when no product matched
+
+    Raises:
+        CatalogSyncError: If the operation failed or did not finish within the timeout
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        operation = graphql(shop_url, BULK_OPERATION, {"id": operation_id}, idempotent=True).get('node') or {}
+        status = operation.get('status')
+        if status == 'COMPLETED':
+            return operation
+        if status in FAILED_STATUSES:
+            raise CatalogSyncError(f"Bulk operation {status.lower()}: {operation.get('errorCode') or 'no error code'}")
+        if time.monotonic() >= deadline:
+            raise CatalogSyncError(f"Bulk operation still {status} after {timeout:.0f}s")
+        time.sleep(poll_interval)
+
+
+def iter_bulk_lines(url):
+    """
+    Stream a bulk operation's JSONL result one object at a time
+
+    The file can hold millions of lines; it is read from the socket as it is
+    consumed and never held in memory.
+    """
+    # Import here so workers that never sync skip loading requests
+    from utils.http_client import http_client
+
+    response = http_client.get(url, stream=True)
+    try:
+        if response.status_code != 200:
+            raise CatalogSyncError(f"Bulk operation result returned {response.status_code}")
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+    finally:
+        response.close()
+
+
+def latest_sync(shop_url, mode=None):
+    """The shop's most recently completed sync (of `mode`, if given), or None"""
+    query = CatalogSync.query.filter(CatalogSync.shop_url == shop_domain(shop_url),
+                                     CatalogSync.status == 'completed')
+    if mode:
+        query = query.filter(CatalogSync.mode == mode)
+    return query.order_by(CatalogSync.finished_at.desc()).first()
+
+
+def has_mirror(shop_url):
+    """Whether the shop's catalog can be read from the mirror (a full sync has completed)"""
+    return latest_sync(shop_url, mode='full') is not None
+
+
+def _use_mirror(shop_url, fields=()):
+    return (current_app.config.get('CATALOG_SOURCE', 'mirror') == 'mirror'
+            and all(field in MIRROR_COLUMNS for field in fields)
+            and has_mirror(shop_url))
+
+
+def iter_mirror_products(shop_url, fields=PRODUCT_FIELDS, ids=None, batch_size=1000):
+    """
+    Iterate over a shop's mirrored products as get_products-style dicts
+
+    Rows are read in keyset pages of `batch_size` along the (shop_url,
+    product_id) index, each page a short query on its own connection, so no
+    read stays open while the caller writes (SQLite would block the writes
+    until it closed) and memory stays flat however large the catalog.
+    """
+    names = [PRODUCT_FIELD_NAMES.get(field, field) for field in fields]
+    columns = [ProductMirror.product_id] + [MIRROR_COLUMNS[field] for field in fields]
+    conditions = [ProductMirror.shop_url == shop_domain(shop_url)]
+    if ids:
+        conditions.append(ProductMirror.product_id.in_([str(product_id) for product_id in ids]))
+    engine = db.engine
+
+    def _rows():
+        last = None
+        while True:
+            page = db.select(*columns).where(*conditions)
+            if last is not None:
+                page = page.where(ProductMirror.product_id > last)
+            with engine.connect() as conn:
+                rows = conn.execute(page.order_by(ProductMirror.product_id).limit(batch_size)).all()
+            for row in rows:
+                yield dict(zip(names, row[1:]))
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+    return _rows()
+
+
+def catalog_products(shop_url, fields=PRODUCT_FIELDS, ids=None):
+    """
+    Iterate over the shop's products from the mirror when it has one, else from Shopify
+
+    Takes get_products' `fields` and `ids`.
+
+    Raises:
+        ShopifyAuthError: If the products come from Shopify and the shop could not be authenticated
+    """
+    if _use_mirror(shop_url, fields):
+        return iter_mirror_products(shop_url, fields=fields, ids=ids)
+    return get_products(shop_url, fields=fields, ids=ids)
+
+
+def count_catalog(shop_url):
+    """Number of products catalog_products would return for the whole catalog"""
+    if _use_mirror(shop_url):
+        return db.session.scalar(db.select(db.func.count(ProductMirror.id))
+                                 .where(ProductMirror.shop_url == shop_domain(shop_url)))
+    return count_products(shop_url)
+
+
+def apply_product_webhook(shop_url, product):
+    """
+    Write a products/create or products/update webhook payload to the mirror
+
+    Only shops with a mirror are updated, and a payload older than the
+    mirrored row (webhooks can arrive out of order) is ignored.
+
+    Returns:
+        bool: True if the mirror row was written
+    """
+    domain = shop_domain(shop_url)
+    if not domain or not product.get('id') or not has_mirror(domain):
+        return False
+
+    updated_at = _parse_time(product.get('updated_at'))
+    current = db.session.scalar(db.select(ProductMirror.updated_at).where(
+        ProductMirror.shop_url == domain, ProductMirror.product_id == str(product['id'])))
+    if current is not None and updated_at is not None and updated_at < current:
+        return False
+
+    upsert_products([{
+        "shop_url": domain,
+        "shop_id": shop_id_for(domain),
+        "product_id": str(product['id']),
+        "title": product.get('title'),
+        "handle": product.get('handle'),
+        "description": product.get('body_html'),
+        "vendor": product.get('vendor'),
+        "product_type": product.get('product_type'),
+        "tags": product.get('tags'),
+        "status": product.get('status'),
+        "created_at": _parse_time(product.get('created_at')),
+        "updated_at": updated_at,
+        "published_at": _parse_time(product.get('published_at')),
+        "synced_at": datetime.utcnow(),
+    }])
+    db.session.commit()
+    return True
+
+
+def remove_product_webhook(shop_url, product):
+    """
+    Delete the mirror row of a product from a products/delete webhook payload
+
+    Incremental syncs only see products that still exist, so without this a
+    deleted product would stay mirrored until the next full sync.
+
+    Returns:
+        bool: True if a mirror row was deleted
+    """
+    domain = shop_domain(shop_url)
+    if not domain or not product.get('id'):
+        return False
+
+    deleted = db.session.execute(db.delete(ProductMirror).where(
+        ProductMirror.shop_url == domain, ProductMirror.product_id == str(product['id']))).rowcount
+    db.session.commit()
+    return deleted > 0
+
+
+class CatalogSyncRunner:
+    """
+    Runs catalog syncs in the background.
+
+    Shopify runs one bulk query per shop at a time, so a shop with a sync
+    already queued or running gets that sync back instead of a new one.
+    """
+
+    def __init__(self, app=None, workers=2, batch_size=500, poll_interval=2.0, timeout=3600.0):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._app = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.workers = int(app.config.get('CATALOG_SYNC_WORKERS', self.workers))
+        self.batch_size = int(app.config.get('CATALOG_SYNC_BATCH', self.batch_size))
+        self.poll_interval = float(app.config.get('CATALOG_SYNC_POLL_INTERVAL', self.poll_interval))
+        self.timeout = float(app.config.get('CATALOG_SYNC_TIMEOUT', self.timeout))
+        app.extensions['catalog_sync'] = self
+
+    def _executor_for(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='catalog-sync')
+            return self._executor
+
+    def create(self, shop_url, full=None):
+        """
+        Record a sync for the shop, or return the one already in progress
+
+        Args:
+            shop_url (str): The shop to sync
+            full (bool, optional): Force a full (True) or incremental (False) sync;
+                                   by default incremental once the shop has a mirror
+
+        Returns:
+            tuple: (CatalogSync, created)
+        """
+        domain = shop_domain(shop_url)
+        active = CatalogSync.query.filter(
+            CatalogSync.shop_url == domain,
+            CatalogSync.status.in_(('queued', 'running')),
+            # A sync whose process died is abandoned once it is older than the timeout
+            CatalogSync.created_at >= datetime.utcnow() - timedelta(seconds=self.timeout),
+        ).first()
+        if active:
+            return active, False
+
+        updated_since = None
+        if not full:
+            updated_since = db.session.scalar(db.select(db.func.max(ProductMirror.updated_at))
+                                              .where(ProductMirror.shop_url == domain))
+        mode = 'full' if full or updated_since is None or not has_mirror(domain) else 'incremental'
+        sync = CatalogSync(id=uuid.uuid4().hex, shop_url=domain, mode=mode, status='queued',
+                           updated_since=updated_since if mode == 'incremental' else None,
+                           created_at=datetime.utcnow())
+        db.session.add(sync)
+        db.session.commit()
+        return sync, True
+
+    def submit(self, shop_url, full=None):
+        """Queue a sync in the background (see create); returns its CatalogSync row"""
+        sync, created = self.create(shop_url, full)
+        if created:
+            self._executor_for().submit(self._run_in_context, sync.id)
+        return sync
+
+    def _run_in_context(self, sync_id):
+        with self._app.app_context():
+            try:
+                self.run(sync_id)
+            finally:
+                db.session.remove()
+
+    def run(self, sync_id):
+        """
+        Run a recorded sync to completion on this thread
+
+        Returns:
+            CatalogSync: The finished sync (completed or failed)
+        """
+        sync = db.session.get(CatalogSync, sync_id)
+        shop_url = sync.shop_url
+        sync.status = 'running'
+        sync.started_at = synced_at = datetime.utcnow()
+        db.session.commit()
+
+        try:
+            operation_id = start_bulk_query(shop_url, sync.updated_since)
+            sync = db.session.get(CatalogSync, sync_id)
+            sync.bulk_operation_id = operation_id
+            db.session.commit()
+
+            operation = wait_for_bulk_operation(shop_url, operation_id, self.poll_interval, self.timeout)
+            upserted = self._load(sync_id, shop_url, operation.get('url'), synced_at)
+
+            deleted = 0
+            if sync.mode == 'full':
+                # Anything not written by this sync (or a webhook since it started) is gone from Shopify
+                deleted = db.session.execute(db.delete(ProductMirror).where(
+                    ProductMirror.shop_url == shop_url, ProductMirror.synced_at < synced_at)).rowcount
+
+            sync = db.session.get(CatalogSync, sync_id)
+            sync.upserted = upserted
+            sync.deleted = deleted
+            sync.status = 'completed'
+        except Exception as e:
+            logger.error(f"Catalog sync {sync_id} for {shop_url} failed: {str(e)}")
+            db.session.rollback()
+            sync = db.session.get(CatalogSync, sync_id)
+            sync.status = 'failed'
+            sync.error = str(e)
+        sync.finished_at = datetime.utcnow()
+        db.session.commit()
+        logger.info(f"Catalog sync {sync_id} for {shop_url}: {sync.status}, "
+                    f"{sync.upserted} upserted, {sync.deleted} deleted")
+        return sync
+
+    def _load(self, sync_id, shop_url, url, synced_at):
+        """Upsert the bulk result into the mirror, committing (and recording progress) per batch"""
+        if not url:
+            return 0
+        shop_id = shop_id_for(shop_url)
+        upserted = 0
+        batch = []
+
+        def _flush():
+            upsert_products(batch)
+            db.session.get(CatalogSync, sync_id).upserted = upserted + len(batch)
+            db.session.commit()
+            return len(batch)
+
+        for node in iter_bulk_lines(url):
+            # Nested connections would add child lines carrying __parentId; only products are mirrored
+            if '__parentId' in node:
+                continue
+            batch.append(mirror_row(shop_url, shop_id, node, synced_at))
+            if len(batch) >= self.batch_size:
+                upserted += _flush()
+                batch = []
+        if batch:
+            upserted += _flush()
+        return upserted
+
+
+def sync_status(sync):
+    """Serialize a sync for the API"""
+    return {
+        "sync_id": sync.id,
+        "shop_url": sync.shop_url,
+        "mode": sync.mode,
+        "status": sync.status,
+        "updated_since": sync.updated_since.isoformat() if sync.updated_since else None,
+        "upserted": sync.upserted,
+        "deleted": sync.deleted,
+        "error": sync.error,
+        "created_at": sync.created_at.isoformat() if sync.created_at else None,
+        "started_at": sync.started_at.isoformat() if sync.started_at else None,
+        "finished_at": sync.finished_at.isoformat() if sync.finished_at else None,
+    }
+
+
+catalog_sync = CatalogSyncRunner()
+
+
+@click.command('sync-catalog')
+@click.option('--shop', 'shops', multiple=True, help='Shop to sync (repeatable; default: every active shop).')
+@click.option('--full', is_flag=True, help='Re-download the whole catalog even if the shop has a mirror.')
+@with_appcontext
+def sync_catalog_command(shops, full):
+    """Sync shop catalogs into the product mirror (incremental once a shop has one)."""
+    if not shops:
+        shops = db.session.scalars(db.select(ShopifyStore.shop_url)
+                                   .where(ShopifyStore.is_active == db.true())).all()
+    failed = 0
+    for shop_url in shops:
+        sync, created = catalog_sync.create(shop_url, full=full or None)
+        if not created:
+            click.echo(f"{sync.shop_url}: sync {sync.id} already {sync.status}")
+            continue
+        sync = catalog_sync.run(sync.id)
+        failed += sync.status == 'failed'
+        click.echo(f"{sync.shop_url}: {sync.mode} sync {sync.status}, {sync.upserted} upserted, "
+                   f"{sync.deleted} deleted" + (f" ({sync.error})" if sync.error else ""))
+    if failed:
+        raise SystemExit(1)
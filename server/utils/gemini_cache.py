@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from models.model import db, GeminiCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_description(content):
+    """Collapse whitespace so cosmetic edits to a description still hit the cache"""
+    return re.sub(r'\s+', ' ', content or '').strip()
+
+
+def description_hash(content):
+    """Fingerprint of a product description, used to tell whether its SEO schema is stale"""
+    return hashlib.sha256(normalize_description(content).encode('utf-8')).hexdigest()
+
+
+def cache_key(content, model, prompt_version):
+    """Content address for a generation: sha256 of (normalized input, model, prompt version)"""
+    raw = "\x1f".join([normalize_description(content), model, prompt_version])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    """
+    Persistent cache of Gemini responses in the gemini_cache table.
+
+    Reads and writes use their own short transactions on the engine, so a
+    lookup never commits or rolls back the caller's ORM session. Entries
+    older than `ttl` are ignored, and every `sweep_every` writes the table is
+    trimmed to `max_entries` rows by least recent use.
+    """
+
+    def __init__(self, ttl=30 * 24 * 3600, max_entries=100000, sweep_every=100, enabled=True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sweep_every = sweep_every
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached response for a key, or None"""
+        if not self.enabled:
+            return None
+        try:
+            return self._get(key)
+        except Exception as e:
+            logger.error(f"Error reading generation cache: {str(e)}")
+            return None
+
+    def _get(self, key):
+        table = GeminiCache.__table__
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            row = conn.execute(
+                db.select(table.c.response, table.c.created_at).where(table.c.key_hash == key)
+            ).first()
+            if row is None or row.created_at < now - timedelta(seconds=self.ttl):
+                self.misses += 1
+                return None
+            conn.execute(
+                table.update().where(table.c.key_hash == key)
+                .values(last_used_at=now, hit_count=table.c.hit_count + 1)
+            )
+        self.hits += 1
+        return row.response
+
+    def put(self, key, model, prompt_version, response):
+        """Store a response; an existing entry for the key is replaced"""
+        if not self.enabled:
+            return
+        try:
+            self._put(key, model, prompt_version, response)
+        except Exception as e:
+            logger.error(f"Error writing generation cache: {str(e)}")
+
+    def _put(self, key, model, prompt_version, response):
+        table = GeminiCache.__table__
+        now = datetime.utcnow()
+        values = {
+            "key_hash": key,
+            "model": model,
+            "prompt_version": prompt_version,
+            "response": response,
+            "created_at": now,
+            "last_used_at": now,
+            "hit_count": 0,
+        }
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(**values))
+        except IntegrityError:
+            # Another worker cached the same key (or an expired entry is still there)
+            with db.engine.begin() as conn:
+                conn.execute(table.update().where(table.c.key_hash == key).values(**values))
+
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % self.sweep_every == 0
+        if sweep:
+            self.sweep()
+
+    def sweep(self):
+        """Delete expired entries and trim the table to max_entries by least recent use"""
+        table = GeminiCache.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(
+                table.c.created_at < datetime.utcnow() - timedelta(seconds=self.ttl)
+            ))
+            cutoff = conn.execute(
+                db.select(table.c.last_used_at)
+                .order_by(table.c.last_used_at.desc())
+                .offset(self.max_entries)
+                .limit(1)
+            ).scalar()
+            if cutoff is not None:
+                conn.execute(table.delete().where(table.c.last_used_at <= cutoff))
+
+    def invalidate(self, prompt_version=None, keep_version=None):
+        """
+        Delete cached responses
+
+        Args:
+            prompt_version (str, optional): Only delete entries for this prompt version
+            keep_version (str, optional): Delete every entry except this prompt version
+
+        Returns:
+            int: Number of entries deleted
+        """
+        table = GeminiCache.__table__
+        stmt = table.delete()
+        if prompt_version:
+            stmt = stmt.where(table.c.prompt_version == prompt_version)
+        elif keep_version:
+            stmt = stmt.where(table.c.prompt_version != keep_version)
+        with db.engine.begin() as conn:
+            return conn.execute(stmt).rowcount
+
+    def stats(self):
+        total = self.hits + self.misses
+        with db.engine.connect() as conn:
+            entries = conn.execute(db.select(db.func.count()).select_from(GeminiCache.__table__)).scalar()
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+
+generation_cache = GenerationCache(
+    ttl=int(os.getenv('GEMINI_CACHE_TTL', str(30 * 24 * 3600))),
+    max_entries=int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', '100000')),
+    enabled=os.getenv('GEMINI_CACHE_ENABLED', 'true').lower() == 'true',
+)
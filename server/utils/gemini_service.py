@@ -1,24 +1,282 @@
+import asyncio
+import json
+import logging
+import os
+import re
 import requests
+from utils.http_client import http_client
+from utils.gemini_cache import generation_cache, cache_key
 
-def generate_faq_schema(api_key, content):
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key=" + api_key
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# Overridable so tests and benchmarks can point at a local stub
+GEMINI_API_BASE_URL = os.getenv("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com").rstrip('/')
+
+# Bump whenever the prompt templates below (or the stored format) change so cached responses are not reused
+PROMPT_VERSION = "faq-v2"
+
+# Batched prompts: input token budget per request and a cap on products, which bounds the output size
+BATCH_TOKEN_BUDGET = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "8000"))
+BATCH_MAX_PRODUCTS = int(os.getenv("GEMINI_BATCH_MAX_PRODUCTS", "20"))
+
+# Rough prompt cost of the instructions and of each product's framing, in tokens
+BATCH_PROMPT_TOKENS = 120
+BATCH_ITEM_TOKENS = 12
+
+_FENCE = re.compile(r'^\s*```(?:json|jsonld|json-ld)?\s*|\s*```\s*$', re.IGNORECASE)
+
+
+class InvalidSchemaError(ValueError):
+    """Raised when Gemini's answer is not a usable FAQPage JSON-LD document"""
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (about four characters per token), good enough for budgeting"""
+    return len(text or '') // 4 + 1
+
+
+def parse_faq_schema(text):
+    """
+    Validate an FAQPage JSON-LD document and serialize it canonically
+
+    Accepts Gemini's raw text (markdown fences are stripped) or an already
+    decoded object. The result is compact JSON with sorted keys, so equal
+    schemas are stored as equal bytes and can be served as they are.
+
+    Returns:
+        str: Canonical JSON
+
+    Raises:
+        InvalidSchemaError: If the text is not JSON or not a usable FAQPage
+    """
+    if isinstance(text, str):
+        try:
+            document = json.loads(_FENCE.sub('', text))
+        except ValueError as e:
+            raise InvalidSchemaError(f"not JSON: {e}")
+    else:
+        document = text
+
+    if isinstance(document, list) and len(document) == 1:
+        document = document[0]
+    if not isinstance(document, dict) or document.get('@type') != 'FAQPage':
+        raise InvalidSchemaError("not an FAQPage document")
+    context = document.setdefault('@context', 'https://schema.org')
+    if not isinstance(context, str) or 'schema.org' not in context:
+        raise InvalidSchemaError(f"unexpected @context {context!r}")
+
+    questions = document.get('mainEntity')
+    if isinstance(questions, dict):
+        questions = document['mainEntity'] = [questions]
+    if not isinstance(questions, list) or not questions:
+        raise InvalidSchemaError("mainEntity has no questions")
+    for question in questions:
+        answer = question.get('acceptedAnswer') if isinstance(question, dict) else None
+        if (question.get('@type') if isinstance(question, dict) else None) != 'Question' \
+                or not isinstance(question.get('name'), str) or not question['name'].strip() \
+                or not isinstance(answer, dict) or answer.get('@type') != 'Answer' \
+                or not isinstance(answer.get('text'), str) or not answer['text'].strip():
+            raise InvalidSchemaError("mainEntity must hold Questions with a name and an Answer text")
+
+    return json.dumps(document, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+
+def batch_products(products, token_budget=None, max_products=None):
+    """
+    Group (product_id, description) pairs into prompt-sized batches
+
+    Products are taken in order and a batch is closed before it would exceed
+    the token budget or max_products; a product over the budget on its own
+    gets a batch to itself. Works lazily on any iterable.
+
+    Returns:
+        iterator: Lists of (product_id, description)
+    """
+    token_budget = token_budget or BATCH_TOKEN_BUDGET
+    max_products = max_products or BATCH_MAX_PRODUCTS
+    batch, used = [], BATCH_PROMPT_TOKENS
+    for product_id, description in products:
+        cost = estimate_tokens(description) + BATCH_ITEM_TOKENS
+        if batch and (used + cost > token_budget or len(batch) >= max_products):
+            yield batch
+            batch, used = [], BATCH_PROMPT_TOKENS
+        batch.append((product_id, description))
+        used += cost
+    if batch:
+        yield batch
+
+
+def _generate_request(content):
+    """URL and JSON body of the generateContent call for a product description"""
+    url = f"{GEMINI_API_BASE_URL}/v1beta/models/{GEMINI_MODEL}:generateContent"
 
     prompt = f"""
     Generate SEO-friendly JSON-LD FAQ schema for the following product description:
 
     {content}
 
-    Format it in valid JSON-LD (type: FAQPage).
+    Format it in valid JSON-LD (type: FAQPage). Respond with the JSON-LD object only.
+    """
+
+    return url, {
+        "contents": [{
+            "parts": [{"text": prompt}]
+        }],
+        "generationConfig": {"responseMimeType": "application/json"}
+    }
+
+def _batch_request(items):
+    """URL and JSON body of one generateContent call for several (key, description) pairs"""
+    url = f"{GEMINI_API_BASE_URL}/v1beta/models/{GEMINI_MODEL}:generateContent"
+
+    products = "\n\n".join(f"PRODUCT {key}:\n{description}" for key, description in items)
+    keys = ", ".join(key for key, _ in items)
+    prompt = f"""
+    Generate SEO-friendly JSON-LD FAQ schema for each of the following product descriptions.
+
+    {products}
+
+    Respond with one JSON object whose keys are the product keys ({keys}) and whose
+    values are valid JSON-LD objects (type: FAQPage) for that product only.
     """
 
-    response = requests.post(url, json={
+    return url, {
         "contents": [{
             "parts": [{"text": prompt}]
-        }]
-    })
+        }],
+        "generationConfig": {"responseMimeType": "application/json"}
+    }
+
+def _response_text(response):
+    try:
+        return response.json()['candidates'][0]['content']['parts'][0]['text']
+    except Exception:
+        return None
+
+def _parse_or_empty(text):
+    try:
+        return parse_faq_schema(text)
+    except InvalidSchemaError as e:
+        logger.warning(f"Discarding Gemini response: {str(e)}")
+        return None
+
+def generate_faq_schema(api_key, content, use_cache=True):
+    """
+    Generate the FAQPage JSON-LD for one product description
+
+    Returns:
+        str: Canonical JSON (see parse_faq_schema), or "{}" if no valid schema came back
+    """
+    key = cache_key(content, GEMINI_MODEL, PROMPT_VERSION)
+    if use_cache:
+        cached = generation_cache.get(key)
+        if cached is not None:
+            return cached
+
+    url, body = _generate_request(content)
+
+    try:
+        # generateContent has no side effects, so 5xx responses are safe to retry
+        # The key goes in a header so it never shows up in logged URLs
+        response = http_client.post(url, idempotent=True, headers={"x-goog-api-key": api_key}, json=body)
+    except requests.RequestException as e:
+        logger.error(f"Error calling Gemini: {str(e)}")
+        return "{}"
+
+    json_ld = _parse_or_empty(_response_text(response) or '')
+    if json_ld is None:
+        return "{}"
+
+    if use_cache:
+        generation_cache.put(key, GEMINI_MODEL, PROMPT_VERSION, json_ld)
+    return json_ld
+
+def generate_faq_schemas(api_key, products, use_cache=True):
+    """
+    Generate FAQPage JSON-LD for several products in one Gemini call
+
+    Cached products are answered from the generation cache; the rest are sent
+    together (callers should size `products` with batch_products). Products
+    whose part of the answer is missing or invalid are retried on their own
+    with generate_faq_schema.
+
+    Args:
+        api_key (str): Gemini API key
+        products (list): (product_id, description) pairs
+
+    Returns:
+        tuple: ({product_id: canonical JSON}, {product_id: error message})
+    """
+    results, errors = {}, {}
+    pending = []
+    for product_id, description in products:
+        if use_cache:
+            cached = generation_cache.get(cache_key(description, GEMINI_MODEL, PROMPT_VERSION))
+            if cached is not None:
+                results[product_id] = cached
+                continue
+        pending.append((product_id, description))
+
+    if len(pending) > 1:
+        # Short positional keys keep arbitrary product ids out of the prompt
+        keyed = {f"p{index}": item for index, item in enumerate(pending, 1)}
+        url, body = _batch_request([(key, description) for key, (_, description) in keyed.items()])
+        answers = {}
+        try:
+            response = http_client.post(url, idempotent=True, headers={"x-goog-api-key": api_key}, json=body)
+            answers = json.loads(_FENCE.sub('', _response_text(response) or ''))
+        except requests.RequestException as e:
+            logger.error(f"Error calling Gemini: {str(e)}")
+        except ValueError as e:
+            logger.warning(f"Discarding batched Gemini response: {str(e)}")
+
+        retry = []
+        for key, (product_id, description) in keyed.items():
+            json_ld = _parse_or_empty(answers.get(key)) if isinstance(answers, dict) and answers.get(key) else None
+            if json_ld is None:
+                retry.append((product_id, description))
+                continue
+            results[product_id] = json_ld
+            if use_cache:
+                generation_cache.put(cache_key(description, GEMINI_MODEL, PROMPT_VERSION),
+                                     GEMINI_MODEL, PROMPT_VERSION, json_ld)
+        pending = retry
+
+    for product_id, description in pending:
+        json_ld = generate_faq_schema(api_key, description, use_cache=use_cache)
+        if json_ld == "{}":
+            errors[product_id] = "Gemini returned no valid FAQPage schema"
+        else:
+            results[product_id] = json_ld
+
+    return results, errors
+
+async def generate_faq_schema_async(api_key, content, use_cache=True):
+    """generate_faq_schema for async views; neither the Gemini call nor the cache lookups block the event loop"""
+    # Import here so the sync-only path never loads httpx
+    from utils.async_http import async_http_client
+
+    key = cache_key(content, GEMINI_MODEL, PROMPT_VERSION)
+    if use_cache:
+        cached = await asyncio.to_thread(generation_cache.get, key)
+        if cached is not None:
+            return cached
+
+    url, body = _generate_request(content)
 
     try:
-        text = response.json()['candidates'][0]['content']['parts'][0]['text']
-        return text
-    except Exception as e:
+        response = await async_http_client.post(url, idempotent=True, headers={"x-goog-api-key": api_key},
+                                                 json=body)
+    except requests.RequestException as e:
+        logger.error(f"Error calling Gemini: {str(e)}")
+        return "{}"
+
+    json_ld = _parse_or_empty(_response_text(response) or '')
+    if json_ld is None:
         return "{}"
+
+    if use_cache:
+        await asyncio.to_thread(generation_cache.put, key, GEMINI_MODEL, PROMPT_VERSION, json_ld)
+    return json_ld
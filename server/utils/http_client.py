@@ -0,0 +1,254 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# Shopify REST leaky bucket defaults (standard plans: 40 calls, leaking 2 per second)
+SHOPIFY_BUCKET_SIZE = 40
+SHOPIFY_LEAK_RATE = 2.0
+
+
+class ShopBucket:
+    """
+    Client-side model of a shop's Shopify API leaky bucket.
+
+    The fill level is refreshed from X-Shopify-Shop-Api-Call-Limit after every
+    response and drained at the leak rate in between, so callers can wait just
+    long enough before a request instead of being answered with a 429.
+    """
+
+    def __init__(self, size=SHOPIFY_BUCKET_SIZE, leak_rate=SHOPIFY_LEAK_RATE, headroom=2):
+        self.size = size
+        self.leak_rate = leak_rate
+        self.headroom = headroom
+        self.used = 0.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _level(self, now):
+        return max(0.0, self.used - (now - self.updated_at) * self.leak_rate)
+
+    def acquire(self):
+        """Reserve one call, returning how long the caller should wait before sending it"""
+        with self._lock:
+            now = time.monotonic()
+            level = self._level(now)
+            wait = max(0.0, (level + 1 - (self.size - self.headroom)) / self.leak_rate)
+            self.used = level + 1
+            self.updated_at = now
+            return wait
+
+    def update(self, header):
+        """Sync with a 'used/size' X-Shopify-Shop-Api-Call-Limit header value"""
+        try:
+            used, size = (int(part) for part in header.split('/'))
+        except (AttributeError, ValueError):
+            return
+        with self._lock:
+            self.used = float(used)
+            self.size = size
+            self.updated_at = time.monotonic()
+
+
+class HostStats:
+    """Latency and outcome counters for one upstream host"""
+
+    def __init__(self, sample_size=512):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._samples = deque(maxlen=sample_size)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += 1 if error else 0
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self._samples.append(elapsed_ms)
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))], 2) if samples else None
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "avg_ms": round(self.total_ms / self.requests, 2) if self.requests else None,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms": pick(0.50),
+            "p95_ms": pick(0.95),
+        }
+
+
+class HttpClient:
+    """
+    Shared outbound HTTP client for Shopify and Gemini calls.
+
+    Keeps one keep-alive connection pool per upstream host, applies connect and
+    read timeouts to every call, retries 429/5xx responses and connection
+    failures with jittered exponential backoff (honouring Retry-After), and
+    paces Shopify calls per shop using the API call limit header.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=30.0, max_retries=3, backoff_base=0.5,
+                 backoff_max=8.0, pool_maxsize=20):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._buckets = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _session_for(self, host):
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._sessions[host] = session
+        return session
+
+    def stats_for(self, host):
+        stats = self._stats.get(host)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(host, HostStats())
+        return stats
+
+    def bucket_for(self, shop):
+        bucket = self._buckets.get(shop)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(shop, ShopBucket())
+        return bucket
+
+    def backoff(self, attempt, response=None):
+        """Seconds to wait before retry number `attempt`, honouring the response's Retry-After"""
+        if response is not None and response.headers.get('Retry-After'):
+            try:
+                return min(float(response.headers['Retry-After']), self.backoff_max * 4)
+            except ValueError:
+                pass
+        # Full jitter: anywhere between 0 and the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, shop=None, idempotent=None, **kwargs):
+        """
+        Send an HTTP request through the pooled client
+
+        Args:
+            method (str): HTTP method
+            url (str): Absolute URL
+            shop (str, optional): Shop domain whose Shopify rate limit applies to this call
+            idempotent (bool, optional): Whether 5xx responses may be retried;
+                                         defaults to True for GET/HEAD/OPTIONS/PUT/DELETE
+            **kwargs: Passed through to requests (json, headers, params, ...)
+
+        Returns:
+            requests.Response: The final response (possibly a 429/5xx once retries run out)
+
+        Raises:
+            requests.RequestException: If the request could not be completed after retries
+        """
+        method = method.upper()
+        host = urlparse(url).netloc
+        session = self._session_for(host)
+        stats = self.stats_for(host)
+        kwargs.setdefault('timeout', self.timeout)
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        bucket = self.bucket_for(shop) if shop else None
+
+        attempt = 0
+        while True:
+            if bucket is not None:
+                wait = bucket.acquire()
+                if wait > 0:
+                    stats.throttled += 1
+                    time.sleep(wait)
+
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                elapsed = time.perf_counter() - started
+                stats.record(elapsed * 1000, error=True)
+                metrics.observe_upstream(host, 'error', elapsed)
+                # Connect failures never reached the server, so they are always safe to retry
+                retriable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if attempt >= self.max_retries or not retriable:
+                    raise
+                attempt += 1
+                stats.retries += 1
+                time.sleep(self.backoff(attempt))
+                continue
+
+            elapsed = time.perf_counter() - started
+            stats.record(elapsed * 1000, error=response.status_code >= 500)
+            metrics.observe_upstream(host, response.status_code, elapsed)
+
+            if bucket is not None and 'X-Shopify-Shop-Api-Call-Limit' in response.headers:
+                bucket.update(response.headers['X-Shopify-Shop-Api-Call-Limit'])
+
+            # A 429 was rejected before processing, so even a POST can be replayed
+            retriable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+            if not retriable or attempt >= self.max_retries:
+                return response
+
+            attempt += 1
+            stats.retries += 1
+            delay = self.backoff(attempt, response)
+            logger.warning(f"{method} {host} returned {response.status_code}, retrying in {delay:.2f}s")
+            response.close()
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        """Per-host request counts and latency percentiles"""
+        return {host: stats.snapshot() for host, stats in list(self._stats.items())}
+
+
+http_client = HttpClient(
+    connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05')),
+    read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', '30')),
+    max_retries=int(os.getenv('HTTP_MAX_RETRIES', '3')),
+    pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', '20')),
+)
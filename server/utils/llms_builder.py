@@ -0,0 +1,156 @@
+import hashlib
+import logging
+from datetime import datetime
+
+from models.model import db, LlmsSchema, LlmsChunk
+from utils.shops import shop_id_for
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024      # characters per stored LlmsChunk row
+CHUNKS_PER_COMMIT = 16      # chunk rows written per INSERT / commit
+
+
+def iter_llms_lines(shop_url, products):
+    """
+    Render llms.txt as a stream of text pieces
+
+    Args:
+        shop_url (str): The shop the document describes
+        products (iterable): Dicts with 'title' and 'url' keys
+
+    Yields:
+        str: Newline-terminated pieces of the document
+    """
+    yield "# llms.txt\n"
+    yield "# Auto-generated for LLM content discovery\n"
+    yield f"Shop: {shop_url}\n"
+    for product in products:
+        yield "\n"
+        yield f"- title: {product['title']}\n"
+        yield f"  url: {product['url']}\n"
+
+
+def render_llms(shop_url, products):
+    """Render a small llms.txt document in one string"""
+    return "".join(iter_llms_lines(shop_url, products))
+
+
+def shopify_products_for_llms(shop_url, products):
+    """Map Shopify product dicts to the {title, url} shape llms.txt uses"""
+    domain = shop_url.replace('https://', '').replace('http://', '').rstrip('/')
+    for product in products:
+        yield {
+            "title": product['title'],
+            "url": f"https://{domain}/products/{product['handle']}"
+        }
+
+
+def chunk_pieces(pieces, chunk_size=CHUNK_SIZE):
+    """Regroup a stream of small text pieces into chunks of about `chunk_size` characters"""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+class _Counter:
+    """Pass-through iterator that counts the items it yields"""
+
+    def __init__(self, iterable):
+        self._iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for item in self._iterable:
+            self.count += 1
+            yield item
+
+
+def write_llms_streaming(shop_url, products, chunk_size=CHUNK_SIZE, chunks_per_commit=CHUNKS_PER_COMMIT):
+    """
+    Generate and store a new llms.txt version without holding it in memory
+
+    The version row is created first with no updated_at, chunks are inserted in
+    small batches as the product stream is consumed, and updated_at is only set
+    once every chunk is written, so readers never see a partial document.
+
+    Args:
+        shop_url (str): The shop the document belongs to
+        products (iterable): Dicts with 'title' and 'url' keys, consumed lazily
+
+    Returns:
+        LlmsSchema: The completed version row
+    """
+    llms = LlmsSchema(shop_url=shop_url, shop_id=shop_id_for(shop_url), content=None,
+                      created_at=datetime.utcnow())
+    db.session.add(llms)
+    db.session.commit()
+    llms_id = llms.id
+
+    counted = _Counter(products)
+    digest = hashlib.sha256()
+    size_bytes = 0
+    pending = []
+    seq = 0
+
+    try:
+        for chunk in chunk_pieces(iter_llms_lines(shop_url, counted), chunk_size):
+            encoded = chunk.encode('utf-8')
+            digest.update(encoded)
+            size_bytes += len(encoded)
+            pending.append({"llms_id": llms_id, "seq": seq, "content": chunk})
+            seq += 1
+            if len(pending) >= chunks_per_commit:
+                db.session.execute(db.insert(LlmsChunk), pending)
+                db.session.commit()
+                pending = []
+        if pending:
+            db.session.execute(db.insert(LlmsChunk), pending)
+
+        llms = db.session.get(LlmsSchema, llms_id)
+        llms.content_hash = digest.hexdigest()
+        llms.size_bytes = size_bytes
+        llms.product_count = counted.count
+        llms.updated_at = datetime.utcnow()
+        db.session.commit()
+        return llms
+    except Exception:
+        db.session.rollback()
+        LlmsChunk.query.filter_by(llms_id=llms_id).delete()
+        LlmsSchema.query.filter_by(id=llms_id).delete()
+        db.session.commit()
+        raise
+
+
+def iter_llms_content(llms, batch_size=CHUNKS_PER_COMMIT):
+    """
+    Yield a stored llms.txt version as encoded bytes
+
+    Inline documents are yielded in one piece; chunked documents are read a
+    few chunk rows at a time.
+    """
+    if llms.content is not None:
+        yield llms.content.encode('utf-8')
+        return
+
+    seq = 0
+    while True:
+        rows = db.session.execute(
+            db.select(LlmsChunk.seq, LlmsChunk.content)
+            .where(LlmsChunk.llms_id == llms.id, LlmsChunk.seq >= seq)
+            .order_by(LlmsChunk.seq)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        for row in rows:
+            yield row.content.encode('utf-8')
+        seq = rows[-1].seq + 1
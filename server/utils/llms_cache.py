@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timezone
+
+# path is set instead of body for versions served from disk (utils/llms_files.py)
+CachedLlms = namedtuple('CachedLlms', ['body', 'etag', 'last_modified', 'loaded_at', 'path'], defaults=(None,))
+
+
+class LlmsCache:
+    """
+    Bounded LRU cache of the latest llms.txt per shop.
+
+    Bodies are stored pre-encoded together with a content-hash ETag and the
+    version's Last-Modified time, so serving a cached entry needs no database
+    access or re-encoding. Entries expire after `ttl` seconds so that versions
+    generated by another worker process are picked up eventually; the process
+    that writes a new version invalidates its own entry immediately. When
+    llms.txt is served from disk (LLMS_SERVE_MODE), entries hold the file's
+    path instead of the body.
+    """
+
+    def __init__(self, app=None, max_entries=1024, ttl=300, max_age=3600, max_entry_bytes=1024 * 1024):
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = int(app.config.get('LLMS_CACHE_SIZE', self.max_entries))
+        self.ttl = float(app.config.get('LLMS_CACHE_TTL', self.ttl))
+        self.max_age = int(app.config.get('LLMS_CACHE_MAX_AGE', self.max_age))
+        self.max_entry_bytes = int(app.config.get('LLMS_CACHE_MAX_ENTRY_BYTES', self.max_entry_bytes))
+        app.extensions['llms_cache'] = self
+
+    def get(self, shop_url):
+        """Return the cached entry for a shop, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(shop_url)
+            if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+                self._entries.move_to_end(shop_url)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[shop_url]
+            self.misses += 1
+            return None
+
+    def put(self, shop_url, content, updated_at, etag=None):
+        """
+        Encode and cache a shop's llms.txt
+
+        Args:
+            shop_url (str): The shop the document belongs to
+            content (str or bytes): The llms.txt body
+            updated_at (datetime): When this version was written (naive UTC)
+            etag (str, optional): Precomputed content hash; derived from the body if omitted
+
+        Returns:
+            CachedLlms: The cached entry
+        """
+        body = content if isinstance(content, bytes) else (content or '').encode('utf-8')
+        entry = CachedLlms(
+            body=body,
+            etag=(etag or hashlib.sha256(body).hexdigest())[:32],
+            last_modified=updated_at.replace(tzinfo=timezone.utc) if updated_at else None,
+            loaded_at=time.monotonic()
+        )
+        return self._store(shop_url, entry)
+
+    def _store(self, shop_url, entry):
+        with self._lock:
+            self._entries[shop_url] = entry
+            self._entries.move_to_end(shop_url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def put_file(self, shop_url, path, updated_at, etag):
+        """Cache where a shop's materialized llms.txt lives (see put)"""
+        entry = CachedLlms(
+            body=None,
+            etag=etag[:32],
+            last_modified=updated_at.replace(tzinfo=timezone.utc) if updated_at else None,
+            loaded_at=time.monotonic(),
+            path=path
+        )
+        return self._store(shop_url, entry)
+
+    def invalidate(self, shop_url):
+        with self._lock:
+            self._entries.pop(shop_url, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "capacity": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+
+llms_cache = LlmsCache()
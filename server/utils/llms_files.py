@@ -0,0 +1,214 @@
+"""
+llms.txt versions materialized on disk.
+
+With LLMS_SERVE_MODE set to anything but 'cache', each llms.txt version is
+written once to LLMS_FILES_DIR/<shop>/<etag>.txt together with a gzip
+variant (<etag>.txt.gz), and serve_llms only resolves the shop to that path.
+The bytes then go from disk to the socket without passing through Python:
+
+- 'sendfile': the WSGI server's file wrapper (sendfile(2) under gunicorn)
+- 'x-accel-redirect': nginx serves LLMS_ACCEL_PREFIX/<shop>/<etag>.txt from
+  an internal location (`gzip_static on` picks the .gz for gzip clients)
+- 'x-sendfile': Apache mod_xsendfile / lighttpd serve the absolute path
+
+Files are written to a temporary name in the shop's directory, fsynced and
+renamed into place (the .gz first), so a reader never sees a partial file.
+Names are content hashes, so a version is never rewritten in place; the
+LLMS_FILES_KEEP newest versions of a shop are kept so that paths resolved
+by other workers shortly before a new version stay valid.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from calendar import timegm
+
+from flask import Response, request
+from werkzeug.utils import send_file
+
+from utils.llms_builder import iter_llms_content
+from utils.shops import shop_domain
+
+logger = logging.getLogger(__name__)
+
+SERVE_MODES = ('cache', 'sendfile', 'x-accel-redirect', 'x-sendfile')
+
+# The process umask, read once at import (setting it is the only way to read it, and not thread-safe)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# mkstemp creates 0600 files; the front proxy usually runs as another user and must be able to read them
+FILE_MODE = 0o644 & ~_UMASK
+
+
+def _shop_dir_name(shop_url):
+    """A shop's directory name: its domain with anything unusual replaced; None if unusable"""
+    name = re.sub(r'[^a-z0-9.-]', '_', shop_domain(shop_url) or '')
+    return name if name.strip('.') else None
+
+
+class LlmsFiles:
+    """
+    Writes llms.txt versions to disk and builds responses that serve them.
+
+    See the module docstring for the layout and serving modes.
+    """
+
+    def __init__(self, app=None, root=None, serve_mode='cache', accel_prefix='/_llms/', keep=3, gzip_level=9):
+        self.root = root
+        self.serve_mode = serve_mode
+        self.accel_prefix = accel_prefix
+        self.keep = keep
+        self.gzip_level = gzip_level
+        self.materialized = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.serve_mode = app.config.get('LLMS_SERVE_MODE', self.serve_mode)
+        if self.serve_mode not in SERVE_MODES:
+            raise ValueError(f"LLMS_SERVE_MODE must be one of {', '.join(SERVE_MODES)}")
+        self.root = os.path.abspath(app.config.get('LLMS_FILES_DIR')
+                                    or self.root or os.path.join(app.instance_path, 'llms'))
+        self.accel_prefix = '/' + app.config.get('LLMS_ACCEL_PREFIX', self.accel_prefix).strip('/') + '/'
+        self.keep = max(1, int(app.config.get('LLMS_FILES_KEEP', self.keep)))
+        app.extensions['llms_files'] = self
+
+    @property
+    def enabled(self):
+        return self.serve_mode != 'cache'
+
+    def directory_for(self, shop_url):
+        """A shop's directory under root; None for shops without a usable name"""
+        name = _shop_dir_name(shop_url)
+        return os.path.join(self.root, name) if name else None
+
+    def path_for(self, shop_url, etag):
+        """Where a shop's version with this etag lives (it may not be written yet)"""
+        directory = self.directory_for(shop_url)
+        return os.path.join(directory, f"{etag}.txt") if directory else None
+
+    def materialize(self, llms):
+        """
+        Write a stored version to disk unless it is already there
+
+        The document is streamed from the database chunk by chunk into the
+        plain and gzip files at once, so it is never held in memory whole.
+
+        Args:
+            llms (LlmsSchema): A completed version
+
+        Returns:
+            str: Path of the plain file, or None if the shop has no usable name
+        """
+        if llms.content_hash:
+            path = self.path_for(llms.shop_url, llms.content_hash[:32])
+            if path is None or os.path.exists(path):
+                return path
+
+        directory = self.directory_for(llms.shop_url)
+        if directory is None:
+            return None
+        os.makedirs(directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.llms-', suffix='.tmp')
+        tmp_gz_path = tmp_path + '.gz'
+        try:
+            os.fchmod(fd, FILE_MODE)
+            with os.fdopen(fd, 'wb') as plain, open(tmp_gz_path, 'wb') as raw_gz:
+                os.fchmod(raw_gz.fileno(), FILE_MODE)
+                # mtime=0 keeps the .gz identical for identical content
+                with gzip.GzipFile(fileobj=raw_gz, mode='wb', compresslevel=self.gzip_level, mtime=0) as compressed:
+                    for piece in iter_llms_content(llms):
+                        digest.update(piece)
+                        plain.write(piece)
+                        compressed.write(piece)
+                for handle in (plain, raw_gz):
+                    handle.flush()
+                    os.fsync(handle.fileno())
+
+            path = os.path.join(directory, f"{digest.hexdigest()[:32]}.txt")
+            if llms.updated_at:
+                # Last-Modified from the front proxy then matches the version, on every host
+                modified = timegm(llms.updated_at.timetuple())
+                os.utime(tmp_path, (modified, modified))
+                os.utime(tmp_gz_path, (modified, modified))
+            os.replace(tmp_gz_path, path + '.gz')
+            os.replace(tmp_path, path)
+        except BaseException:
+            for leftover in (tmp_path, tmp_gz_path):
+                try:
+                    os.remove(leftover)
+                except FileNotFoundError:
+                    pass
+            raise
+
+        self.materialized += 1
+        self.prune(directory, keep_path=path)
+        return path
+
+    def prune(self, directory, keep_path=None):
+        """Delete all but the `keep` most recently written versions in a shop's directory"""
+        now = time.time()
+        versions = []
+        for name in os.listdir(directory):
+            full = os.path.join(directory, name)
+            # Other workers prune the same directory; a file gone by now was removed by one of them
+            try:
+                if name.endswith('.txt'):
+                    versions.append((os.stat(full).st_ctime, full))
+                elif name.startswith('.llms-') and now - os.stat(full).st_mtime > 3600:
+                    # Left behind by a writer that died mid-write
+                    os.remove(full)
+            except FileNotFoundError:
+                pass
+        versions.sort(reverse=True)
+        for _, full in versions[self.keep:]:
+            if full == keep_path:
+                continue
+            for stale in (full, full + '.gz'):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    def response(self, entry, max_age):
+        """
+        Serve a materialized version according to serve_mode
+
+        Args:
+            entry (CachedLlms): Entry with the file path, etag and last-modified time
+            max_age (int): Cache-Control max-age in seconds
+        """
+        path = entry.path
+        if self.serve_mode == 'x-accel-redirect':
+            # nginx sends the file (and answers ranges) from the internal location; the body stays empty
+            relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+            response = Response(mimetype='text/plain')
+            response.headers['X-Accel-Redirect'] = self.accel_prefix + relative
+            response.set_etag(entry.etag)
+            response.last_modified = entry.last_modified
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            return response.make_conditional(request)
+
+        encoding, etag = None, entry.etag
+        if request.accept_encodings['gzip'] and os.path.exists(path + '.gz'):
+            # A different representation, so a different ETag: ranges and 304s must never mix the two
+            path, encoding, etag = path + '.gz', 'gzip', f"{entry.etag}-gzip"
+        response = send_file(path, request.environ, mimetype='text/plain', etag=etag,
+                             download_name=os.path.basename(entry.path), last_modified=entry.last_modified,
+                             max_age=max_age, use_x_sendfile=self.serve_mode == 'x-sendfile')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.cache_control.public = True
+        return response
+
+
+llms_files = LlmsFiles()
@@ -0,0 +1,321 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seconds; tuned for a service whose hot paths answer in well under 10 ms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# In-process LRU/TTL caches registered in app.extensions that keep hits, misses and _entries
+CACHE_EXTENSIONS = ('llms_cache', 'script_cache', 'settings_cache')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(labels, (list(entry[0]), entry[1], entry[2])) for labels, entry in self._values.items()]
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Collected:
+    """
+    Metric whose labelled values are read from a callback at scrape time,
+    for numbers another object already keeps (cache hits, queue depth)
+    """
+
+    def __init__(self, name, help, labelnames=(), collect=None, kind='gauge'):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        try:
+            values = self.collect() or {}
+        except Exception:
+            # A failing source must not break the whole scrape
+            return []
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                for labels, value in values.items() if value is not None]
+
+
+class _RequestState(threading.local):
+    """Per-thread totals for the request being served on this thread"""
+    active = False
+    queries = 0
+    db_seconds = 0.0
+    upstream_calls = 0
+    upstream_seconds = 0.0
+
+
+class Metrics:
+    """
+    In-process metrics in the Prometheus text format, served on /metrics.
+
+    Records per-route request latency, SQLAlchemy query count and time per
+    request, outbound HTTP calls per upstream host, and reads cache hit
+    counts and queue depths from the app's extensions when scraped. Values
+    are per process: with several gunicorn workers each one reports its own,
+    so scrape every worker or sum them.
+
+    The request hooks only take a timestamp and update one histogram, so the
+    cost on hot paths such as /track stays in the microseconds.
+    """
+
+    def __init__(self, app=None):
+        self._metrics = []
+        self._state = _RequestState()
+        self._app = None
+        self.enabled = True
+        self.startup_seconds = None
+
+        self.request_latency = self.histogram(
+            'http_request_duration_seconds', 'Request latency by route', ('endpoint', 'method', 'status'))
+        self.request_queries = self.histogram(
+            'http_request_db_queries', 'SQL statements executed per request', ('endpoint',),
+            buckets=QUERY_COUNT_BUCKETS)
+        self.request_db_time = self.histogram(
+            'http_request_db_seconds', 'Time spent in SQL statements per request', ('endpoint',))
+        self.request_upstream_time = self.histogram(
+            'http_request_upstream_seconds', 'Time spent in outbound HTTP calls per request', ('endpoint',))
+        self.db_queries = self.counter('db_queries_total', 'SQL statements executed, including background threads')
+        self.db_seconds = self.counter('db_query_seconds_total', 'Time spent in SQL statements')
+        self.upstream_latency = self.histogram(
+            'upstream_request_duration_seconds', 'Outbound HTTP call latency by upstream host', ('host', 'status'))
+        self.collected('cache_lookups_total', 'Cache lookups by cache and result (hit ratio = hit / (hit + miss))',
+                       ('cache', 'result'), self._collect_cache_lookups, kind='counter')
+        self.collected('cache_entries', 'Entries currently held by each in-process cache', ('cache',),
+                       self._collect_cache_entries)
+        self.collected('queue_depth', 'Items waiting in background queues', ('queue',), self._collect_queue_depths)
+        self.collected('analytics_ingest_hits_total', 'Crawler hits through the ingest buffer by outcome',
+                       ('outcome',), self._collect_analytics_ingest, kind='counter')
+        self.collected('app_startup_seconds', 'Time create_app took to build this worker\'s app', (),
+                       lambda: {(): self.startup_seconds})
+
+        if app is not None:
+            self.init_app(app)
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def collected(self, name, help, labelnames=(), collect=None, kind='gauge'):
+        return self._register(Collected(name, help, labelnames, collect, kind))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def init_app(self, app):
+        self._app = app
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', self.serve)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def _before_request(self):
+        state = self._state
+        state.active = True
+        state.queries = 0
+        state.db_seconds = 0.0
+        state.upstream_calls = 0
+        state.upstream_seconds = 0.0
+        state.started = time.perf_counter()
+
+    def _after_request(self, response):
+        state = self._state
+        if state.active:
+            # Resolve the request proxy once; each proxied attribute access costs microseconds
+            current = request._get_current_object()
+            endpoint = current.endpoint or 'unmatched'
+            self.request_latency.observe((endpoint, current.method, response.status_code),
+                                         time.perf_counter() - state.started)
+            self.request_queries.observe((endpoint,), state.queries)
+            if state.queries:
+                self.request_db_time.observe((endpoint,), state.db_seconds)
+            if state.upstream_calls:
+                self.request_upstream_time.observe((endpoint,), state.upstream_seconds)
+            state.active = False
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request does not run when a view raises; count those as 500s
+        state = self._state
+        if state.active:
+            self.request_latency.observe((request.endpoint or 'unmatched', request.method, 500),
+                                         time.perf_counter() - state.started)
+            state.active = False
+
+    def observe_query(self, seconds):
+        self.db_queries.inc()
+        self.db_seconds.inc(amount=seconds)
+        state = self._state
+        if state.active:
+            state.queries += 1
+            state.db_seconds += seconds
+
+    def observe_upstream(self, host, status, seconds):
+        """Record one outbound HTTP attempt (status is 'error' when no response arrived)"""
+        self.upstream_latency.observe((host, status), seconds)
+        self.observe_request_upstream(seconds)
+
+    def observe_request_upstream(self, seconds):
+        """Charge time spent waiting on an upstream to the request served on this thread"""
+        state = self._state
+        if state.active:
+            state.upstream_calls += 1
+            state.upstream_seconds += seconds
+
+    def _extensions(self):
+        return self._app.extensions if self._app is not None else {}
+
+    def _collect_cache_lookups(self):
+        extensions = self._extensions()
+        values = {}
+        for name in CACHE_EXTENSIONS:
+            cache = extensions.get(name)
+            if cache is not None:
+                values[(name, 'hit')] = cache.hits
+                values[(name, 'miss')] = cache.misses
+        from utils.gemini_cache import generation_cache
+        values[('gemini_cache', 'hit')] = generation_cache.hits
+        values[('gemini_cache', 'miss')] = generation_cache.misses
+        from utils.bot_classifier import classify
+        info = classify.cache_info()
+        values[('bot_classifier', 'hit')] = info.hits
+        values[('bot_classifier', 'miss')] = info.misses
+        return values
+
+    def _collect_cache_entries(self):
+        extensions = self._extensions()
+        return {(name,): len(extensions[name]._entries) for name in CACHE_EXTENSIONS if name in extensions}
+
+    def _collect_queue_depths(self):
+        extensions = self._extensions()
+        values = {}
+        if 'analytics_buffer' in extensions:
+            values[('analytics_buffer',)] = extensions['analytics_buffer'].depth()
+        if 'seo_regen' in extensions:
+            values[('seo_regen',)] = extensions['seo_regen'].depth()
+        if 'seo_jobs' in extensions:
+            values[('seo_jobs',)] = extensions['seo_jobs'].queued
+        return values
+
+    def _collect_analytics_ingest(self):
+        buffer = self._extensions().get('analytics_buffer')
+        if buffer is None:
+            return {}
+        return {(outcome,): getattr(buffer, outcome) for outcome in ('enqueued', 'dropped', 'flushed', 'failed')}
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self):
+        return Response(self.render(), content_type=CONTENT_TYPE)
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None:
+        metrics.observe_query(time.perf_counter() - started)
@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+
+from models.model import (db, ShopifyStore, LlmsSchema, SeoSchema, AnalyticsSchema, AnalyticsRollup,
+                          ProductMirror, WebhookEvent, SeoJob, SeoRegenRequest)
+
+SAMPLE_SHOP = 'example.myshopify.com'
+
+
+def hot_queries():
+    """
+    The lookups behind each hot endpoint, paired with the index each must use
+
+    Returns:
+        list: (name, select statement, expected index name or None for "any index")
+    """
+    now = datetime.utcnow()
+    return [
+        ("serve_llms",
+         db.select(LlmsSchema.id)
+         .where(LlmsSchema.shop_url == SAMPLE_SHOP, LlmsSchema.updated_at.isnot(None))
+         .order_by(LlmsSchema.updated_at.desc())
+         .limit(1),
+         'ix_llms_schema_shop_updated'),
+        ("get_analytics",
+         db.select(AnalyticsRollup.id)
+         .where(AnalyticsRollup.shop_url == SAMPLE_SHOP,
+                AnalyticsRollup.granularity == 'day',
+                AnalyticsRollup.bucket_start >= now - timedelta(days=30),
+                AnalyticsRollup.bucket_start < now)
+         .order_by(AnalyticsRollup.bucket_start, AnalyticsRollup.id)
+         .limit(101),
+         'ix_analytics_rollup_shop_bucket'),
+        ("analytics_raw_range",
+         db.select(AnalyticsSchema.id)
+         .where(AnalyticsSchema.shop_url == SAMPLE_SHOP,
+                AnalyticsSchema.timestamp >= now - timedelta(days=1))
+         .order_by(AnalyticsSchema.timestamp),
+         'ix_analytics_schema_shop_timestamp'),
+        ("compaction_fold",
+         db.select(AnalyticsSchema.id)
+         .where(AnalyticsSchema.rolled_up == db.false(),
+                AnalyticsSchema.timestamp < now - timedelta(days=90))
+         .order_by(AnalyticsSchema.timestamp, AnalyticsSchema.id)
+         .limit(5000),
+         'ix_analytics_schema_rolled_up_timestamp'),
+        ("hourly_rollup_prune",
+         db.select(AnalyticsRollup.id)
+         .where(AnalyticsRollup.granularity == 'hour',
+                AnalyticsRollup.bucket_start < now - timedelta(days=180))
+         .order_by(AnalyticsRollup.bucket_start)
+         .limit(5000),
+         'ix_analytics_rollup_granularity_bucket'),
+        ("token_lookup",
+         db.select(ShopifyStore.access_token)
+         .where(ShopifyStore.shop_url.in_([SAMPLE_SHOP, f"https://{SAMPLE_SHOP}"])),
+         None),
+        ("latest_product_schema",
+         db.select(SeoSchema.id)
+         .where(SeoSchema.shop_url == SAMPLE_SHOP, SeoSchema.product_id == '1')
+         .order_by(SeoSchema.updated_at.desc())
+         .limit(1),
+         'ix_seo_schema_shop_product_updated'),
+        # Any index: the unique constraint's index is named differently per dialect
+        ("mirror_page",
+         db.select(ProductMirror.product_id, ProductMirror.description)
+         .where(ProductMirror.shop_url == SAMPLE_SHOP, ProductMirror.product_id > '1000')
+         .order_by(ProductMirror.product_id)
+         .limit(1000),
+         None),
+        ("mirror_watermark",
+         db.select(db.func.max(ProductMirror.updated_at))
+         .where(ProductMirror.shop_url == SAMPLE_SHOP),
+         'ix_product_mirror_shop_updated'),
+        ("webhook_drain",
+         db.select(WebhookEvent.id)
+         .where(db.or_(db.and_(WebhookEvent.status == 'pending', WebhookEvent.next_attempt_at <= now),
+                       db.and_(WebhookEvent.status == 'processing', WebhookEvent.locked_until < now)))
+         .order_by(WebhookEvent.next_attempt_at, WebhookEvent.id)
+         .limit(50),
+         'ix_webhook_event_status_next_attempt'),
+        ("seo_job_recovery",
+         db.select(SeoJob.id)
+         .where(SeoJob.status.in_(('queued', 'running')), SeoJob.heartbeat_at < now - timedelta(minutes=5))
+         .limit(100),
+         'ix_seo_job_status_heartbeat'),
+        ("seo_regen_due",
+         db.select(SeoRegenRequest.id)
+         .where(SeoRegenRequest.due_at <= now)
+         .order_by(SeoRegenRequest.due_at)
+         .limit(500),
+         'ix_seo_regen_request_due_at'),
+    ]
+
+
+def _explain(conn, statement):
+    """
+    Run the dialect's EXPLAIN for a statement
+
+    Returns:
+        tuple: (indexes used, whether any table was scanned without an index, plan text)
+    """
+    dialect = conn.dialect.name
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+
+    if dialect == 'sqlite':
+        details = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+        indexes = set()
+        full_scan = False
+        for detail in details:
+            # "SEARCH t USING INDEX ix (...)" is a seek; "SCAN t [USING INDEX ix]" reads it all
+            if detail.startswith('SEARCH ') and 'INDEX ' in detail:
+                indexes.add(detail.split('INDEX ', 1)[1].split(' ', 1)[0])
+            elif detail.startswith('SCAN '):
+                full_scan = True
+        return indexes, full_scan, "\n".join(details)
+
+    if dialect == 'mysql':
+        rows = conn.exec_driver_sql(f"EXPLAIN {sql}").mappings().all()
+        indexes = {row['key'] for row in rows if row['key']}
+        full_scan = any(row['type'] == 'ALL' for row in rows)
+        return indexes, full_scan, "\n".join(str(dict(row)) for row in rows)
+
+    raise click.ClickException(f"Query plan checks are not implemented for {dialect}")
+
+
+def check_query_plans():
+    """
+    Assert that each hot query is served by its index
+
+    Returns:
+        list: Dicts with name, ok, indexes and plan for every checked query
+    """
+    results = []
+    with db.engine.connect() as conn:
+        for name, statement, expected in hot_queries():
+            indexes, full_scan, plan = _explain(conn, statement)
+            ok = not full_scan and bool(indexes) and (expected is None or expected in indexes)
+            results.append({"name": name, "ok": ok, "expected": expected,
+                            "indexes": sorted(indexes), "plan": plan})
+    return results
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print the full plan for every query.')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """Fail if a hot lookup would scan its table instead of using its index."""
+    results = check_query_plans()
+    for result in results:
+        status = 'ok  ' if result["ok"] else 'FAIL'
+        click.echo(f"{status} {result['name']}: {', '.join(result['indexes']) or 'no index'}"
+                   + (f" (expected {result['expected']})" if not result["ok"] and result["expected"] else ""))
+        if verbose or not result["ok"]:
+            click.echo("     " + result["plan"].replace("\n", "\n     "))
+
+    if not all(result["ok"] for result in results):
+        raise SystemExit(1)
@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+RenderedScript = namedtuple('RenderedScript', ['etag', 'identity', 'gzip', 'br', 'loaded_at'])
+
+
+def render_script(json_ld):
+    """Wrap JSON-LD in a script tag, escaping '</' so the payload cannot close the tag early"""
+    payload = (json_ld or '').strip().replace('</', '<\\/')
+    return f'<script type="application/ld+json">{payload}</script>\n'
+
+
+class ScriptCache:
+    """
+    Bounded LRU of rendered JSON-LD script responses.
+
+    Each entry holds the rendered body plus gzip (and brotli, when installed)
+    variants compressed once per version, so requests only pick the right
+    bytes. Keys are (shop, product_id); product_id None stands for the
+    shop's most recent schema. Lookups that found nothing are cached as None
+    for `negative_ttl` seconds.
+    """
+
+    def __init__(self, app=None, max_entries=5000, ttl=300, negative_ttl=60, max_age=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = int(app.config.get('SCRIPT_TAG_CACHE_SIZE', self.max_entries))
+        self.ttl = float(app.config.get('SCRIPT_TAG_CACHE_TTL', self.ttl))
+        self.max_age = int(app.config.get('SCRIPT_TAG_MAX_AGE', self.max_age))
+        app.extensions['script_cache'] = self
+
+    def get(self, shop_url, product_id=None):
+        """
+        Returns:
+            tuple: (found, entry) where entry is None for a cached "no schema" result
+        """
+        key = (shop_url, product_id)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                entry, expires_at = item
+                if time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def _store(self, key, entry, ttl):
+        with self._lock:
+            self._entries[key] = (entry, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def put(self, shop_url, product_id, json_ld):
+        """Render and compress a schema version and cache it"""
+        body = render_script(json_ld).encode('utf-8')
+        entry = RenderedScript(
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            identity=body,
+            gzip=gzip.compress(body, compresslevel=9),
+            br=brotli.compress(body) if brotli else None,
+            loaded_at=time.monotonic()
+        )
+        self._store((shop_url, product_id), entry, self.ttl)
+        return entry
+
+    def put_missing(self, shop_url, product_id=None):
+        self._store((shop_url, product_id), None, self.negative_ttl)
+
+    def publish(self, shop_url, product_id, json_ld, prerender=True):
+        """
+        Called when a new schema is written: pre-render it for the product and
+        drop the shop-level "latest" entry so it is rebuilt on next request.
+
+        With prerender=False (bulk writers) only products that are already
+        cached are re-rendered, so a catalog-wide job does not flush the
+        entries storefronts are actually requesting.
+        """
+        key = (shop_url, str(product_id))
+        with self._lock:
+            cached = key in self._entries
+        if prerender or cached:
+            self.put(shop_url, str(product_id), json_ld)
+        with self._lock:
+            self._entries.pop((shop_url, None), None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "capacity": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "brotli": brotli is not None,
+        }
+
+
+script_cache = ScriptCache()
@@ -0,0 +1,258 @@
+"""
+Fleet-wide script tag rollouts.
+
+A rollout walks every active shop with an access token and reconciles its
+script tags with reconcile_script_tags: shops already loading the script
+are left alone, our tags with an old src (any of the managed prefixes) are
+repointed, missing tags are created and duplicates are removed. Running the
+same rollout again is therefore cheap and changes nothing.
+
+Shops are handled concurrently by a bounded worker pool, one shop per
+worker at a time; every call goes through the shared HTTP client with the
+shop's rate limit bucket. Per-shop results are written in batches and the
+rollout's counters are updated with each batch, so progress can be polled.
+"""
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models.model import db, ShopifyStore, ScriptTagRollout, ScriptTagRolloutShop
+from utils.shopify_api import reconcile_script_tags, ShopifyAPIError
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ('created', 'updated', 'unchanged', 'failed')
+
+
+def _target_shops():
+    """Active shops that have a token, as (shop_url, access_token) rows"""
+    return db.select(ShopifyStore.shop_url, ShopifyStore.access_token).where(
+        ShopifyStore.is_active == db.true(), ShopifyStore.access_token.isnot(None))
+
+
+def _reconcile_shop(shop_url, access_token, script_url, prefixes, dry_run):
+    """Reconcile one shop; never raises, failures become a 'failed' result"""
+    try:
+        result = reconcile_script_tags(shop_url, access_token, script_url, prefixes, dry_run=dry_run)
+        tag = result["script_tag"] or {}
+        return {"shop_url": shop_url, "action": result["action"], "deleted": result["deleted"],
+                "script_tag_id": str(tag['id']) if tag.get('id') else None, "error": None}
+    except ShopifyAPIError as e:
+        error = f"Shopify API error {e.status_code}: {e.body}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)}"
+    logger.warning(f"Script tag rollout failed for {shop_url}: {error}")
+    return {"shop_url": shop_url, "action": 'failed', "deleted": 0, "script_tag_id": None, "error": error[:2000]}
+
+
+class ScriptTagRolloutRunner:
+    """
+    Runs script tag rollouts in the background.
+
+    Rollouts run one at a time, each fanning its shops out over the shared
+    worker pool (see the module docstring).
+    """
+
+    def __init__(self, app=None, workers=16, flush_every=100, managed_prefixes=()):
+        self.workers = workers
+        self.flush_every = flush_every
+        self.managed_prefixes = tuple(managed_prefixes)
+        self._app = None
+        self._pool = None
+        self._coordinator = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.workers = int(app.config.get('ROLLOUT_WORKERS', self.workers))
+        self.flush_every = int(app.config.get('ROLLOUT_FLUSH_EVERY', self.flush_every))
+        self.managed_prefixes = tuple(app.config.get('SCRIPT_TAG_MANAGED_PREFIXES', self.managed_prefixes))
+        app.extensions['script_tag_rollout'] = self
+
+    def _executors(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='rollout-worker')
+                self._coordinator = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rollout')
+            return self._pool, self._coordinator
+
+    def create(self, script_url, replace_prefixes=(), dry_run=False):
+        """
+        Record a rollout of script_url to every active shop
+
+        Args:
+            script_url (str): The src every shop should load
+            replace_prefixes (tuple): src prefixes of our tags to replace, on top of
+                                      SCRIPT_TAG_MANAGED_PREFIXES
+            dry_run (bool): Only work out what would change
+
+        Returns:
+            ScriptTagRollout: The queued rollout
+        """
+        prefixes = sorted(set(self.managed_prefixes) | set(replace_prefixes))
+        total = db.session.scalar(db.select(db.func.count()).select_from(_target_shops().subquery()))
+        rollout = ScriptTagRollout(id=uuid.uuid4().hex, script_url=script_url, managed_prefixes=json.dumps(prefixes),
+                                   dry_run=dry_run, status='queued', total=total, created=0, updated=0,
+                                   unchanged=0, failed=0, deleted=0, created_at=datetime.utcnow())
+        db.session.add(rollout)
+        db.session.commit()
+        return rollout
+
+    def submit(self, script_url, replace_prefixes=(), dry_run=False):
+        """Queue a rollout in the background (see create); returns its ScriptTagRollout row"""
+        rollout = self.create(script_url, replace_prefixes, dry_run)
+        _, coordinator = self._executors()
+        coordinator.submit(self._run_in_context, rollout.id)
+        return rollout
+
+    def _run_in_context(self, rollout_id):
+        with self._app.app_context():
+            try:
+                self.run(rollout_id)
+            finally:
+                db.session.remove()
+
+    def run(self, rollout_id, progress=None):
+        """
+        Run a recorded rollout to completion, coordinating from this thread
+
+        Args:
+            rollout_id (str): The rollout to run
+            progress (callable, optional): Called with the rollout after each flush
+
+        Returns:
+            ScriptTagRollout: The finished rollout (completed or failed)
+        """
+        rollout = db.session.get(ScriptTagRollout, rollout_id)
+        script_url, dry_run = rollout.script_url, rollout.dry_run
+        prefixes = tuple(json.loads(rollout.managed_prefixes or '[]'))
+        rollout.status = 'running'
+        rollout.started_at = datetime.utcnow()
+        db.session.commit()
+
+        pool, _ = self._executors()
+        inflight = set()
+        pending = []
+
+        def flush():
+            if not pending:
+                return
+            now = datetime.utcnow()
+            db.session.execute(db.insert(ScriptTagRolloutShop),
+                               [dict(result, rollout_id=rollout_id, finished_at=now) for result in pending])
+            rollout = db.session.get(ScriptTagRollout, rollout_id)
+            for action in ACTIONS:
+                setattr(rollout, action, getattr(rollout, action)
+                        + sum(1 for result in pending if result["action"] == action))
+            rollout.deleted += sum(result["deleted"] for result in pending)
+            db.session.commit()
+            pending.clear()
+            if progress:
+                progress(rollout)
+
+        def collect(done):
+            for future in done:
+                inflight.discard(future)
+                pending.append(future.result())
+            if len(pending) >= self.flush_every:
+                flush()
+
+        try:
+            # Read up front so no cursor stays open while results are written
+            shops = db.session.execute(_target_shops().order_by(ShopifyStore.id)).all()
+            db.session.commit()
+            for shop_url, access_token in shops:
+                if len(inflight) >= self.workers * 2:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                inflight.add(pool.submit(_reconcile_shop, shop_url, access_token, script_url, prefixes, dry_run))
+            while inflight:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                collect(done)
+            flush()
+            rollout = db.session.get(ScriptTagRollout, rollout_id)
+            rollout.status = 'completed'
+        except Exception as e:
+            logger.error(f"Script tag rollout {rollout_id} failed: {str(e)}")
+            db.session.rollback()
+            rollout = db.session.get(ScriptTagRollout, rollout_id)
+            rollout.status = 'failed'
+            rollout.error = str(e)
+        rollout.finished_at = datetime.utcnow()
+        db.session.commit()
+        logger.info(f"Script tag rollout {rollout_id} of {script_url}: {rollout.status}, {rollout.created} created, "
+                    f"{rollout.updated} updated, {rollout.unchanged} unchanged, {rollout.failed} failed")
+        return rollout
+
+
+def rollout_status(rollout):
+    """Serialize a rollout for the API"""
+    return {
+        "rollout_id": rollout.id,
+        "script_url": rollout.script_url,
+        "managed_prefixes": json.loads(rollout.managed_prefixes or '[]'),
+        "dry_run": rollout.dry_run,
+        "status": rollout.status,
+        "total": rollout.total,
+        "done": rollout.created + rollout.updated + rollout.unchanged + rollout.failed,
+        "created": rollout.created,
+        "updated": rollout.updated,
+        "unchanged": rollout.unchanged,
+        "failed": rollout.failed,
+        "deleted": rollout.deleted,
+        "error": rollout.error,
+        "created_at": rollout.created_at.isoformat() if rollout.created_at else None,
+        "started_at": rollout.started_at.isoformat() if rollout.started_at else None,
+        "finished_at": rollout.finished_at.isoformat() if rollout.finished_at else None,
+    }
+
+
+def shop_result(row):
+    """Serialize a per-shop rollout result for the API"""
+    return {
+        "shop_url": row.shop_url,
+        "action": row.action,
+        "deleted": row.deleted,
+        "script_tag_id": row.script_tag_id,
+        "error": row.error,
+    }
+
+
+script_tag_rollout = ScriptTagRolloutRunner()
+
+
+@click.command('rollout-script-tag')
+@click.argument('script_url')
+@click.option('--replace', 'replace_prefixes', multiple=True,
+              help='src prefix of our old tags to repoint (repeatable; added to SCRIPT_TAG_MANAGED_PREFIXES).')
+@click.option('--dry-run', is_flag=True, help='Report what would change without writing to Shopify.')
+@with_appcontext
+def rollout_script_tag_command(script_url, replace_prefixes, dry_run):
+    """Make every active shop load SCRIPT_URL from exactly one script tag."""
+    runner = current_app.extensions['script_tag_rollout']
+    rollout = runner.create(script_url, replace_prefixes, dry_run)
+    click.echo(f"Rollout {rollout.id}: {rollout.total} shops" + (" (dry run)" if dry_run else ""))
+
+    def progress(rollout):
+        status = rollout_status(rollout)
+        click.echo(f"{status['done']}/{status['total']}: {status['created']} created, {status['updated']} updated, "
+                   f"{status['unchanged']} unchanged, {status['failed']} failed")
+
+    rollout = runner.run(rollout.id, progress=progress)
+    click.echo(f"Rollout {rollout.status}; {rollout.deleted} duplicate or old tags removed"
+               + (f" ({rollout.error})" if rollout.error else ""))
+    for row in db.session.scalars(db.select(ScriptTagRolloutShop).where(
+            ScriptTagRolloutShop.rollout_id == rollout.id, ScriptTagRolloutShop.action == 'failed').limit(20)):
+        click.echo(f"  {row.shop_url}: {row.error}")
+    if rollout.status == 'failed' or rollout.failed:
+        raise SystemExit(1)
@@ -0,0 +1,374 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+
+from models.model import db, SeoJob, SeoSchema
+from utils.gemini_cache import description_hash
+from utils.catalog_sync import catalog_products, count_catalog
+from utils.script_cache import script_cache
+from utils.shops import shop_id_for
+
+logger = logging.getLogger(__name__)
+
+MAX_RECORDED_ERRORS = 50
+
+
+class SeoJobRunner:
+    """
+    Runs catalog-wide SEO generation jobs in the background.
+
+    Each job is coordinated by one thread that streams the products, packs
+    them into multi-product prompts, hands those Gemini calls to a shared
+    worker pool and writes finished JSON-LD rows to
+    SeoSchema in bulk. The number of calls in flight for any one Gemini API
+    key is capped, so several jobs sharing a key cannot exceed its quota.
+
+    Jobs only live in this process's executors, so every process refreshes
+    heartbeat_at on the jobs it holds every `heartbeat_interval` seconds. A
+    queued or running job whose heartbeat is older than `stale_after` lost
+    its process (a restart or crash); the first process to notice claims it
+    and runs it again from its stored parameters, up to `max_attempts`
+    times, after which it is marked failed.
+    """
+
+    def __init__(self, app=None, workers=8, per_key_concurrency=4, max_jobs=2, flush_every=50,
+                 heartbeat_interval=30.0, stale_after=300.0, max_attempts=3):
+        self.workers = workers
+        self.per_key_concurrency = per_key_concurrency
+        self.max_jobs = max_jobs
+        self.flush_every = flush_every
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._app = None
+        self._pool = None
+        self._jobs = None
+        self._key_slots = {}
+        self._active = set()
+        self._monitor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.recovered = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.workers = int(app.config.get('SEO_WORKERS', self.workers))
+        self.per_key_concurrency = int(app.config.get('SEO_PER_KEY_CONCURRENCY', self.per_key_concurrency))
+        self.max_jobs = int(app.config.get('SEO_MAX_JOBS', self.max_jobs))
+        self.flush_every = int(app.config.get('SEO_FLUSH_EVERY', self.flush_every))
+        self.heartbeat_interval = float(app.config.get('SEO_JOB_HEARTBEAT', self.heartbeat_interval))
+        self.stale_after = float(app.config.get('SEO_JOB_STALE_AFTER', self.stale_after))
+        self.max_attempts = int(app.config.get('SEO_JOB_MAX_ATTEMPTS', self.max_attempts))
+        app.extensions['seo_jobs'] = self
+        if app.config.get('SEO_JOB_RECOVERY', True):
+            # Every serving process watches for orphaned jobs, whether or not it ever submits one
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        # Started lazily, and again after fork: executors and threads do not survive into the child
+        if self._monitor is not None and self._pid == os.getpid() and self._monitor.is_alive():
+            return
+        with self._lock:
+            if self._monitor is not None and self._pid == os.getpid() and self._monitor.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._pool = self._jobs = None
+                self._key_slots = {}
+                self._active = set()
+                self.queued = 0
+            self._pid = os.getpid()
+            self._monitor = threading.Thread(target=self._watch, name='seo-job-monitor', daemon=True)
+            self._monitor.start()
+
+    def _executors(self):
+        self._ensure_started()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='seo-worker')
+                self._jobs = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix='seo-job')
+            return self._pool, self._jobs
+
+    def _slots_for(self, api_key):
+        with self._lock:
+            if api_key not in self._key_slots:
+                self._key_slots[api_key] = threading.BoundedSemaphore(self.per_key_concurrency)
+            return self._key_slots[api_key]
+
+    def create(self, shop_url, product_ids=None, products=None):
+        """
+        Add a queued job row to the session without committing or starting it
+
+        Lets callers commit the job together with their own changes; pass
+        the committed job to start().
+
+        Args:
+            shop_url (str): The shop whose products should be processed
+            product_ids (list, optional): Only process these products (default: whole catalog)
+            products (list, optional): Product dicts with 'id' and 'description' to process
+                                       as given, without fetching them from Shopify
+
+        Returns:
+            SeoJob: The new job
+        """
+        known = products or product_ids
+        params = {"products": products} if products else {"product_ids": product_ids} if product_ids else None
+        now = datetime.utcnow()
+        job = SeoJob(id=uuid.uuid4().hex, shop_url=shop_url, status='queued',
+                     total=len(known) if known else 0, params=json.dumps(params) if params else None,
+                     attempts=0, heartbeat_at=now, created_at=now)
+        db.session.add(job)
+        return job
+
+    def start(self, job, api_key):
+        """Queue a committed job for background processing"""
+        params = json.loads(job.params) if job.params else {}
+        _, jobs = self._executors()
+        with self._lock:
+            self.queued += 1
+            self._active.add(job.id)
+        jobs.submit(self._run_job, job.id, job.shop_url, api_key, params.get('product_ids'), params.get('products'))
+
+    def submit(self, shop_url, api_key, product_ids=None, products=None):
+        """
+        Create a job row and queue it for background processing (see create)
+
+        Returns:
+            SeoJob: The queued job
+        """
+        job = self.create(shop_url, product_ids, products)
+        db.session.commit()
+        self.start(job, api_key)
+        return job
+
+    def _run_job(self, job_id, shop_url, api_key, product_ids, products):
+        with self._lock:
+            self.queued -= 1
+        with self._app.app_context():
+            try:
+                self._process(job_id, shop_url, api_key, product_ids, products)
+            except Exception as e:
+                logger.error(f"SEO job {job_id} failed: {str(e)}")
+                db.session.rollback()
+                job = db.session.get(SeoJob, job_id)
+                job.status = 'failed'
+                job.errors = json.dumps(self._append_error(job.errors, None, str(e)))
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+            finally:
+                with self._lock:
+                    self._active.discard(job_id)
+                db.session.remove()
+
+    def _watch(self):
+        while True:
+            with self._app.app_context():
+                try:
+                    self.heartbeat()
+                    self.recover()
+                except Exception as e:
+                    logger.error(f"Error checking SEO jobs: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            time.sleep(self.heartbeat_interval)
+
+    def heartbeat(self):
+        """Mark the jobs this process holds as alive"""
+        with self._lock:
+            active = list(self._active)
+        if active:
+            db.session.execute(db.update(SeoJob)
+                               .where(SeoJob.id.in_(active), SeoJob.status.in_(('queued', 'running')))
+                               .values(heartbeat_at=datetime.utcnow()))
+            db.session.commit()
+
+    def recover(self):
+        """
+        Resume (or fail) jobs whose process stopped sending heartbeats
+
+        Returns:
+            int: Jobs claimed by this process
+        """
+        # Import here: settings_cache is only needed to find the shop's key for a resumed job
+        from utils.settings_cache import settings_cache
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        stale = SeoJob.status.in_(('queued', 'running')) & (SeoJob.heartbeat_at < cutoff)
+        claimed = 0
+        for job_id in db.session.scalars(db.select(SeoJob.id).where(stale).limit(100)).all():
+            # Conditional update, so only one process takes each job
+            if db.session.execute(db.update(SeoJob).where(SeoJob.id == job_id, stale)
+                                  .values(status='queued', heartbeat_at=datetime.utcnow())).rowcount != 1:
+                db.session.commit()
+                continue
+            db.session.commit()
+            claimed += 1
+
+            job = db.session.get(SeoJob, job_id)
+            api_key = settings_cache.get(job.shop_url).gemini_api_key
+            if job.attempts >= self.max_attempts or not api_key:
+                reason = (f"Interrupted {job.attempts} times" if api_key
+                          else "Interrupted, and the Gemini API key is no longer set")
+                logger.error(f"SEO job {job_id} for {job.shop_url} abandoned: {reason}")
+                job.status = 'failed'
+                job.errors = json.dumps(self._append_error(job.errors, None, reason))
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+                continue
+            logger.warning(f"Resuming SEO job {job_id} for {job.shop_url} after its process stopped")
+            self.recovered += 1
+            self.start(job, api_key)
+        return claimed
+
+    @staticmethod
+    def _append_error(errors_json, product_id, message):
+        errors = json.loads(errors_json) if errors_json else []
+        if len(errors) < MAX_RECORDED_ERRORS:
+            errors.append({"product_id": product_id, "error": message})
+        return errors
+
+    def _generate(self, api_key, batch):
+        # Import here so workers that never call Gemini skip loading the client
+        from utils.gemini_service import generate_faq_schemas
+        # Generation cache lookups need the database, so workers run inside an app context
+        with self._app.app_context():
+            return generate_faq_schemas(api_key, batch)
+
+    def _process(self, job_id, shop_url, api_key, product_ids, products):
+        from utils.gemini_service import batch_products
+        pool, _ = self._executors()
+        slots = self._slots_for(api_key)
+
+        job = db.session.get(SeoJob, job_id)
+        job.status = 'running'
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+        shop_id = shop_id_for(shop_url)
+
+        counts = {"total": 0, "succeeded": 0, "failed": 0, "skipped": 0}
+        errors = []
+        rows = []
+        inflight = {}
+        unflushed = [0]
+
+        def fail(product_id, message):
+            counts["failed"] += 1
+            if len(errors) < MAX_RECORDED_ERRORS:
+                errors.append({"product_id": product_id, "error": message})
+
+        def collect(done):
+            for future in done:
+                hashes = inflight.pop(future)
+                unflushed[0] += len(hashes)
+                try:
+                    results, failures = future.result()
+                except Exception as e:
+                    for product_id in hashes:
+                        fail(product_id, str(e))
+                    continue
+                for product_id, message in failures.items():
+                    fail(product_id, message)
+                now = datetime.utcnow()
+                for product_id, json_ld in results.items():
+                    rows.append({
+                        "product_id": product_id,
+                        "shop_url": shop_url,
+                        "shop_id": shop_id,
+                        "generated_json_ld": json_ld,
+                        "source_hash": hashes[product_id],
+                        "created_at": now,
+                        "updated_at": now
+                    })
+                    counts["succeeded"] += 1
+
+        def flush(final=False):
+            unflushed[0] = 0
+            if rows:
+                db.session.execute(db.insert(SeoSchema), rows)
+            job = db.session.get(SeoJob, job_id)
+            job.total = max(job.total, counts["total"])
+            job.succeeded = counts["succeeded"]
+            job.failed = counts["failed"]
+            job.skipped = counts["skipped"]
+            job.errors = json.dumps(errors) if errors else None
+            job.heartbeat_at = datetime.utcnow()
+            if final:
+                job.status = 'completed'
+                job.finished_at = datetime.utcnow()
+            db.session.commit()
+            for row in rows:
+                script_cache.publish(shop_url, row["product_id"], row["generated_json_ld"], prerender=False)
+            rows.clear()
+
+        if products is None:
+            if not product_ids:
+                job = db.session.get(SeoJob, job_id)
+                job.total = count_catalog(shop_url)
+                db.session.commit()
+            products = catalog_products(shop_url, fields=('id', 'body_html'), ids=product_ids)
+
+        def describable():
+            for product in products:
+                counts["total"] += 1
+                if not product.get('description'):
+                    counts["skipped"] += 1
+                    continue
+                yield str(product['id']), product['description']
+
+        # Several products share one Gemini call, up to the prompt token budget
+        for batch in batch_products(describable()):
+            # Blocks while this API key already has its maximum number of calls in flight
+            slots.acquire()
+            future = pool.submit(self._generate, api_key, batch)
+            future.add_done_callback(lambda _: slots.release())
+            inflight[future] = {product_id: description_hash(description) for product_id, description in batch}
+
+            collect([f for f in inflight if f.done()])
+            if unflushed[0] >= self.flush_every:
+                flush()
+
+        while inflight:
+            done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+            collect(done)
+            if unflushed[0] >= self.flush_every:
+                flush()
+
+        flush(final=True)
+
+
+def job_status(job):
+    """Serialize a job with its progress and throughput"""
+    processed = job.succeeded + job.failed + job.skipped
+    end = job.finished_at or datetime.utcnow()
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else 0
+    return {
+        "job_id": job.id,
+        "shop_url": job.shop_url,
+        "status": job.status,
+        "attempts": job.attempts,
+        "total": job.total,
+        "processed": processed,
+        "succeeded": job.succeeded,
+        "failed": job.failed,
+        "skipped": job.skipped,
+        "progress": round(processed / job.total, 4) if job.total else None,
+        "elapsed_seconds": round(elapsed, 2),
+        "products_per_second": round(processed / elapsed, 2) if elapsed > 0 else None,
+        "errors": json.loads(job.errors) if job.errors else [],
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+seo_jobs = SeoJobRunner()
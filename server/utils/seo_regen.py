@@ -0,0 +1,248 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from models.model import db, SeoSchema, SeoRegenRequest
+from utils.gemini_cache import description_hash
+from utils.seo_jobs import seo_jobs
+from utils.settings_cache import settings_cache
+
+logger = logging.getLogger(__name__)
+
+
+def stored_source_hash(shop_url, product_id):
+    """Hash of the description behind the product's latest stored schema, if any"""
+    row = (db.session.query(SeoSchema.source_hash)
+           .filter(SeoSchema.shop_url == shop_url, SeoSchema.product_id == str(product_id))
+           .order_by(SeoSchema.updated_at.desc())
+           .first())
+    return row.source_hash if row else None
+
+
+def _upsert_request(row):
+    """Insert a pending regeneration, replacing the one already waiting for the same product"""
+    table = SeoRegenRequest.__table__
+    dialect = db.session.get_bind().dialect.name
+    updated = ('description', 'source_hash', 'due_at')
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(row)
+        stmt = stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in updated})
+    else:
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['shop_url', 'product_id'],
+            set_={name: stmt.excluded[name] for name in updated}
+        )
+
+    db.session.execute(stmt)
+
+
+class RegenerationQueue:
+    """
+    Debounced queue of products whose SEO schema needs regenerating.
+
+    Webhook handlers call schedule() for every product change, which writes
+    a SeoRegenRequest row in the handler's transaction: the work is durable
+    before the webhook is marked done. Repeated changes to the same product
+    within `debounce` seconds update that one row with the latest
+    description and push its due time back. A dispatcher thread in every
+    serving process polls for due rows, claims each by deleting it (only if
+    it is unchanged since it was read, so a newer change is never lost),
+    checks it against the stored schema's hash again and hands the rest to
+    the SEO job runner, one job per shop, in the same transaction.
+    """
+
+    def __init__(self, app=None, debounce=10.0, poll_interval=2.0, batch_size=500):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._app = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self.scheduled = 0
+        self.collapsed = 0
+        self.unchanged = 0
+        self.enqueued = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.debounce = float(app.config.get('SEO_REGEN_DEBOUNCE', self.debounce))
+        self.poll_interval = float(app.config.get('SEO_REGEN_POLL_INTERVAL', self.poll_interval))
+        app.extensions['seo_regen'] = self
+        # Every serving process dispatches, so rows written by a `flask drain-webhooks` process are picked up
+        app.before_request(self._ensure_started)
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        # Started lazily (and restarted after fork) so each pre-forked worker gets its own dispatcher
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='seo-regen', daemon=True)
+            self._thread.start()
+
+    def schedule(self, shop_url, product_id, description):
+        """
+        Queue a product for regeneration if its description changed
+
+        The row is written in the caller's transaction; it is dispatched
+        once the caller commits and the debounce window has passed.
+
+        Returns:
+            bool: True if the product was queued, False if its schema is already current
+        """
+        source_hash = description_hash(description)
+        if stored_source_hash(shop_url, product_id) == source_hash:
+            # Changed back to what the schema was built from: a row queued for the interim description is stale
+            self.cancel(shop_url, product_id)
+            self.unchanged += 1
+            return False
+
+        self._ensure_started()
+        waiting = db.session.scalar(
+            db.select(SeoRegenRequest.id)
+            .where(SeoRegenRequest.shop_url == shop_url, SeoRegenRequest.product_id == str(product_id))
+        )
+        if waiting is not None:
+            self.collapsed += 1
+        _upsert_request({
+            "shop_url": shop_url,
+            "product_id": str(product_id),
+            "description": description,
+            "source_hash": source_hash,
+            "due_at": datetime.utcnow() + timedelta(seconds=self.debounce),
+            "created_at": datetime.utcnow(),
+        })
+        self.scheduled += 1
+        return True
+
+    def cancel(self, shop_url, product_id):
+        """Drop a product's waiting regeneration (in the caller's transaction); True if one was waiting"""
+        return db.session.execute(db.delete(SeoRegenRequest).where(
+            SeoRegenRequest.shop_url == shop_url, SeoRegenRequest.product_id == str(product_id))).rowcount > 0
+
+    def depth(self):
+        """Products waiting, due or not, across all processes"""
+        return db.session.scalar(db.select(db.func.count(SeoRegenRequest.id)))
+
+    def _claim_due(self):
+        """Delete up to batch_size due rows that nobody changed or claimed since they were read"""
+        due = db.session.execute(
+            db.select(SeoRegenRequest.id, SeoRegenRequest.shop_url, SeoRegenRequest.product_id,
+                      SeoRegenRequest.description, SeoRegenRequest.source_hash, SeoRegenRequest.due_at)
+            .where(SeoRegenRequest.due_at <= datetime.utcnow())
+            .order_by(SeoRegenRequest.due_at)
+            .limit(self.batch_size)
+        ).all()
+        claimed = []
+        for row in due:
+            if db.session.execute(
+                db.delete(SeoRegenRequest)
+                .where(SeoRegenRequest.id == row.id, SeoRegenRequest.due_at == row.due_at,
+                       SeoRegenRequest.source_hash == row.source_hash)
+            ).rowcount == 1:
+                claimed.append(row)
+        return claimed
+
+    def dispatch_due(self):
+        """
+        Hand every due row to the job runner
+
+        Returns:
+            int: Rows claimed by this call
+        """
+        claimed = self._claim_due()
+        by_shop = {}
+        for row in claimed:
+            # Another worker may have regenerated it while it was waiting
+            if stored_source_hash(row.shop_url, row.product_id) == row.source_hash:
+                self.unchanged += 1
+                continue
+            by_shop.setdefault(row.shop_url, []).append({"id": row.product_id, "description": row.description})
+
+        jobs = []
+        for shop_url, products in by_shop.items():
+            api_key = settings_cache.get(shop_url).gemini_api_key
+            if not api_key:
+                logger.warning(f"Skipping SEO regeneration for {shop_url}: Gemini API key not set")
+                continue
+            jobs.append((seo_jobs.create(shop_url, products=products), api_key, len(products)))
+        # The claimed rows disappear together with the jobs replacing them
+        db.session.commit()
+
+        for job, api_key, count in jobs:
+            self.enqueued += count
+            try:
+                seo_jobs.start(job, api_key)
+            except RuntimeError:
+                # Interpreter shutdown: the job row is saved and another process resumes it
+                logger.warning(f"SEO regeneration job {job.id} for {job.shop_url} left for another process")
+        return len(claimed)
+
+    def _dispatch_in_context(self):
+        with self._app.app_context():
+            try:
+                return self.dispatch_due()
+            except Exception as e:
+                logger.error(f"Error dispatching SEO regeneration: {str(e)}")
+                db.session.rollback()
+                return 0
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while not self._stopping:
+            if self._dispatch_in_context() < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def flush(self):
+        """Dispatch every due row now instead of at the next poll"""
+        total = 0
+        while True:
+            claimed = self._dispatch_in_context()
+            total += claimed
+            if claimed < self.batch_size:
+                return total
+
+    def shutdown(self, timeout=10.0):
+        """Stop the dispatcher, handing over what is already due; rows still debouncing stay for other processes"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+        flushed = self.flush()
+        if flushed:
+            logger.info(f"Dispatched {flushed} due SEO regenerations at shutdown")
+
+    def stats(self):
+        return {
+            "pending": self.depth(),
+            "scheduled": self.scheduled,
+            "collapsed": self.collapsed,
+            "unchanged": self.unchanged,
+            "enqueued": self.enqueued,
+        }
+
+
+seo_regen = RegenerationQueue()
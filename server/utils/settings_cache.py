@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models.model import db, AppSettings, AppSettingsVersion
+from utils.shops import shop_id_for
+
+# Plain values rather than ORM objects so entries can be shared across threads and requests
+ShopSettings = namedtuple('ShopSettings', ['shop_id', 'gemini_api_key', 'auto_generate_seo',
+                                           'auto_generate_llms', 'version'])
+
+DEFAULT_SETTINGS = ShopSettings(None, None, False, False, 0)
+
+
+def _snapshot(row):
+    return ShopSettings(
+        shop_id=row.shop_id,
+        gemini_api_key=row.gemini_api_key,
+        auto_generate_seo=bool(row.auto_generate_seo),
+        auto_generate_llms=bool(row.auto_generate_llms),
+        version=row.version or 0,
+    )
+
+
+def _next_version():
+    """
+    Increment the settings version counter in the current transaction
+
+    The UPDATE locks the counter row until the caller commits, so concurrent
+    writers are serialized and never share a version.
+
+    Returns:
+        int: The new version
+    """
+    counter = AppSettingsVersion.__table__
+    bumped = db.session.execute(
+        counter.update().where(counter.c.id == 1).values(version=counter.c.version + 1)
+    ).rowcount
+    if not bumped:
+        # Tables created without the migration's seed row; a concurrent insert fails the save, which retries
+        db.session.execute(counter.insert().values(id=1, version=1))
+    return db.session.execute(db.select(counter.c.version).where(counter.c.id == 1)).scalar()
+
+
+class SettingsCache:
+    """
+    In-process cache of per-shop AppSettings.
+
+    A shop without its own row falls back to the global row (shop_id NULL),
+    so single-tenant installs keep working. Entries expire after `ttl`
+    seconds. Every write increments the single-row AppSettingsVersion
+    counter; at most once every `poll_interval` seconds a read compares it
+    with the last version seen and drops every entry when it moved,
+    so a write in one worker process reaches the others within that interval
+    while reads in between cost no database access at all.
+    """
+
+    def __init__(self, app=None, ttl=300, poll_interval=1.0):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self._polled_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = float(app.config.get('SETTINGS_CACHE_TTL', self.ttl))
+        self.poll_interval = float(app.config.get('SETTINGS_VERSION_POLL', self.poll_interval))
+        app.extensions['settings_cache'] = self
+
+    def _poll_version(self):
+        now = time.monotonic()
+        if now - self._polled_at < self.poll_interval:
+            return
+        self._polled_at = now
+        version = db.session.execute(
+            db.select(AppSettingsVersion.version).where(AppSettingsVersion.id == 1)).scalar() or 0
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = version
+
+    def get(self, shop_url=None):
+        """
+        Return the effective settings for a shop
+
+        Args:
+            shop_url (str, optional): The shop; None reads the global defaults
+
+        Returns:
+            ShopSettings: The shop's own settings, else the global row, else DEFAULT_SETTINGS
+        """
+        self._poll_version()
+        shop_id = shop_id_for(shop_url) if shop_url else None
+
+        with self._lock:
+            entry = self._entries.get(shop_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        settings = self._load(shop_id)
+        with self._lock:
+            self._entries[shop_id] = (settings, time.monotonic())
+        return settings
+
+    def _load(self, shop_id):
+        scope = AppSettings.shop_id.is_(None)
+        if shop_id is not None:
+            scope = db.or_(AppSettings.shop_id == shop_id, scope)
+        # The shop's own row sorts before the global one
+        row = AppSettings.query.filter(scope).order_by(AppSettings.shop_id.is_(None), AppSettings.id).first()
+        if row is None:
+            return DEFAULT_SETTINGS._replace(shop_id=shop_id)
+        return _snapshot(row)._replace(shop_id=shop_id)
+
+    def save(self, shop_id, **values):
+        """
+        Create or update a shop's settings row (None for the global row) and commit
+
+        The version counter is incremented so other processes drop their
+        cached settings on their next poll; this process drops them now. If
+        another process creates the shop's row first, the save is retried
+        as an update of that row.
+
+        Returns:
+            ShopSettings: The saved settings
+        """
+        for attempt in range(2):
+            if shop_id is None:
+                row = AppSettings.query.filter(AppSettings.shop_id.is_(None)).order_by(AppSettings.id).first()
+            else:
+                row = AppSettings.query.filter_by(shop_id=shop_id).first()
+            if row is None:
+                row = AppSettings(shop_id=shop_id, created_at=datetime.utcnow())
+                db.session.add(row)
+
+            for name, value in values.items():
+                setattr(row, name, value)
+            row.updated_at = datetime.utcnow()
+            try:
+                # Settings row first, counter last: the counter's row lock is held only until the commit
+                db.session.flush()
+                row.version = _next_version()
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt:
+                    raise
+
+        self.invalidate()
+        return _snapshot(row)
+
+    def invalidate(self):
+        """Drop every cached entry and force the next read to poll the version"""
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+        self._polled_at = 0.0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+
+settings_cache = SettingsCache()
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+
+from models.model import db, ShopifyStore
+
+
+def shop_domain(shop_url):
+    """Normalize a shop URL to its bare myshopify.com domain"""
+    if not shop_url:
+        return None
+    return shop_url.replace('https://', '').replace('http://', '').strip().rstrip('/').lower() or None
+
+
+class ShopIdCache:
+    """
+    TTL-bounded map of shop domain -> ShopifyStore.id.
+
+    Writers of SEO, llms.txt and analytics rows stamp each row with its
+    shop_id; this keeps that from costing a store lookup per row. Unknown
+    shops are cached as None too, so traffic for a shop that has not
+    installed the app does not query the store table on every flush.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, shop_url):
+        domain = shop_domain(shop_url)
+        if not domain:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(domain)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            return entry[0]
+
+        # Older rows may have been saved with the https:// prefix
+        shop_id = db.session.execute(
+            db.select(ShopifyStore.id).where(ShopifyStore.shop_url.in_([domain, f"https://{domain}"]))
+        ).scalar()
+        with self._lock:
+            self._entries[domain] = (shop_id, time.monotonic())
+        return shop_id
+
+    def invalidate(self, shop_url):
+        domain = shop_domain(shop_url)
+        with self._lock:
+            self._entries.pop(domain, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_shop_ids = ShopIdCache(ttl=float(os.getenv('SHOP_ID_CACHE_TTL', '300')))
+
+
+def shop_id_for(shop_url):
+    """Return the ShopifyStore id for a shop URL, or None if the shop is not installed"""
+    return _shop_ids.get(shop_url)
+
+
+def invalidate_shop_id(shop_url):
+    _shop_ids.invalidate(shop_url)
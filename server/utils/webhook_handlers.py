@@ -0,0 +1,64 @@
+"""
+What each webhook topic does once its event is drained from the queue.
+
+Handlers receive the shop domain (X-Shopify-Shop-Domain) and the decoded
+payload. They may run more than once for the same delivery (a drainer can
+die after the work but before marking the event done), so each must be
+idempotent. Raising marks the attempt failed and schedules a retry.
+"""
+import logging
+
+from models.model import db, ShopifyStore
+from utils.catalog_sync import apply_product_webhook, remove_product_webhook
+from utils.seo_regen import seo_regen
+from utils.settings_cache import settings_cache
+from utils.shopify_api import invalidate_shop_session
+
+logger = logging.getLogger(__name__)
+
+
+def app_uninstalled(shop_url, payload):
+    """Mark the store inactive and forget its token"""
+    shop = payload.get('myshopify_domain') or shop_url
+    if not shop:
+        logger.warning("app/uninstalled webhook without a shop domain")
+        return
+
+    store = ShopifyStore.query.filter_by(shop_url=shop).first()
+    if store:
+        store.is_active = False
+        store.access_token = None  # Clear the token for security
+        db.session.commit()
+    invalidate_shop_session(shop)
+
+
+def product_changed(shop_url, payload):
+    """Update the product mirror and queue SEO regeneration if the description changed"""
+    product_id = payload.get('id')
+    if not shop_url or not product_id:
+        logger.warning("Product webhook without a shop domain or product id")
+        return
+
+    apply_product_webhook(shop_url, payload)
+
+    if settings_cache.get(shop_url).auto_generate_seo and payload.get('body_html'):
+        seo_regen.schedule(shop_url, product_id, payload['body_html'])
+
+
+def product_deleted(shop_url, payload):
+    """Remove the product from the mirror and drop its waiting SEO regeneration"""
+    product_id = payload.get('id')
+    if not shop_url or not product_id:
+        logger.warning("Product delete webhook without a shop domain or product id")
+        return
+
+    seo_regen.cancel(shop_url, product_id)
+    remove_product_webhook(shop_url, payload)
+
+
+HANDLERS = {
+    'app/uninstalled': app_uninstalled,
+    'products/create': product_changed,
+    'products/update': product_changed,
+    'products/delete': product_deleted,
+}
@@ -0,0 +1,294 @@
+"""
+Durable queue for Shopify webhooks.
+
+Webhook routes only verify the HMAC, insert the payload into WebhookEvent
+keyed by X-Shopify-Webhook-Id and answer 200, so Shopify never times out
+waiting for the work. A retried delivery we already stored hits the unique
+key and is acknowledged without a second row.
+
+Drainers (a thread in each web worker with WEBHOOK_DRAIN_MODE=thread, or
+`flask drain-webhooks` processes) claim due events with a conditional
+UPDATE, so any number of them can share the table, and run the topic's
+handler from utils/webhook_handlers.py. Failed events are retried with
+exponential backoff; after WEBHOOK_MAX_ATTEMPTS they are left 'dead' until
+requeued with `flask drain-webhooks --requeue-dead`.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+
+from models.model import db, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+# Seconds between deletions of done events older than WEBHOOK_RETENTION_DAYS (the dedupe window)
+PRUNE_INTERVAL = 3600
+
+
+class WebhookDeadLetter(Exception):
+    """Raised for an event that must not be retried (no handler, or abandoned too often)"""
+
+
+class WebhookQueue:
+    """
+    Stores incoming webhooks and drains them in the background.
+
+    See the module docstring for the delivery guarantees.
+    """
+
+    def __init__(self, app=None, drain_mode='thread', batch_size=50, poll_interval=2.0, max_attempts=8,
+                 retry_base=10.0, retry_max=3600.0, lease_seconds=300, retention_days=7):
+        self.drain_mode = drain_mode
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease_seconds = lease_seconds
+        self.retention_days = retention_days
+
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._last_prune = 0.0
+
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.retried = 0
+        self.dead = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.drain_mode = app.config.get('WEBHOOK_DRAIN_MODE', self.drain_mode)
+        self.batch_size = int(app.config.get('WEBHOOK_BATCH', self.batch_size))
+        self.poll_interval = float(app.config.get('WEBHOOK_POLL_INTERVAL', self.poll_interval))
+        self.max_attempts = int(app.config.get('WEBHOOK_MAX_ATTEMPTS', self.max_attempts))
+        self.retry_base = float(app.config.get('WEBHOOK_RETRY_BASE', self.retry_base))
+        self.retry_max = float(app.config.get('WEBHOOK_RETRY_MAX', self.retry_max))
+        self.lease_seconds = int(app.config.get('WEBHOOK_LEASE_SECONDS', self.lease_seconds))
+        self.retention_days = int(app.config.get('WEBHOOK_RETENTION_DAYS', self.retention_days))
+        app.extensions['webhook_queue'] = self
+        if self.drain_mode == 'thread':
+            # Events left pending or leased by a previous process are drained without waiting for a new webhook
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        # Started lazily (and restarted after fork) so each pre-forked worker gets its own drainer
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.run, name='webhook-drainer', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, topic, shop_url, webhook_id, body):
+        """
+        Store a verified webhook for processing
+
+        Args:
+            topic (str): Webhook topic, e.g. 'products/update'
+            shop_url (str): X-Shopify-Shop-Domain
+            webhook_id (str): X-Shopify-Webhook-Id; derived from the body when missing
+            body (bytes): The raw request body
+
+        Returns:
+            bool: True if the event was stored, False if it was a duplicate delivery
+        """
+        if not webhook_id:
+            webhook_id = hashlib.sha256(f"{topic}\n{shop_url}\n".encode('utf-8') + body).hexdigest()[:64]
+        now = datetime.utcnow()
+        db.session.add(WebhookEvent(webhook_id=webhook_id, topic=topic, shop_url=shop_url,
+                                    payload=body.decode('utf-8'), status='pending', attempts=0,
+                                    received_at=now, next_attempt_at=now))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            self.duplicates += 1
+            return False
+
+        self.received += 1
+        if self.drain_mode == 'thread':
+            self._ensure_started()
+            self._wakeup.set()
+        return True
+
+    def _due(self, now):
+        return db.or_(
+            db.and_(WebhookEvent.status == 'pending', WebhookEvent.next_attempt_at <= now),
+            db.and_(WebhookEvent.status == 'processing', WebhookEvent.locked_until < now),
+        )
+
+    def _claim(self, event_id, now):
+        """Take an event for this drainer; False if another drainer got it first"""
+        claimed = db.session.execute(
+            db.update(WebhookEvent)
+            .where(WebhookEvent.id == event_id, self._due(now))
+            .values(status='processing', attempts=WebhookEvent.attempts + 1,
+                    locked_until=now + timedelta(seconds=self.lease_seconds))
+        ).rowcount == 1
+        db.session.commit()
+        return claimed
+
+    def retry_delay(self, attempts):
+        """Seconds before retrying an event that has failed `attempts` times"""
+        return min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+
+    def _process(self, event_id):
+        # Import here: handlers pull in the SEO and catalog machinery
+        from utils.webhook_handlers import HANDLERS
+
+        event = db.session.get(WebhookEvent, event_id)
+        handler = HANDLERS.get(event.topic)
+        try:
+            if handler is None:
+                raise WebhookDeadLetter(f"No handler for webhook topic {event.topic}")
+            if event.attempts > self.max_attempts:
+                # Only reachable when earlier attempts died with their drainer (leases expired)
+                raise WebhookDeadLetter(f"Abandoned by {event.attempts - 1} drainers")
+            handler(event.shop_url, json.loads(event.payload))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            event = db.session.get(WebhookEvent, event_id)
+            event.last_error = f"{type(e).__name__}: {str(e)}"[:2000]
+            event.locked_until = None
+            if isinstance(e, WebhookDeadLetter) or event.attempts >= self.max_attempts:
+                event.status = 'dead'
+                self.dead += 1
+                logger.error(f"Webhook {event.webhook_id} ({event.topic}) dead after "
+                             f"{event.attempts} attempts: {event.last_error}")
+            else:
+                event.status = 'pending'
+                event.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.retry_delay(event.attempts))
+                self.retried += 1
+                logger.warning(f"Webhook {event.webhook_id} ({event.topic}) failed, attempt "
+                               f"{event.attempts}: {event.last_error}")
+            db.session.commit()
+            return
+
+        event = db.session.get(WebhookEvent, event_id)
+        event.status = 'done'
+        event.last_error = None
+        event.locked_until = None
+        event.processed_at = datetime.utcnow()
+        db.session.commit()
+        self.processed += 1
+
+    def drain_once(self):
+        """
+        Process up to batch_size due events
+
+        Returns:
+            int: Events this call claimed
+        """
+        now = datetime.utcnow()
+        candidates = db.session.scalars(
+            db.select(WebhookEvent.id).where(self._due(now))
+            .order_by(WebhookEvent.next_attempt_at, WebhookEvent.id)
+            .limit(self.batch_size)
+        ).all()
+        claimed = 0
+        for event_id in candidates:
+            if self._claim(event_id, now):
+                claimed += 1
+                self._process(event_id)
+        return claimed
+
+    def prune(self):
+        """Delete done events past the retention window"""
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        deleted = db.session.execute(
+            db.delete(WebhookEvent).where(WebhookEvent.status == 'done', WebhookEvent.processed_at < cutoff)
+        ).rowcount
+        db.session.commit()
+        self._last_prune = time.monotonic()
+        return deleted
+
+    def requeue_dead(self):
+        """Give every dead event a fresh set of attempts"""
+        requeued = db.session.execute(
+            db.update(WebhookEvent).where(WebhookEvent.status == 'dead')
+            .values(status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        return requeued
+
+    def run(self, stop=None):
+        """Drain until `stop` is set (or forever), waiting poll_interval when nothing is due"""
+        while stop is None or not stop.is_set():
+            with self._app.app_context():
+                try:
+                    claimed = self.drain_once()
+                    if time.monotonic() - self._last_prune >= PRUNE_INTERVAL:
+                        self.prune()
+                except Exception as e:
+                    logger.error(f"Error draining webhooks: {str(e)}")
+                    db.session.rollback()
+                    claimed = 0
+                finally:
+                    db.session.remove()
+            if claimed < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def stats(self):
+        counts = dict(db.session.execute(
+            db.select(WebhookEvent.status, db.func.count(WebhookEvent.id)).group_by(WebhookEvent.status)
+        ).all())
+        return {
+            "drain_mode": self.drain_mode,
+            "pending": counts.get('pending', 0),
+            "processing": counts.get('processing', 0),
+            "done": counts.get('done', 0),
+            "dead": counts.get('dead', 0),
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "processed": self.processed,
+            "retried": self.retried,
+            "dead_lettered": self.dead,
+        }
+
+
+webhook_queue = WebhookQueue()
+
+
+@click.command('drain-webhooks')
+@click.option('--once', is_flag=True, help='Exit once nothing is due instead of polling forever.')
+@click.option('--requeue-dead', is_flag=True, help='Retry dead events from scratch before draining.')
+@with_appcontext
+def drain_webhooks_command(once, requeue_dead):
+    """Process queued Shopify webhooks (run alongside WEBHOOK_DRAIN_MODE=external)."""
+    queue = current_app.extensions['webhook_queue']
+    if requeue_dead:
+        click.echo(f"Requeued {queue.requeue_dead()} dead webhooks")
+    if not once:
+        queue.run()
+        return
+    before = (queue.processed, queue.retried, queue.dead)
+    total = 0
+    while True:
+        claimed = queue.drain_once()
+        total += claimed
+        if claimed < queue.batch_size:
+            break
+    done, retried, dead = (after - start for after, start in zip((queue.processed, queue.retried, queue.dead), before))
+    click.echo(f"Processed {total} webhooks: {done} done, {retried} to retry, {dead} dead; "
+               f"pruned {queue.prune()} old events")